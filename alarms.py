@@ -0,0 +1,183 @@
+# alarm scheduler, any number of alarms kept in a heap by when they next go off.
+# times are whole seconds since 2000-01-01 (the RTC's epoch), so a tick only has to
+# compare the current time against the head of the heap.
+import heapq
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+try:
+    from micropython import const
+except ImportError: # plain python, for the bench harness
+    const = lambda x: x
+
+DAY_S = const(86400)
+EVERY_DAY = const(0x7F)  # weekday mask, bit 0 is monday
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+def day_number(year, month, day): # days since 2000-01-01, plain arithmetic so it doesn't care about time zones or the port's mktime
+    if month < 3:
+        year -= 1
+        month += 12
+    return 365 * year + year // 4 - year // 100 + year // 400 + (153 * (month - 3) + 2) // 5 + day - 730426
+
+def weekday(day): # 0 = monday, 2000-01-01 was a saturday
+    return (day + 5) % 7
+
+class Alarm:
+    def __init__(self, id, hour, minute, days=EVERY_DAY, once=False, frequency=None, volume=None, enabled=True):
+        self.id = id
+        self.hour = hour
+        self.minute = minute
+        self.days = days # weekdays it goes off on
+        self.once = once # disables itself after going off
+        self.frequency = frequency # station to wake up to, None leaves the radio where it is
+        self.volume = volume
+        self.enabled = enabled
+        self.snooze = False # transient snooze entry, never saved
+        self.at = None # when it next goes off, None while it isn't scheduled
+
+    # first time after t that this alarm matches, None if the weekday mask is empty
+    def next_after(self, t):
+        day = t // DAY_S
+        offset = self.hour * 3600 + self.minute * 60
+        for d in range(day, day + 8):
+            at = d * DAY_S + offset
+            if at > t and self.days >> weekday(d) & 1:
+                return at
+        return None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "hour": self.hour,
+            "minute": self.minute,
+            "days": self.days,
+            "once": self.once,
+            "freq": self.frequency,
+            "vol": self.volume,
+            "enabled": self.enabled,
+            "at": self.at,
+        }
+
+class AlarmScheduler:
+    def __init__(self, now=0):
+        self.alarms = [] # every alarm, in the order they were added
+        self.heap = [] # (at, id, alarm) for everything scheduled, soonest first
+        self.snoozed = None # the snooze entry while one is pending
+        self.next_id = 0
+        self.now = now # alarms are scheduled after this, the clock moves it on every tick
+        self.version = 0 # bumped when the list changes, the web page refetches /alarms on it
+
+    def push(self, alarm, after):
+        alarm.at = alarm.next_after(after) if alarm.enabled else None
+        if alarm.at is not None:
+            heapq.heappush(self.heap, (alarm.at, alarm.id, alarm))
+
+    def rebuild(self, now=None): # after the clock was set or an alarm edited, O(n) but that's rare
+        if now is not None:
+            self.now = now
+        heap = []
+        for alarm in self.alarms:
+            alarm.at = alarm.next_after(self.now) if alarm.enabled else None
+            if alarm.at is not None:
+                heap.append((alarm.at, alarm.id, alarm))
+        snoozed = self.snoozed
+        if snoozed is not None:
+            heap.append((snoozed.at, snoozed.id, snoozed))
+        heapq.heapify(heap)
+        self.heap = heap
+        self.version += 1
+
+    def add(self, hour, minute, days=None, once=False, frequency=None, volume=None, enabled=True): # days None is every day
+        days = EVERY_DAY if days is None else days & EVERY_DAY
+        alarm = Alarm(self.next_id, hour % 24, minute % 60, days, once, frequency, volume, enabled)
+        self.next_id += 1
+        self.alarms.append(alarm)
+        self.push(alarm, self.now)
+        self.version += 1
+        return alarm
+
+    def get(self, id):
+        for alarm in self.alarms:
+            if alarm.id == id:
+                return alarm
+        return None
+
+    def first(self): # the alarm the front panel edits, made on demand so there always is one
+        if not self.alarms:
+            self.add(7, 0, enabled=False) # bright and early, but off
+        return self.alarms[0]
+
+    def remove(self, id):
+        alarm = self.get(id)
+        if alarm is None:
+            return False
+        self.alarms.remove(alarm)
+        self.rebuild()
+        return True
+
+    def changed(self, alarm): # call after editing an alarm in place
+        self.rebuild()
+
+    def next_at(self): # when the head goes off, None if nothing is scheduled
+        heap = self.heap
+        return heap[0][0] if heap else None
+
+    # pop everything that is due at now, returning the first of them (None if nothing was).
+    # recurring alarms go back in for their next match after now, so a long gap doesn't replay the missed ones.
+    def due(self, now):
+        self.now = now
+        heap = self.heap
+        fired = None
+        while heap and heap[0][0] <= now:
+            alarm = heapq.heappop(heap)[2]
+            if fired is None:
+                fired = alarm
+            if alarm.snooze:
+                self.snoozed = None
+            elif alarm.once:
+                alarm.enabled = False
+                alarm.at = None
+            else:
+                self.push(alarm, now)
+        if fired is not None:
+            self.version += 1
+        return fired
+
+    # snooze is its own one-shot entry, the alarm it came from keeps its schedule
+    def snooze(self, alarm, at):
+        self.cancel_snooze()
+        entry = Alarm(-1, at % DAY_S // 3600, at % DAY_S // 60 % 60, 0, True, alarm.frequency, alarm.volume)
+        entry.snooze = True
+        entry.at = at
+        self.snoozed = entry
+        heapq.heappush(self.heap, (at, -1, entry))
+
+    def cancel_snooze(self):
+        if self.snoozed is not None:
+            self.snoozed = None
+            self.heap = [entry for entry in self.heap if not entry[2].snooze]
+            heapq.heapify(self.heap)
+
+    def to_list(self):
+        return [alarm.to_dict() for alarm in self.alarms]
+
+    def save(self, path):
+        with open(path, "w") as f:
+            ujson.dump([[a.hour, a.minute, a.days, a.once, a.frequency, a.volume, a.enabled] for a in self.alarms], f)
+
+    def load(self, path): # False if there is no usable file, the alarms stay as they were
+        try:
+            with open(path) as f:
+                saved = ujson.load(f)
+        except (OSError, ValueError):
+            return False
+        self.alarms = []
+        for entry in saved:
+            hour, minute, days, once, frequency, volume, enabled = entry
+            alarm = Alarm(self.next_id, hour, minute, days, once, frequency, volume, enabled)
+            self.next_id += 1
+            self.alarms.append(alarm)
+        self.rebuild()
+        return True
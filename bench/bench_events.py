@@ -0,0 +1,65 @@
+# burst test for the IRQ -> main loop event queue, runs under plain python:
+#   python bench/bench_events.py [bursts] [burst size]
+# a producer thread stands in for the button/timer IRQs and puts bursts of events
+# (a bouncy button, a held key, a timer firing during a redraw). the consumer polls the
+# queue like webapp.tick_task does and spends a frame's worth of time per redraw.
+# reports the put -> take latency and how many events were dropped for a few queue sizes.
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import eventq
+
+POLL_MS = 10  # webapp.EVENT_POLL_MS
+REDRAW_MS = 12  # roughly one full SPI frame and the text drawing on the pico
+BURST_GAP_MS = 40  # between bursts
+
+
+def producer(queue, bursts, burst_size, done):
+    codes = (eventq.EV_UP, eventq.EV_DOWN, eventq.EV_TICK, eventq.EV_SET)
+    try:
+        for b in range(bursts):
+            for i in range(burst_size):
+                queue.put(codes[i % len(codes)])
+            time.sleep(BURST_GAP_MS / 1000)
+    finally:
+        done.set() # don't leave the consumer spinning if this fails
+
+
+def consumer(queue, done):
+    while not done.is_set() or len(queue):
+        redraw = False
+        while True:
+            code = queue.take()
+            if not code:
+                break
+            redraw = True
+        if redraw:
+            time.sleep(REDRAW_MS / 1000) # one redraw for everything that was queued
+        time.sleep(POLL_MS / 1000)
+
+
+def run(size, bursts, burst_size):
+    queue = eventq.EventQueue(size)
+    done = threading.Event()
+    thread = threading.Thread(target=producer, args=(queue, bursts, burst_size, done))
+    thread.start()
+    consumer(queue, done)
+    thread.join()
+    return queue.stats()
+
+
+def main():
+    bursts = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    burst_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print("{} bursts of {} events".format(bursts, burst_size))
+    for size in (8, 16, 32, 64):
+        stats = run(size, bursts, burst_size)
+        print("queue {:3d}: {:5d} taken {:5d} dropped, latency avg {:6d} us max {:6d} us".format(
+            size, stats["taken"], stats["dropped"], stats["latency_avg_us"], stats["latency_max_us"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# RDS decode throughput, feeds Radio.update_rds the group streams in bench/rds/:
+#   python bench/bench_rds.py [passes]
+# a stream is one group per line, blocks A B C D in hex, "----" for a block that came in with
+# uncorrectable errors. "# expect key='value'" lines give what the decoder should end up with,
+# they are checked before timing. each group goes in as the 12 byte STATUS..RDSD snapshot
+# read_status() would leave, so only the decoder is timed, not the bus.
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import sim
+
+board = sim.install()
+
+from machine import I2C
+import rda5807
+
+STREAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rds")
+STATUS = 0x8000 | 0x4000 | 0x1000 # RDSR, STC, RDSS
+RSSI = 40 << 9 | 0x0100 # a decent signal, FM_TRUE
+
+
+def load_stream(path): # -> ({key: expected}, [snapshot bytes])
+    expect = {}
+    snapshots = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                if line.startswith("# expect "):
+                    for item in line[len("# expect "):].split("' "):
+                        key, _, value = item.partition("=")
+                        expect[key] = value.strip("'")
+                continue
+            blocks = line.split()
+            rssi = RSSI
+            words = []
+            for i in range(4):
+                if blocks[i] == "----":
+                    if i < 2: # the chip only reports BLER for blocks A and B
+                        rssi |= 0x3 << (2 - 2 * i)
+                    words.append(0)
+                else:
+                    words.append(int(blocks[i], 16))
+            snapshot = bytearray()
+            for word in [STATUS, rssi] + words:
+                snapshot.append(word >> 8)
+                snapshot.append(word & 0xff)
+            snapshots.append(bytes(snapshot))
+    return expect, snapshots
+
+
+def load_streams():
+    streams = {}
+    for name in sorted(os.listdir(STREAMS)):
+        if name.endswith(".hex"):
+            streams[name[:-4]] = load_stream(os.path.join(STREAMS, name))
+    return streams
+
+
+def make_radio():
+    return rda5807.Radio(I2C(1))
+
+
+def decode(radio, snapshots):
+    status_buf = radio.status_buf
+    update_rds = radio.update_rds
+    for snapshot in snapshots:
+        status_buf[:] = snapshot
+        update_rds(cached=True)
+
+
+def decoded(radio): # what the decoder ended up with, in the same terms as the expect lines
+    result = {
+        "ps": bytes(radio.station_name).decode().strip(),
+        "rt": bytes(radio.radio_text).decode().strip(),
+        "ptyn": bytes(radio.program_type_name).decode().strip(),
+    }
+    if radio.clock_valid:
+        result["time"] = "{:02d}:{:02d}".format(radio.hours, radio.minutes)
+        result["date"] = "{:04d}-{:02d}-{:02d}".format(*radio.rds_date())
+    return result
+
+
+def check(streams):
+    ok = True
+    for name, (expect, snapshots) in streams.items():
+        radio = make_radio()
+        decode(radio, snapshots)
+        got = decoded(radio)
+        for key in expect:
+            if got.get(key) != expect[key]:
+                print("{}: {} is {!r}, expected {!r}".format(name, key, got.get(key), expect[key]))
+                ok = False
+    return ok
+
+
+def run(streams, passes):
+    radio = make_radio()
+    groups = 0
+    start = time.perf_counter()
+    for i in range(passes):
+        for expect, snapshots in streams.values():
+            radio.clear_rds_data() # a retune between stations, like a scan does
+            decode(radio, snapshots)
+            groups += len(snapshots)
+    elapsed = time.perf_counter() - start
+    return groups, elapsed
+
+
+def main():
+    passes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    streams = load_streams()
+    if not check(streams):
+        sys.exit(1)
+    groups, elapsed = run(streams, passes)
+    print("{} groups from {} streams decoded, {:.0f} groups/s, {:.2f} us/group".format(
+        groups, len(streams), groups / elapsed, elapsed * 1000000 / groups))
+    board.halt()
+
+
+if __name__ == "__main__":
+    main()
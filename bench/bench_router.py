@@ -0,0 +1,76 @@
+# micro-benchmark for webapp request dispatch, runs under plain python against a fake socket:
+#   python bench/bench_router.py [requests]
+# every request goes through serve_client (request line + header parsing, routing,
+# query parsing, response writing) on one keep-alive connection.
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import webapp
+import alarms
+
+REQUESTS = (
+    b"GET /set_mode?mode=TIME HTTP/1.1\r\nHost: alarm\r\nUser-Agent: bench\r\n\r\n",
+    b"GET /set_alarm?h=7&m=30&format=24&mode=alarm HTTP/1.1\r\nHost: alarm\r\n\r\n",
+    b"GET /toggle_format HTTP/1.1\r\nHost: alarm\r\n\r\n",
+    b"GET /alarm_enabled HTTP/1.1\r\nHost: alarm\r\n\r\n",
+)
+
+
+class FakeWriter: # stands in for the socket side of an asyncio stream, counts what was sent
+    def __init__(self):
+        self.sent = 0
+
+    def write(self, data):
+        self.sent += len(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+class FakeClock: # just the attributes the benchmarked routes touch
+    format_24h = True
+    mode = "TIME"
+    radio = None
+
+    def __init__(self):
+        self.alarms = alarms.AlarmScheduler()
+
+    def update_radio(self, mute=None, freq=None, vol=None):
+        pass
+
+    def set_mode(self, mode):
+        self.mode = mode
+
+    def save_alarms(self):
+        pass
+
+
+def run(count):
+    reader = asyncio.StreamReader()
+    for i in range(count):
+        reader.feed_data(REQUESTS[i % len(REQUESTS)])
+    reader.feed_eof()
+    writer = FakeWriter()
+    start = time.perf_counter()
+    asyncio.run(webapp.serve_client(reader, writer, FakeClock()))
+    elapsed = time.perf_counter() - start
+    return count / elapsed, writer.sent
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rate, sent = run(count)
+    print("{} requests dispatched, {:.0f} req/s, {} bytes of responses".format(count, rate, sent))
+
+
+if __name__ == "__main__":
+    main()
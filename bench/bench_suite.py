@@ -0,0 +1,496 @@
+# benchmark suite, runs the firmware under plain python on the simulated board (sim/):
+#   python bench/bench_suite.py                          run everything, print a table
+#   python bench/bench_suite.py -o results.json          and save the results
+#   python bench/bench_suite.py -c baseline.json -t 0.15 compare, exit 1 if anything got >15% slower
+#   python bench/bench_suite.py -k tick -k show          only benchmarks whose name contains one of these
+# benchmarks that push frames also report what the last one cost on the bus.
+# each benchmark is timed over REPEATS runs of at least MIN_RUN_S, the best run counts. the checks
+# run first, if any of them fails nothing is timed and it exits 1.
+# numbers are CPython numbers, only compare results from the same machine and python. framebuf is
+# the simulator's pure python one, so drawing costs far more than the C version on the pico does.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import sim
+from sim import devices as sim_devices
+
+board = sim.install()
+os.chdir(tempfile.mkdtemp(prefix="bench-fs-")) # alarms.json and stations.bin land here, not in the repo
+
+from machine import I2C, SPI, Pin
+import rda5807
+import urtc
+import webapp
+import bench_rds
+from bench_router import FakeWriter # one fake socket for both webapp benchmarks
+from clock import RTC_SYNC_S, multifunction_clock
+from ssd1306 import SSD1306_I2C, SSD1306_SPI
+
+REPEATS = 5
+MIN_RUN_S = 0.1
+THRESHOLD = 0.10 # default slowdown that counts as a regression
+
+
+class NullSPI: # the oled bus, swallows frames so the numbers are the driver's work, not the simulator's
+    def __init__(self):
+        self.bytes = 0
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def write(self, buf):
+        self.bytes += len(buf)
+
+
+class NullI2C: # the oled on I2C instead, counts what the driver sends
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def writeto(self, addr, buf):
+        self.transactions += 1
+        self.bytes += len(buf)
+
+    def writevto(self, addr, bufs):
+        self.transactions += 1
+        for buf in bufs:
+            self.bytes += len(buf)
+
+
+class RecordingI2C(NullI2C): # keeps every transaction and feeds it to a simulated panel, which decodes the control bytes
+    def __init__(self):
+        super().__init__()
+        self.panel = sim_devices.SSD1306()
+        self.recorded = []
+
+    def writeto(self, addr, buf):
+        self.record(bytes(buf))
+
+    def writevto(self, addr, bufs):
+        self.record(b"".join(bytes(buf) for buf in bufs))
+
+    def record(self, data):
+        self.transactions += 1
+        self.bytes += len(data)
+        self.recorded.append(data)
+        self.panel.i2c_write(0x3C, data)
+
+
+def make_display():
+    return SSD1306_SPI(128, 64, NullSPI(), Pin(20), Pin(21), Pin(17), True)
+
+
+def make_i2c_display(): # the SSD1306_I2C variant of the same panel
+    return SSD1306_I2C(128, 64, NullI2C())
+
+
+def make_clock():
+    clock = multifunction_clock(make_display(), I2C(1), I2C(0), tick_timer=False)
+    clock.tick_update_disp()
+    return clock
+
+
+# benchmarks: name -> setup() returning (function to time, operations per call), and optionally a
+# function returning more figures for the results, called once after timing
+benchmarks = {}
+
+def bench(name):
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+
+def tick_bench(mode, full):
+    def setup():
+        clock = make_clock()
+        clock.mode = mode
+        clock.tick_update_disp()
+        def run():
+            if full: # as if the screen was just switched to
+                clock.shown_screen = None
+            clock.tick_update_disp()
+        return run, 1
+    return setup
+
+for mode in ("TIME", "ALARM", "RADIO"):
+    bench("tick." + mode)(tick_bench(mode, False)) # steady state, at most the seconds changed
+    bench("tick_full." + mode)(tick_bench(mode, True))
+
+
+def frame_stats(display, bus, run): # driver's frame_bytes and what went over the bus for one more frame
+    def stats():
+        before = bus.bytes
+        run()
+        return {"frame_bytes": display.frame_bytes, "bus_bytes": bus.bytes - before}
+    return stats
+
+
+def show_bench(make, kind):
+    def setup():
+        display = make()
+        bus = display.spi if isinstance(display, SSD1306_SPI) else display.i2c
+        if kind == "unchanged":
+            display.show()
+            def run():
+                display.show()
+        elif kind == "full":
+            display.text("benchmark", 0, 0)
+            def run():
+                display.show(full=True)
+        else:
+            display.text("benchmark", 0, 0)
+            display.show()
+            state = [0]
+            def run(): # one 8x8 cell changes between frames, like a seconds digit
+                state[0] ^= 1
+                display.fill_rect(56, 24, 8, 8, state[0])
+                display.show()
+        return run, 1, frame_stats(display, bus, run)
+    return setup
+
+for kind in ("full", "partial", "unchanged"):
+    bench("show." + kind)(show_bench(make_display, kind))
+    bench("show.i2c." + kind)(show_bench(make_i2c_display, kind))
+
+
+def format_bench(format_24h):
+    def setup():
+        clock = make_clock()
+        clock.format_24h = format_24h
+        format_time = clock.format_time
+        def run():
+            for hour in range(24):
+                format_time(hour, 30, 15)
+                format_time(hour, 30)
+        return run, 48
+    return setup
+
+bench("format_time.24h")(format_bench(True))
+bench("format_time.12h")(format_bench(False))
+
+
+@bench("update_rds")
+def setup_update_rds(): # the group streams from bench/rds/, see bench_rds.py
+    radio = bench_rds.make_radio()
+    streams = list(bench_rds.load_streams().values())
+    groups = 0
+    for expect, snapshots in streams:
+        groups += len(snapshots)
+    def run():
+        for expect, snapshots in streams:
+            radio.clear_rds_data()
+            bench_rds.decode(radio, snapshots)
+    return run, groups
+
+
+@bench("urtc.bcd")
+def setup_bcd():
+    bcd2bin = urtc._bcd2bin
+    bin2bcd = urtc._bin2bcd
+    def run():
+        for value in range(100):
+            bcd2bin(bin2bcd(value))
+    return run, 100
+
+
+@bench("urtc.datetime_read")
+def setup_datetime_read():
+    rtc = urtc.DS3231(I2C(0))
+    def run():
+        rtc.datetime()
+    return run, 1
+
+
+@bench("urtc.datetime_write")
+def setup_datetime_write():
+    rtc = urtc.DS3231(I2C(0))
+    now = tuple(rtc.datetime())
+    def run():
+        rtc.datetime(now)
+    return run, 1
+
+
+def request_bench(request, count=200):
+    # request is the raw request bytes, or a function making them once the assets are indexed
+    def setup():
+        webapp.load_assets(os.path.join(ROOT, "web"), compress=False)
+        clock = make_clock()
+        data = request() if callable(request) else request
+        async def session(): # count requests on one keep-alive connection
+            reader = asyncio.StreamReader()
+            for i in range(count):
+                reader.feed_data(data)
+            reader.feed_eof()
+            await webapp.serve_client(reader, FakeWriter(), clock)
+        def run():
+            asyncio.run(session())
+        return run, count
+    return setup
+
+def conditional_request():
+    etag = webapp.assets["/main.js"].etag
+    return "GET /main.js HTTP/1.1\r\nHost: alarm\r\nIf-None-Match: {}\r\n\r\n".format(etag).encode()
+
+bench("webapp.static")(request_bench(b"GET / HTTP/1.1\r\nHost: alarm\r\n\r\n"))
+bench("webapp.static_304")(request_bench(conditional_request))
+bench("webapp.get_settings")(request_bench(b"GET /get_settings HTTP/1.1\r\nHost: alarm\r\n\r\n"))
+
+
+# correctness checks, name -> function that asserts. -k picks them like the benchmarks
+checks = {}
+
+def check(name):
+    def register(function):
+        checks[name] = function
+        return function
+    return register
+
+
+@check("alarm.enable_after_time")
+def check_enable_after_time(): # an alarm switched on after its time went by today goes off tomorrow, not now
+    clock = make_clock()
+    clock.set_time(6, 0)
+    alarm = clock.alarms.first()
+    alarm.hour, alarm.minute, alarm.enabled = 7, 0, False
+    clock.alarms.changed(alarm)
+    year, month, day, weekday = clock.now[:4]
+    clock.rtc.datetime((year, month, day, weekday, 12, 0, 0, 0)) # the RTC runs on to noon by itself
+    clock.sync_time()
+    clock.tick_update_disp()
+    tomorrow = (clock.now_epoch // 86400 + 1) * 86400
+    webapp.handle_request("/alarm_enabled", {}, clock)
+    assert alarm.at == tomorrow + 7 * 3600, "enabled alarm is at {}, expected tomorrow 07:00".format(alarm.at)
+    added = clock.alarms.add(7, 30)
+    assert added.at == tomorrow + 7 * 3600 + 30 * 60, "added alarm is at {}, expected tomorrow 07:30".format(added.at)
+    clock.alarms.remove(added.id)
+    assert alarm.at == tomorrow + 7 * 3600, "remove moved the alarm to {}".format(alarm.at)
+    clock.tick_update_disp()
+    assert not clock.alarm_triggered, "alarm went off straight away"
+    alarm.enabled = False
+    clock.save_alarms()
+
+
+class SteppedTime: # stands in for the simulator's clock (and so ticks_ms), moved on by hand
+    def __init__(self):
+        self.t = sim_devices.now()
+        self.real = sim_devices.now
+        sim_devices.now = self.now
+
+    def now(self):
+        return self.t
+
+    def restore(self):
+        sim_devices.now = self.real
+
+
+JITTER_MS = (0, 30, -20, 45, 5, -35, 15, 40, -10, 25, -40) # how far off its beat each tick runs
+
+
+@check("time.interpolation")
+def check_interpolation(): # the time carried forward between RTC reads matches the RTC every tick, over several syncs
+    clock = make_clock()
+    rtc = clock.rtc
+    stepped = SteppedTime()
+    try:
+        chip = board.rtc # its seconds turn over on whole seconds after base_at
+        start = chip.base_at + int(stepped.t - chip.base_at) + 1
+        wrong = []
+        # RTC square wave ticks, each handled a little after its edge. then software ticks on a few beats
+        for sqw, beat in ((True, 0.0), (False, 0.1), (False, 0.5), (False, 0.9)):
+            clock.sqw_pin = Pin(6) if sqw else None # edges are handed in below, not by the board
+            clock.now_synced = False
+            for i in range(3 * RTC_SYNC_S + 5):
+                jitter = JITTER_MS[i % len(JITTER_MS)] / 1000
+                stepped.t = start + i + beat
+                if sqw:
+                    stepped.t += 0.002
+                    clock.sqw_handler(None)
+                    stepped.t += abs(jitter) # the tick runs after the edge, never before
+                else:
+                    stepped.t += jitter
+                    clock.timer_tick()
+                clock.process_events()
+                expected = tuple(rtc.datetime()[4:7])
+                if tuple(clock.now[4:7]) != expected:
+                    wrong.append("{} tick {}: {} for {}".format("sqw" if sqw else "beat {}".format(beat), i, tuple(clock.now[4:7]), expected))
+            start += 3 * RTC_SYNC_S + 5
+        assert not wrong, "{} ticks off the RTC, first {}".format(len(wrong), wrong[0])
+    finally:
+        stepped.restore()
+        clock.sqw_pin = None
+
+
+@check("show.dirty_span")
+def check_dirty_span(): # one changed 8x8 cell goes out as 8 columns on one page, and the panel ends up right
+    display = SSD1306_SPI(128, 64, SPI(0), Pin(20), Pin(21), Pin(17), True) # the simulated panel this time
+    bus = board.spi(0)
+    display.text("benchmark", 0, 0)
+    for name, change, expected in (
+            ("full", lambda: display.show(full=True), 8 * (3 + 128)),
+            ("unchanged", display.show, 0),
+            ("one cell", lambda: (display.fill_rect(56, 24, 8, 8, 1), display.show()), 3 + 8)):
+        before = bus.bytes
+        change()
+        assert display.frame_bytes == expected, "{} frame_bytes is {}, expected {}".format(name, display.frame_bytes, expected)
+        assert bus.bytes - before == expected, "{} frame put {} bytes on the bus, expected {}".format(name, bus.bytes - before, expected)
+    assert board.oled.framebuffer() == bytes(display.buffer), "panel RAM differs from the frame buffer"
+
+
+@check("show.i2c_span")
+def check_i2c_span(): # each dirty page is one transaction: 0x80 cmd 0x80 cmd 0x80 cmd 0x40 data...
+    i2c = RecordingI2C()
+    display = SSD1306_I2C(128, 64, i2c)
+    panel = i2c.panel
+    display.text("benchmark", 0, 0)
+    for name, change, pages, columns in (
+            ("full", lambda: display.show(full=True), 8, 128),
+            ("unchanged", display.show, 0, 0),
+            ("one cell", lambda: (display.fill_rect(56, 24, 8, 8, 1), display.show()), 1, 8)):
+        del i2c.recorded[:]
+        change()
+        assert len(i2c.recorded) == pages, "{} frame took {} transactions, expected {}".format(name, len(i2c.recorded), pages)
+        for data in i2c.recorded:
+            assert data[0:7:2] == b"\x80\x80\x80\x40" and len(data) == 7 + columns, \
+                "{} frame sent {}..., {} bytes".format(name, data[:8].hex(), len(data))
+        assert display.frame_bytes == pages * (3 + columns), "{} frame_bytes is {}".format(name, display.frame_bytes)
+    assert (panel.page, panel.column) == (3, 56 + 8 + 2), "one cell span left the panel at page {} column {}".format(panel.page, panel.column)
+    assert panel.framebuffer() == bytes(display.buffer), "panel RAM differs from the frame buffer"
+
+
+@check("rds.station_table")
+def check_station_table(): # stations.bin round trips, a cut short file is refused, a garbled name reads as ""
+    table = rda5807.StationTable(capacity=4)
+    table.add(0x123, 40, True)
+    table.add(0x045, 25, False)
+    table.name(0, "BENCH FM")
+    table.name(1, b"\xff\xfeRDS\x80")
+    assert table.name(1) == "", "garbled name read as {!r}".format(table.name(1))
+    table.save("stations_check.bin")
+    loaded = rda5807.StationTable(capacity=4)
+    assert loaded.load("stations_check.bin"), "saved table didn't load"
+    assert (loaded.count, list(loaded.channels[:2]), list(loaded.rssi[:2]), list(loaded.flags[:2]), loaded.name(0)) == \
+        (2, [0x123, 0x045], [40, 25], [table.FLG_STEREO, 0], "BENCH FM"), "loaded table differs from the saved one"
+    with open("stations_check.bin", "rb") as f:
+        data = f.read()
+    with open("stations_check.bin", "wb") as f:
+        f.write(data[:-5])
+    assert not loaded.load("stations_check.bin"), "file cut mid record loaded"
+    assert loaded.count == 2, "refused file still changed the table"
+
+
+def run_checks(filters):
+    failed = []
+    for name in checks:
+        if filters and not any(f in name for f in filters):
+            continue
+        try:
+            checks[name]()
+        except AssertionError as e:
+            print("check {} failed: {}".format(name, e))
+            failed.append(name)
+    return failed
+
+
+def measure(setup):
+    run, ops, *stats = setup()
+    run() # warm up
+    calls = 1
+    while True: # find a call count that takes MIN_RUN_S
+        start = time.perf_counter()
+        for i in range(calls):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_S:
+            break
+        calls *= 2
+    best = elapsed
+    for i in range(REPEATS - 1):
+        start = time.perf_counter()
+        for j in range(calls):
+            run()
+        best = min(best, time.perf_counter() - start)
+    us_per_op = best * 1000000 / (calls * ops)
+    result = {"us_per_op": round(us_per_op, 3), "ops_per_s": round(1000000 / us_per_op, 1)}
+    if stats:
+        result.update(stats[0]())
+    return result
+
+
+def run_all(filters):
+    results = {}
+    for name in benchmarks:
+        if filters and not any(f in name for f in filters):
+            continue
+        result = results[name] = measure(benchmarks[name])
+        extra = "".join("  {} {}".format(key, result[key]) for key in result if key not in ("us_per_op", "ops_per_s"))
+        print("{:<24} {:>12.2f} us/op {:>14.1f} op/s{}".format(name, result["us_per_op"], result["ops_per_s"], extra))
+    return results
+
+
+def compare(results, baseline, threshold, filters=()):
+    # slower by more than threshold (0.1 = 10%) is a regression, faster by as much is worth a mention
+    regressions = []
+    print()
+    print("{:<24} {:>12} {:>12} {:>8}".format("benchmark", "baseline us", "now us", "change"))
+    for name in results:
+        if name not in baseline:
+            print("{:<24} {:>12} {:>12.2f} {:>8}".format(name, "-", results[name]["us_per_op"], "new"))
+            continue
+        before = baseline[name]["us_per_op"]
+        after = results[name]["us_per_op"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print("{:<24} {:>12.2f} {:>12.2f} {:>+7.1f}%{}".format(name, before, after, change * 100, flag))
+    for name in baseline:
+        if name not in results and not filters: # with -k the rest weren't run, not gone
+            print("{:<24} {:>12.2f} {:>12} {:>8}".format(name, baseline[name]["us_per_op"], "-", "gone"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the firmware under CPython on the simulated board")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="baseline JSON file from an earlier --output")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD, help="slowdown that counts as a regression, 0.1 = 10%%")
+    parser.add_argument("-k", dest="filters", action="append", default=[], help="only benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    failed = run_checks(args.filters)
+    if failed:
+        board.halt()
+        sys.exit(1)
+    results = run_all(args.filters)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_implementation() + " " + platform.python_version(),
+                "machine": platform.machine(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold, args.filters)
+        if regressions:
+            print("\n{} regression(s) over {:.0f}%: {}".format(len(regressions), args.threshold * 100, ", ".join(regressions)))
+            sys.exit(1)
+    board.halt()
+
+
+if __name__ == "__main__":
+    main()
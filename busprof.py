@@ -0,0 +1,192 @@
+# bus profiler. wraps the I2C and SPI objects the drivers are handed, counts transactions and
+# bytes and estimates how long each one held the wire at the bus clock. costs are booked to the
+# function that asked for them: the first caller above the drivers' register helpers, so an RTC
+# read shows up as urtc.datetime and a radio read-modify-write as rda5807.update_reg, not as
+# _register or write_reg. that needs sys._getframe (CPython, the simulator, ports built with
+# MICROPY_PY_SYS_GETFRAME), without it everything is booked to the bus and method, "radio.writeto".
+#
+# end_tick() closes a window: the tick summary is everything since the previous end_tick(), so
+# button handling between ticks lands on the next tick.
+try:
+    from sys import _getframe
+except ImportError:
+    _getframe = None
+
+# register helpers that are never interesting on their own, look past them to their caller
+HELPERS = ("_register", "_flag", "read_reg", "write_reg", "cached_reg",
+           "write_cmd", "write_cmds", "write_data", "write_span", "claim_bus")
+
+# bits on an I2C wire: START and STOP take about a bit time each, every byte is 8 bits plus ACK
+I2C_START_STOP_BITS = 2
+I2C_BYTE_BITS = 9
+
+class BusProfiler:
+    def __init__(self, serial=False):
+        self.serial = serial # print the tick summary as each tick ends
+        self.tick = {} # key -> [transactions, bytes, wire us], since the last end_tick
+        self.total = {}
+        self.last = {} # the previous closed tick, what the web app shows
+        self.ticks = 0
+        self.names = {} # code object -> "module.function", formatted once
+
+    def i2c(self, i2c, name, freq=400000): # the I2C object handed to a driver, freq as the bus was set up
+        return ProfiledI2C(i2c, self, name, freq)
+
+    def spi(self, spi, name, baudrate=1000000): # baudrate is replaced by whatever the driver passes to init()
+        return ProfiledSPI(spi, self, name, baudrate)
+
+    def caller(self, fallback):
+        if _getframe is None:
+            return fallback
+        frame = _getframe(4) # caller -> record -> book -> the wrapped method -> whoever called it
+        while frame is not None and frame.f_code.co_name in HELPERS:
+            frame = frame.f_back
+        if frame is None:
+            return fallback
+        code = frame.f_code
+        name = self.names.get(code)
+        if name is None:
+            module = code.co_filename.replace("\\", "/").rsplit("/", 1)[-1]
+            if module.endswith(".py"):
+                module = module[:-3]
+            name = self.names[code] = module + "." + code.co_name
+        return name
+
+    def record(self, fallback, nbytes, wire_us):
+        key = self.caller(fallback)
+        for table in (self.tick, self.total):
+            entry = table.get(key)
+            if entry is None:
+                table[key] = [1, nbytes, wire_us]
+            else:
+                entry[0] += 1
+                entry[1] += nbytes
+                entry[2] += wire_us
+
+    def end_tick(self):
+        self.last = self.tick
+        self.tick = {}
+        self.ticks += 1
+        if self.serial:
+            print(self.format(self.last))
+
+    @staticmethod
+    def sums(table): # transactions, bytes, wire us over a whole table
+        txns = nbytes = wire_us = 0
+        for entry in table.values():
+            txns += entry[0]
+            nbytes += entry[1]
+            wire_us += entry[2]
+        return txns, nbytes, wire_us
+
+    def format(self, table): # one line, the costliest callers first
+        txns, nbytes, wire_us = self.sums(table)
+        parts = ["bus: {} txn {} B {:.1f} ms".format(txns, nbytes, wire_us / 1000)]
+        for key in sorted(table, key=lambda k: -table[k][2]):
+            entry = table[key]
+            parts.append("{} {}/{}B/{:.1f}ms".format(key, entry[0], entry[1], entry[2] / 1000))
+        return " | ".join(parts)
+
+    def summary(self): # for the web app
+        txns, nbytes, wire_us = self.sums(self.last)
+        total_txns, total_bytes, total_us = self.sums(self.total)
+        return {
+            "ticks": self.ticks,
+            "tick": {"txns": txns, "bytes": nbytes, "wire_us": round(wire_us), "by": self.last},
+            "total": {"txns": total_txns, "bytes": total_bytes, "wire_us": round(total_us), "by": self.total},
+        }
+
+    def reset(self):
+        self.tick = {}
+        self.total = {}
+        self.last = {}
+        self.ticks = 0
+
+class ProfiledI2C: # same methods as machine.I2C, each one booked as one transaction
+    def __init__(self, i2c, profiler, name, freq):
+        self.i2c = i2c
+        self.profiler = profiler
+        self.name = name
+        self.us_per_bit = 1000000 / freq
+        # fallback keys made up front, booking a transaction shouldn't allocate more than it has to
+        self.keys = {}
+        for method in ("writeto", "writevto", "readfrom", "readfrom_into", "writeto_mem", "readfrom_mem", "readfrom_mem_into"):
+            self.keys[method] = name + "." + method
+
+    def book(self, method, nbytes, extra_bytes, restarts=0):
+        # extra_bytes are the address (and register) bytes that aren't payload
+        bits = I2C_START_STOP_BITS + restarts + (nbytes + extra_bytes) * I2C_BYTE_BITS
+        self.profiler.record(self.keys[method], nbytes, bits * self.us_per_bit)
+
+    def writeto(self, addr, buf, stop=True):
+        self.book("writeto", len(buf), 1)
+        return self.i2c.writeto(addr, buf, stop)
+
+    def writevto(self, addr, vector, stop=True):
+        n = 0
+        for buf in vector:
+            n += len(buf)
+        self.book("writevto", n, 1)
+        return self.i2c.writevto(addr, vector, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        self.book("readfrom", nbytes, 1)
+        return self.i2c.readfrom(addr, nbytes, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self.book("readfrom_into", len(buf), 1)
+        return self.i2c.readfrom_into(addr, buf, stop)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self.book("writeto_mem", len(buf), 1 + addrsize // 8)
+        return self.i2c.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        # address + register, repeated START, address again, then the data
+        self.book("readfrom_mem", nbytes, 2 + addrsize // 8, 1)
+        return self.i2c.readfrom_mem(addr, memaddr, nbytes, addrsize=addrsize)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        self.book("readfrom_mem_into", len(buf), 2 + addrsize // 8, 1)
+        return self.i2c.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+
+    def __getattr__(self, attr): # scan(), init()... go straight through
+        return getattr(self.i2c, attr)
+
+class ProfiledSPI: # same methods as machine.SPI, tracks the baudrate drivers set with init()
+    def __init__(self, spi, profiler, name, baudrate):
+        self.spi = spi
+        self.profiler = profiler
+        self.name = name
+        self.us_per_bit = 1000000 / baudrate
+        self.keys = {}
+        for method in ("write", "read", "readinto", "write_readinto"):
+            self.keys[method] = name + "." + method
+
+    def init(self, *args, **kwargs):
+        baudrate = kwargs.get("baudrate")
+        if baudrate:
+            self.us_per_bit = 1000000 / baudrate
+        return self.spi.init(*args, **kwargs)
+
+    def book(self, method, nbytes):
+        self.profiler.record(self.keys[method], nbytes, nbytes * 8 * self.us_per_bit)
+
+    def write(self, buf):
+        self.book("write", len(buf))
+        return self.spi.write(buf)
+
+    def read(self, nbytes, write=0x00):
+        self.book("read", nbytes)
+        return self.spi.read(nbytes, write)
+
+    def readinto(self, buf, write=0x00):
+        self.book("readinto", len(buf))
+        return self.spi.readinto(buf, write)
+
+    def write_readinto(self, write_buf, read_buf):
+        self.book("write_readinto", len(write_buf))
+        return self.spi.write_readinto(write_buf, read_buf)
+
+    def __getattr__(self, attr):
+        return getattr(self.spi, attr)
@@ -1,5 +1,9 @@
 from machine import RTC, Timer, Pin
-import time, rda5807, urtc
+import time, rda5807, urtc, alarms, eventq, ui, font, tickmon
+try:
+    import ujson
+except ImportError:
+    import json as ujson
 
 NUM_BARS = const(4)  # Number of signal strength bars to display
 MAX_RSSI = const(70) # Maximum RSSI value for scaling bars
@@ -7,17 +11,43 @@ LINE_HEIGHT = const(9)  # Height of each line in pixels
 VOLUME_MAX = const(8)  # Maximum volume level for the radio
 CHAR_WIDTH = const(8)  # Width of each character in pixels
 CHARS_PER_LINE = const(16)  # Number of characters per line
+SCAN_POLL_MS = const(50)  # how often a running band scan is advanced
+SCAN_RDS_DWELL_MS = const(2000)  # listen this long on each station found for its RDS name, a full PS takes ~350 ms on a clean signal
+FRAME_MS = const(50)  # button redraws closer together than this are merged into one
+REPEAT_TIER_1 = const(8)  # repeats of a held button before it speeds up (x5 on minutes)
+REPEAT_TIER_2 = const(20)  # and again (x10 on minutes)
+SQW_TIMEOUT_MS = const(2500)  # no edge from the RTC square wave for this long, fall back to software ticks
+RTC_SYNC_S = const(10)  # re-read the RTC this often, in between the time is carried forward with ticks_ms
+TICK_SLACK_MS = const(250)  # a software tick this much early against the one the RTC was read on still counts its whole second
+STATIONS_FILE = "stations.bin" # station table from the last band scan
+ALARMS_FILE = "alarms.json" # alarms added from the front panel or the web page
+
+REPEAT_STEPS = (1, 5, 10) # minutes per repeat for each tier
+BUTTON_EVENTS = {eventq.EV_UP: "up", eventq.EV_DOWN: "down", eventq.EV_MODE: "mode", eventq.EV_SET: "set"}
 
 # menu bit masks (UP, DOWN, MODE, SET)
 MENU_UP   = 1 << 3
 MENU_DOWN = 1 << 2
 MENU_MODE = 1 << 1
 MENU_SET  = 1 << 0
+MENU_MASKS = (MENU_UP, MENU_DOWN, MENU_MODE, MENU_SET) # bit masks for buttons, indicates array positions of buttons
+MENU_POSITIONS = (12, 40, 76, 112) # x positions for buttons
+# menu labels, UP/DOWN only show in edit, set becomes snooze and mode becomes reset while the alarm goes off
+MENU_LABELS = ("    ", "    ", "MODE", "SET")
+MENU_LABELS_EDIT = ("UP", "DOWN", "NEXT", "DONE") # increase, decrease, next field, done editing
+MENU_LABELS_ALARM = ("    ", "    ", "RSET", "SNOZ") # only space for 4 characters
+MENU_LABELS_EDIT_ALARM = ("UP", "DOWN", "RSET", "SNOZ")
+TIME_EDIT_LABELS = ("SET: Hour", "SET: Minute", "SET: Format")
+ALARM_EDIT_LABELS = ("Set: Hour", "Set: Minute", "Set: On/Off")
+RADIO_EDIT_LABELS = ("SET: Frequency", "SET: Volume")
 
 class multifunction_clock:
     # init everything under the sun
-    def __init__(self, display, radio_i2c, rtc_i2c):
+    # tick_timer=False when something else (the web app loop) runs process_events
+    # rtc_sqw_pin is the Pin wired to the DS3231 INT/SQW output, its 1 Hz square wave then paces the ticks
+    def __init__(self, display, radio_i2c, rtc_i2c, tick_timer=True, rtc_sqw_pin=None, bus_profiler=None):
         self.display = display
+        self.bus_profiler = bus_profiler # busprof.BusProfiler the buses were wrapped with, closes a window each tick
         self.mode = "TIME" # start in time mode
         self.radio_frequency = 101.9 # default FM frequency
         self.radio_volume = 0 # default volume level
@@ -26,6 +56,8 @@ class multifunction_clock:
             self.radio.set_volume(self.radio_volume)
             self.radio.set_frequency_MHz(self.radio_frequency)
             self.radio.mute(True)
+            if self.radio.stations.load(STATIONS_FILE):
+                print(f"Loaded {self.radio.stations.count} stations")
         except Exception as e: # we couldnt communicate with the radio.
             print(f"Radio initialization failed: {e}")
             self.radio = None
@@ -44,25 +76,64 @@ class multifunction_clock:
 
         self.line_spacing = LINE_HEIGHT # Line spacing for text display (px)
         self.edit_field = 0 # which field we are editing, 0 = hour, 1 = minute, 2 = format
-        self.alarm_hour = 7 # default alarm hour. bright and early
-        self.alarm_minute = 0 # default alarm minute
         self.snooze_count = 0 # how many times the alarm has been snoozed, lazy person.
         self.editing = False # start in non edit mode
         self.alarm_triggered = False # start with alarm not triggered (duh)
         self.snooze_active = False # start with snooze not active (what would we be snoozing?)
-        self.alarm_enabled = False # start with alarm disabled (we dont want to wake up at 7am on a weekend)
         self.format_24h = True # default to 24-hour format, its better
         self.led_state = False
-        self.original_alarm_hour = self.alarm_hour # when unsnoozed, the alarm will return to this time
-        self.original_alarm_minute = self.alarm_minute # when unsnoozed, the alarm will return to this time
+        self.ringing = None # the alarm that went off, its snooze wakes up to the same station
         # LED and timers for alarm indication
         self.led = Pin("LED", Pin.OUT) # onboard LED for alarm indication
         self.blink_timer = Timer() # timer for blinking LED when alarm is triggered
+        self.scan_timer = Timer() # timer for stepping a band scan, only runs while scanning
         self.timer = Timer() # timer for updating display every second, tick tock
-        self.timer.init(period=1000, mode=Timer.PERIODIC, callback=self.tick_update_disp)
+        self.tick_timer = tick_timer
+        # IRQs and timers only queue events, process_events does the work outside interrupt context.
+        # with nothing polling the queue (tick_timer=True) it gets run through micropython.schedule
+        self.events = eventq.EventQueue(consumer=self.process_events if tick_timer else None)
+        self.redraw_pending = False # a button redraw held back to keep to one per FRAME_MS
+        self.tick_monitor = tickmon.TickMonitor(1000) # redraw durations and tick jitter, served at /metrics
+        self.last_redraw_ms = 0
+        # the DS3231 alarm 1 registers hold the alarm (or snooze) time, the chip latches A1F on the match
+        self.rtc_alarm = isinstance(self.rtc, urtc.DS3231)
+        self.rtc_alarm_at = None # alarm time currently programmed into the RTC
+        self.sqw_pin = None
+        self.sqw_last_ms = 0
+        self.sqw_edges = 0 # square wave edges seen, one per second on the RTC
+        if self.rtc_alarm and rtc_sqw_pin is not None:
+            try:
+                self.rtc.square_wave(1)
+                rtc_sqw_pin.init(Pin.IN, Pin.PULL_UP) # INT/SQW is open drain
+                rtc_sqw_pin.irq(trigger=Pin.IRQ_FALLING, handler=self.sqw_handler)
+                self.sqw_pin = rtc_sqw_pin
+                self.sqw_last_ms = time.ticks_ms()
+            except Exception as e:
+                print(f"RTC square wave setup failed: {e}")
+        if tick_timer:
+            self.timer.init(period=1000, mode=Timer.PERIODIC, callback=self.timer_tick)
         self.invert_flag = False  # track current inversion state
+        self.build_screens()
         self.last_button   = None  # track last pressed button
         self.buttons_enabled = 0     # which menu buttons are pushable
+        # the time for this tick, read once and shared by the alarm check, the screens and the web app
+        self.now = [0, 0, 0, 0, 0, 0, 0] # year, month, day, weekday, hour, minute, second
+        self.now_sync_ticks = 0 # ticks_ms when the RTC was last read, less TICK_SLACK_MS unless a new second started right then
+        self.now_sync_edges = -1 # sqw_edges when the RTC was last read, -1 if the square wave wasn't running
+        self.now_sync_seconds = 0 # second of the day the RTC reported then
+        self.now_synced = False
+        self.now_sync_day = 0 # day number (alarms.day_number) of the last RTC read
+        self.now_epoch = 0 # seconds since 2000-01-01, what the alarm heap is keyed on
+        self.sample_time()
+        # every alarm, soonest first. the first one is what the front panel edits
+        self.alarms = alarms.AlarmScheduler(self.now_epoch)
+        if not self.alarms.load(ALARMS_FILE):
+            self.alarms.first()
+        self.state = {} # what the web app was last told, see publish_state. replaced, never modified
+        self.state_changes = {} # keys that changed since the web app last took them
+        self.state_version = 0 # bumped whenever state changes
+        self.state_json = b"{}" # state serialised once per change, served to every client as is
+        self.publish_state()
 
     # helper function to format time strings
     def format_time(self, hour, minute, second=None):
@@ -76,14 +147,58 @@ class multifunction_clock:
             if second is not None:
                 return f"{display_hour:02d}:{minute:02d}:{second:02d} {am_pm}"
             return f"{display_hour:02d}:{minute:02d} {am_pm}"
+    # a time packed for the digit widgets, converted to 12 hour when that's the format
+    def pack_time(self, hour, minute, second=0):
+        if self.format_24h:
+            return font.pack_time(hour, minute, second)
+        return font.pack_time(hour % 12 or 12, minute, second, font.HALF_AM if hour < 12 else font.HALF_PM)
     # helper function to get current time as a string, for web app...
     def get_time(self):
-        years, months, days, weekdays, hours, minutes, seconds, subseconds = self.rtc.datetime()
-        return "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+        now = self.now
+        return "{:02d}:{:02d}:{:02d}".format(now[4], now[5], now[6])
+    # update self.now, only talking to the RTC every RTC_SYNC_S seconds or when the day rolls over
+    def sample_time(self):
+        if self.now_sync_edges >= 0 and self.sqw_active(): # every edge since the read is a second, however late its tick runs
+            elapsed = self.sqw_edges - self.now_sync_edges
+        else:
+            elapsed = time.ticks_diff(time.ticks_ms(), self.now_sync_ticks) // 1000
+        seconds = self.now_sync_seconds + elapsed
+        if not self.now_synced or elapsed >= RTC_SYNC_S or seconds >= 86400:
+            self.sync_time()
+            return
+        now = self.now
+        now[4] = seconds // 3600
+        now[5] = seconds // 60 % 60
+        now[6] = seconds % 60
+        self.now_epoch = self.now_sync_day * 86400 + seconds
+    # restarted is for right after the seconds were written, that starts a new second on the chip
+    def sync_time(self, restarted=False):
+        edges = self.sqw_edges
+        current = self.rtc.datetime()
+        if edges != self.sqw_edges: # an edge came in around the read, it could be either side of it
+            edges = self.sqw_edges
+            current = self.rtc.datetime()
+        now = self.now
+        for i in range(7):
+            now[i] = current[i]
+        # the read is somewhere inside a second, the ticks after it come on the same beat give or take jitter
+        self.now_sync_ticks = time.ticks_ms() if restarted else time.ticks_add(time.ticks_ms(), -TICK_SLACK_MS)
+        self.now_sync_edges = edges if edges and not restarted and self.sqw_active() else -1
+        self.now_sync_seconds = now[4] * 3600 + now[5] * 60 + now[6]
+        self.now_sync_day = alarms.day_number(now[0], max(1, now[1]), max(1, now[2]))
+        self.now_epoch = self.now_sync_day * 86400 + self.now_sync_seconds
+        self.now_synced = True
+    # set the time of day on the RTC, keeping the date
+    def set_time(self, hour, minute, second=0):
+        self.sync_time()
+        year, month, day, weekday = self.now[:4]
+        self.rtc.datetime((year, month, day, weekday, hour, minute, second, 0))
+        self.sync_time(restarted=True)
+        self.alarms.rebuild(self.now_epoch) # work out the next alarms from the new time, nothing fires for the jump
     # helper function to enforce value limits on time, alarm, and radio settings
     def adjust_value(self, field, delta):
         if self.mode == "TIME":
-            year, month, day, weekday, hour, minute, second, subsecond = self.rtc.datetime()
+            hour, minute = self.now[4], self.now[5]
             if field == 0:  # hour
                 hour = (hour + delta) % 24
             elif field == 1:  # minute
@@ -91,34 +206,70 @@ class multifunction_clock:
             elif field == 2:  # format
                 self.format_24h = not self.format_24h
                 return
-            self.rtc.datetime((year, month, day, weekday, hour, minute, 0, 0))
+            self.set_time(hour, minute, 0)
         elif self.mode == "ALARM":
+            alarm = self.alarms.first()
             if field == 0:  # hour
-                self.alarm_hour = (self.alarm_hour + delta) % 24
+                alarm.hour = (alarm.hour + delta) % 24
             elif field == 1:  # minute
-                self.alarm_minute = (self.alarm_minute + delta) % 60
+                alarm.minute = (alarm.minute + delta) % 60
             elif field == 2:  # enabled
-                self.alarm_enabled = not self.alarm_enabled
+                alarm.enabled = not alarm.enabled
+            self.alarms.changed(alarm) # saved when editing is done
         elif self.mode == "RADIO":
             if field == 0:  # frequency
                 # frequency manual stepping # self.radio_frequency = max(88.0, min(108.0, self.radio_frequency + delta * 0.1))
-                if delta > 0: # frequency seeking
-                    self.radio.seek_up()
+                if self.radio.scanning: # leave the tuner alone until the scan is done
+                    return
+                if self.radio.stations.count: # jump straight to the next scanned station
+                    self.radio.next_station(delta > 0)
                     self.radio_status()
                 else:
-                    self.radio.seek_down()
-                    self.radio_status()
+                    self.start_seek(delta > 0) # frequency seeking, the tick picks up the result
             elif field == 1:  # volume. driver only outputs 4 bits 0-15, but that will wrap, which is not desired.
                 self.update_radio(mute=False, freq=None, vol=max(0, min(VOLUME_MAX, self.radio.get_volume() + delta))) # Update the radio settings
                 self.radio_status()   
     #radio wrappers
     def update_radio(self, mute=None, freq=None, vol=None):
         if mute is not None:
-            self.radio.mute(mute)
+            if self.radio.scanning: # scan keeps the radio muted, apply this when it finishes
+                self.radio.scan_resume_mute = mute
+            else:
+                self.radio.mute(mute)
         if freq is not None:
             self.radio.set_frequency_MHz(freq)
         if vol is not None:
             self.radio.set_volume(vol)
+    # seek without blocking, tick_update_disp polls it until the chip reports STC
+    def start_seek(self, up):
+        if self.radio is None:
+            return
+        self.radio.seek_start(up)
+    def poll_seek(self):
+        if self.radio is not None and self.radio.seeking:
+            if self.radio.seek_poll() is not None:
+                self.radio_status() # seek finished, pick up the new frequency
+    # walk the band in the background and index the stations for instant recall
+    def start_scan(self):
+        if self.radio is None or self.radio.scanning:
+            return
+        self.radio.scan_start(rds_dwell_ms=SCAN_RDS_DWELL_MS) # turns RDS on for the scan if it was off
+        self.scan_timer.init(period=SCAN_POLL_MS, mode=Timer.PERIODIC, callback=self.scan_timer_irq)
+    def cancel_scan(self): # the previous station table stays
+        if self.radio is not None and self.radio.scanning:
+            self.radio.scan_cancel()
+            self.scan_timer.deinit()
+    def scan_timer_irq(self, timer):
+        self.events.put(eventq.EV_SCAN)
+    def poll_scan(self):
+        if self.radio.scan_poll() is None:
+            return
+        self.scan_timer.deinit()
+        try:
+            self.radio.stations.save(STATIONS_FILE)
+        except OSError as e:
+            print(f"Saving stations failed: {e}")
+        self.radio_status()
     def radio_status(self):
         vol = self.radio.get_volume()
         self.radio_volume = vol  # update the instance variable
@@ -126,69 +277,245 @@ class multifunction_clock:
         self.radio_frequency = freq  # update the instance variable
         mute = self.radio.mute_flag
         mono = self.radio.mono_flag
+    # 1 Hz edge from the RTC, one per second exactly, so nothing drifts against the alarm
+    def sqw_handler(self, pin):
+        self.sqw_last_ms = time.ticks_ms()
+        self.sqw_edges += 1
+        self.events.put(eventq.EV_TICK)
+    # True while the RTC square wave is pacing the ticks
+    def sqw_active(self):
+        return self.sqw_pin is not None and time.ticks_diff(time.ticks_ms(), self.sqw_last_ms) < SQW_TIMEOUT_MS
+    # software tick, only when the square wave isn't there. timer is set when the Timer calls
+    # this from IRQ context, the web app loop calls it without one
+    def timer_tick(self, timer=None):
+        if not self.sqw_active():
+            if timer is None:
+                self.events.post(eventq.EV_TICK)
+            else:
+                self.events.put(eventq.EV_TICK)
+    # button callbacks, called from the pin IRQ
+    def press_up(self):
+        self.events.put(eventq.EV_UP)
+    def press_down(self):
+        self.events.put(eventq.EV_DOWN)
+    def press_mode(self):
+        self.events.put(eventq.EV_MODE)
+    def press_set(self):
+        self.events.put(eventq.EV_SET)
+    # held up/down, n counts the repeats so far
+    def repeat_up(self, n):
+        self.events.put(eventq.EV_REPEAT | self.repeat_tier(n) << eventq.REPEAT_SHIFT | eventq.EV_UP)
+    def repeat_down(self, n):
+        self.events.put(eventq.EV_REPEAT | self.repeat_tier(n) << eventq.REPEAT_SHIFT | eventq.EV_DOWN)
+    def repeat_tier(self, n):
+        return 0 if n < REPEAT_TIER_1 else 1 if n < REPEAT_TIER_2 else 2
+    # how far one repeat moves the field being edited, 0 for fields that only toggle
+    def repeat_step(self, tier):
+        if not self.editing:
+            return 0
+        if self.mode in ("TIME", "ALARM"):
+            if self.edit_field == 1: # minutes speed up
+                return REPEAT_STEPS[tier]
+            return 1 if self.edit_field == 0 else 0
+        if self.mode == "RADIO" and self.edit_field == 0 and self.radio is not None and self.radio.seeking:
+            return 0 # let the running seek finish
+        return 1
+    # drain the queue, everything that touches the buses happens here. repeats of a held button
+    # are summed into one adjustment, and ticks and presses that piled up come out as one redraw,
+    # at most one per FRAME_MS unless a tick is due. returns True if it redrew
+    def process_events(self):
+        events = self.events
+        redraw = self.redraw_pending
+        tick = False
+        repeat = 0 # summed steps of the repeats taken so far
+        while True:
+            code = events.take()
+            if not code:
+                break
+            if code & eventq.EV_REPEAT:
+                step = self.repeat_step(code >> eventq.REPEAT_SHIFT & 0x07)
+                repeat += step if code & eventq.EV_BUTTON_MASK == eventq.EV_UP else -step
+                redraw = True
+                continue
+            if repeat: # keep the order, the repeats came before this
+                self.apply_repeat(repeat)
+                repeat = 0
+            if code == eventq.EV_TICK:
+                tick = redraw = True
+            elif code == eventq.EV_SCAN:
+                if self.radio is not None and self.radio.scanning:
+                    self.poll_scan()
+            elif code in BUTTON_EVENTS:
+                self.handle_buttons(BUTTON_EVENTS[code], redraw=False)
+                redraw = True
+        if repeat:
+            self.apply_repeat(repeat)
+        if not redraw:
+            return False
+        now = time.ticks_ms()
+        if not tick and time.ticks_diff(now, self.last_redraw_ms) < FRAME_MS:
+            self.redraw_pending = True # the next drain picks it up
+            return False
+        self.redraw_pending = False
+        self.last_redraw_ms = now
+        start = time.ticks_us()
+        self.tick_update_disp()
+        self.tick_monitor.record(start, time.ticks_us(), tick)
+        return True
+    def apply_repeat(self, delta):
+        self.last_button = MENU_UP if delta > 0 else MENU_DOWN # highlight like a press
+        if self.mode == "RADIO" and self.edit_field == 0: # one station per drain, not delta of them
+            delta = 1 if delta > 0 else -1
+        self.adjust_value(self.edit_field, delta)
     # redraw the display when called.
     def tick_update_disp(self, timer=None):
+        self.sample_time() # the one RTC read (at most) for this tick
         self.check_alarm() # check if we should make that 'larm go off.
+        self.poll_seek()
         if self.alarm_triggered:
             self.display.invert(not self.invert_flag) # invert display when alarm is triggered
             self.invert_flag = not self.invert_flag # toggle invert flag
             if self.radio:
                 self.update_radio(mute=False)
-        self.display.fill(0) # clear buffer
-        mode_handlers = { # python moment.
-            "TIME": self.draw_time_mode,
-            "ALARM": self.draw_alarm_mode,
-            "RADIO": self.draw_radio_mode
+        if self.radio and self.mode == "RADIO":
+            self.radio.read_status() # one burst read of status/rssi/rds per tick, the draw code decodes it
+        screen, update = self.screens[self.mode]
+        update() # set the widgets, only the ones whose text changed get redrawn
+        self.update_menu_bar()
+        screen.render(self.display, full=screen is not self.shown_screen) # a screen just switched to starts from blank
+        self.shown_screen = screen
+        self.display.show()
+        self.publish_state()
+        if self.bus_profiler is not None:
+            self.bus_profiler.end_tick()
+
+    # the widgets for each mode, laid out once. menu bar is shared by all of them
+    def build_screens(self):
+        ls = self.line_spacing
+        self.font = font.Font(1) # digits for the smaller times
+        self.big_font = font.Font(2) # 16x16 digits, HH:MM:SS is exactly the width of the screen
+        self.menu_bar = ui.MenuBar(ls * 6, MENU_POSITIONS, MENU_MASKS, LINE_HEIGHT)
+        self.time_screen = ui.Screen(
+            title=ui.Text(0, 0, 5, "Clock"),
+            format=ui.Text(100, 0, 3), # 24H, or AM/PM in 12 hour mode since the big face has no room for it
+            utc_label=ui.Text(0, ls * 1, 5, "UTC: "),
+            utc=ui.TimeDigits(5 * CHAR_WIDTH, ls * 1, self.font, suffix=True),
+            time=ui.TimeDigits(0, ls * 2, self.big_font), # two lines tall, the edit label below still fits
+            edit=ui.Text(0, ls * 4, CHARS_PER_LINE),
+            menu=self.menu_bar)
+        self.alarm_screen = ui.Screen(
+            alarm_label=ui.Text(0, 0, 7, "Alarm: "),
+            alarm=ui.TimeDigits(7 * CHAR_WIDTH, 0, self.font, seconds=False, suffix=True),
+            now_label=ui.Text(0, ls * 1, 5, "Now: "),
+            now=ui.TimeDigits(5 * CHAR_WIDTH, ls * 1, self.font, suffix=True),
+            status=ui.Text(0, ls * 2, CHARS_PER_LINE), # snoozing, or the next alarm due
+            state=ui.Text(0, ls * 3, CHARS_PER_LINE),
+            edit=ui.Text(0, ls * 4, CHARS_PER_LINE),
+            menu=self.menu_bar)
+        self.radio_screen = ui.Screen(
+            title=ui.Text(0, 0, CHARS_PER_LINE + 6), # "Radio->Not initialized" runs off the edge, like it always has
+            volume=ui.Text(0, ls * 1, CHARS_PER_LINE - 2),
+            signal=ui.SignalBars((CHARS_PER_LINE - 2) * CHAR_WIDTH, ls * 1, NUM_BARS, 4, LINE_HEIGHT), # last 2 characters of the second line
+            edit=ui.Text(0, ls * 4, CHARS_PER_LINE),
+            menu=self.menu_bar)
+        self.screens = {
+            "TIME": (self.time_screen, self.draw_time_mode),
+            "ALARM": (self.alarm_screen, self.draw_alarm_mode),
+            "RADIO": (self.radio_screen, self.draw_radio_mode),
         }
-        mode_handlers[self.mode]() # call the appropriate draw function based on mode, now this is peak python right here.
-        # compute pushable buttons: always MODE and SET, UP/DOWN only in edit
+        self.shown_screen = None
 
-        self.draw_menu_bar()
-        self.display.show()
+    def save_alarms(self):
+        try:
+            self.alarms.save(ALARMS_FILE)
+        except OSError as e:
+            print(f"Saving alarms failed: {e}")
+
+    # sample everything the web page shows, once per tick, and remember what changed for the push channel
+    def publish_state(self):
+        alarm = self.alarms.first()
+        state = {
+            "time": self.get_time(),
+            "mode": self.mode,
+            "format_24h": self.format_24h,
+            "alarm_hour": alarm.hour,
+            "alarm_minute": alarm.minute,
+            "alarm_toggle": alarm.enabled,
+            "alarm_triggered": self.alarm_triggered,
+            "snooze_active": self.snooze_active,
+            "alarms_version": self.alarms.version, # the page refetches /alarms when this moves
+        }
+        if self.radio is not None:
+            state["radio_frequency"] = self.radio_frequency
+            state["radio_volume"] = self.radio.get_volume() # shadowed, no bus traffic
+            state["radio_seeking"] = self.radio.seeking
+            state["rssi"] = self.radio.get_signal_strength(cached=True) # from the last status burst
+        previous = self.state
+        changed = len(state) != len(previous)
+        for key in state:
+            if previous.get(key) != state[key]:
+                self.state_changes[key] = state[key]
+                changed = True
+        if changed:
+            self.state = state
+            self.state_version += 1
+            self.state_json = ujson.dumps(state).encode()
+    def take_state_changes(self): # hand the pending changes to the caller and start collecting afresh
+        changes = self.state_changes
+        if changes:
+            self.state_changes = {}
+        return changes
 
-    # draw the time UI
+    # fill in the time UI
     def draw_time_mode(self):
-        year, month, day, weekday, hour, minute, second, subsecond = self.rtc.datetime()
-        self.display.text("Clock", 0, 0)
-        self.display.text(self.format_time(hour, minute, second), 0, self.line_spacing * 2)
+        w = self.time_screen
+        hour, minute, second = self.now[4], self.now[5], self.now[6]
+        w.time.set(self.pack_time(hour, minute, second))
         # add UTC line (board is UTC-7, so add 7 hours), assume user is in va
         utc_hour = (hour + 7) % 24
-        self.display.text("UTC: " + self.format_time(utc_hour, minute, second), 0, self.line_spacing * 1)
-        self.display.text("24H" if self.format_24h else "12H", 100, 0)
+        w.utc.set(self.pack_time(utc_hour, minute, second))
+        w.format.set("24H" if self.format_24h else " AM" if hour < 12 else " PM")
+        # shifted down one line to make room for UTC
+        w.edit.set(TIME_EDIT_LABELS[self.edit_field] if self.editing else None)
 
-        if self.editing:
-            edit_labels = ["SET: Hour", "SET: Minute", "SET: Format"]
-            # shifted down one line to make room for UTC
-            self.display.text(edit_labels[self.edit_field], 0, self.line_spacing * 4)
-        
     def draw_alarm_mode(self):
-        self.display.text("Alarm: " + self.format_time(self.alarm_hour, self.alarm_minute), 0, 0)
+        w = self.alarm_screen
+        alarm = self.alarms.first()
+        w.alarm.set(self.pack_time(alarm.hour, alarm.minute))
         # Display current time immediately under title
-        year, month, day, weekday, hour, minute, second, subsecond = self.rtc.datetime()
-        self.display.text("Now: " + self.format_time(hour, minute, second), 0, self.line_spacing * 1)
+        hour, minute, second = self.now[4], self.now[5], self.now[6]
+        w.now.set(self.pack_time(hour, minute, second))
         # alarm time and status
-        self.display.text("State: " + ("On" if self.alarm_enabled else "Off"), 0, self.line_spacing * 3)
+        w.state.set("State: " + ("On" if alarm.enabled else "Off"))
+        status = None
         if self.snooze_active:
-            self.display.text(f"Snoozing... ({self.snooze_count}x)", 0, self.line_spacing * 2)
-        elif self.editing:
-            edit_labels = ["Set: Hour", "Set: Minute", "Set: On/Off"]
-            self.display.text(edit_labels[self.edit_field], 0, self.line_spacing * 4) 
+            status = f"Snoozing... ({self.snooze_count}x)"
+        elif len(self.alarms.alarms) > 1 and self.alarms.next_at() is not None: # the others only show up as the next one due
+            at = self.alarms.next_at()
+            day = alarms.DAY_NAMES[alarms.weekday(at // 86400)]
+            status = "Next: " + day + " " + self.format_time(at % 86400 // 3600, at % 3600 // 60)
+        w.status.set(status)
+        w.edit.set(ALARM_EDIT_LABELS[self.edit_field] if self.editing and not self.snooze_active else None)
 
-    # draw the radio UI
+    # fill in the radio UI
     def draw_radio_mode(self):
+        w = self.radio_screen
         if self.radio is None:
-            self.display.text("Radio->Not initialized", 0, 0)
+            w.title.set("Radio->Not initialized")
             return
-        self.display.text(f"Radio FM {self.radio_frequency:.1f}", 0, 0)
-        self.display.text(f"Volume:{self.radio.get_volume()}/{VOLUME_MAX}", 0, self.line_spacing * 1)
-        #draw the signal strength bars, at last 2 characters of the second line
-        self.draw_signal((CHARS_PER_LINE-2)*CHAR_WIDTH, self.line_spacing * 1, int(self.radio.get_signal_strength() // (MAX_RSSI/NUM_BARS)))
-        if self.editing:
-            edit_labels = ["SET: Frequency", "SET: Volume"]
-            self.display.text(edit_labels[self.edit_field], 0, self.line_spacing * 4)
-    
+        if self.radio.scanning:
+            w.title.set(f"Radio scan {self.radio.scan_progress()}%")
+        elif self.radio.seeking:
+            w.title.set("Radio FM seek..")
+        else:
+            w.title.set(f"Radio FM {self.radio_frequency:.1f}")
+        w.volume.set(f"Volume:{self.radio.get_volume()}/{VOLUME_MAX}")
+        # signal strength bars
+        w.signal.set(int(self.radio.get_signal_strength(cached=True) // (MAX_RSSI/NUM_BARS)))
+        w.edit.set(RADIO_EDIT_LABELS[self.edit_field] if self.editing else None)
+
     # parent handler for button presses
-    def handle_buttons(self, button_type):
+    def handle_buttons(self, button_type, redraw=True):
         mask_map = {"up": MENU_UP, "down": MENU_DOWN, "mode": MENU_MODE, "set": MENU_SET} # store last pressed button as its mask
         self.last_button = mask_map.get(button_type) # we need this for the menu bar highlighting
         handlers = {
@@ -199,7 +526,8 @@ class multifunction_clock:
         }
         if button_type in handlers:
             handlers[button_type]()
-            self.tick_update_disp()
+            if redraw:
+                self.tick_update_disp()
     # child handler for up button -> increases value
     def button_up(self):
         if self.editing and self.mode in ["TIME", "ALARM", "RADIO"]:
@@ -219,13 +547,20 @@ class multifunction_clock:
         else:
             modes = ["TIME", "ALARM", "RADIO"]
             current_index = modes.index(self.mode)
-            old_mode = self.mode # save the old mode before changing, so we can handle radio mute state correctly
-            self.mode = modes[(current_index + 1) % len(modes)]
-            # mute radio when leaving radio mode, unmute when entering
-            if old_mode == "RADIO" and self.mode != "RADIO" and self.radio is not None:
-                self.update_radio(mute=True)
-            elif old_mode != "RADIO" and self.mode == "RADIO" and self.radio is not None:
-                self.update_radio(mute=False)
+            self.set_mode(modes[(current_index + 1) % len(modes)])
+    # switch screens, shared by the mode button and the web page. mute radio when leaving radio mode
+    # (stopping a seek or scan that is still going), unmute when entering
+    def set_mode(self, mode):
+        old_mode = self.mode
+        self.mode = mode
+        if self.radio is None:
+            return
+        if old_mode == "RADIO" and mode != "RADIO":
+            self.radio.seek_cancel()
+            self.cancel_scan()
+            self.update_radio(mute=True)
+        elif old_mode != "RADIO" and mode == "RADIO":
+            self.update_radio(mute=False)
     # child handler for set button -> toggles editing or snoozes alarm
     def button_set(self):  # child handler for set button -> toggles editing or snoozes alarm
         if self.alarm_triggered:
@@ -241,14 +576,16 @@ class multifunction_clock:
                 self.editing = False
                 # back to default: only MODE/SET
                 self.buttons_enabled = MENU_MODE | MENU_SET
-    # reset the alarm to its original time (before snoozing that may or may not have happened) and stop blinking the LED
+                if self.mode == "ALARM":
+                    self.save_alarms()
+    # stop the alarm and drop any pending snooze, the alarms themselves keep their schedule
     def reset_alarm(self):
         self.display.invert(0)
         self.alarm_triggered = False
         self.snooze_count = 0
         self.snooze_active = False
-        self.alarm_hour = self.original_alarm_hour
-        self.alarm_minute = self.original_alarm_minute
+        self.ringing = None
+        self.alarms.cancel_snooze()
         # Mute radio when alarm is cleared
         if self.radio:
             self.update_radio(mute=True)
@@ -263,62 +600,57 @@ class multifunction_clock:
         if self.radio:
             self.update_radio(mute=True)
         snooze_minutes = max(1, 10 // self.snooze_count) # snooze for 10, 5, 3, 2... minutes depending on snooze count
-        total_minutes = self.alarm_hour * 60 + self.alarm_minute + snooze_minutes 
-        self.alarm_hour = (total_minutes // 60) % 24
-        self.alarm_minute = total_minutes % 60
+        now = self.now_epoch
+        self.alarms.snooze(self.ringing or self.alarms.first(), now - now % 60 + snooze_minutes * 60) # on the minute, like the alarms
 
     
-    def check_alarm(self):
-        year, month, day, weekday, hour, minute, second, subsecond = self.rtc.datetime()
-        if self.alarm_enabled and not self.alarm_triggered:
-            if hour == self.alarm_hour and minute == self.alarm_minute and second == 0:
-                if not self.snooze_active:
-                    self.original_alarm_hour = self.alarm_hour
-                    self.original_alarm_minute = self.alarm_minute
-                    self.snooze_count = 0
-                self.alarm_triggered = True
+    # load the next alarm time into the DS3231, it matches on hh:mm:00
+    def program_alarm(self, at):
+        self.rtc.alarm_time((None, None, None, None, at % 86400 // 3600, at % 3600 // 60, 0, None))
+        self.rtc.alarm(False) # drop a match latched for the old time
+        self.rtc_alarm_at = at
 
-    def draw_signal(self, x, y, bars): # draws the signal strength of the radio as bars, sorta like win7 wifi
-        bars = max(0, min(NUM_BARS, bars))
-        bar_count = NUM_BARS       # module‐level constant
-        bar_width = 4
-        bar_spacing = 0
-        max_height = LINE_HEIGHT 
-
-        for i in range(bar_count):
-            # height grows from smallest to largest
-            height = int((i + 1) / bar_count * max_height)
-            xi = x + i * (bar_width + bar_spacing)
-            yi = y + (max_height - height) 
-            if i < bars:
-                # filled bar
-                self.display.fill_rect(xi, yi, bar_width, height, 1)
+    def check_alarm(self):
+        self.alarms.now = self.now_epoch # edits from the front panel or the web page schedule from here, not from boot
+        head = self.alarms.next_at()
+        if head is None:
+            return
+        if self.rtc_alarm and head != self.rtc_alarm_at:
+            self.program_alarm(head)
+        if self.now_epoch < head: # not due yet, one comparison against the head of the heap and no bus traffic
+            return
+        if self.rtc_alarm: # only asked once it looks due, no latched match means the carried forward time ran ahead
+            if self.rtc.alarm():
+                self.rtc.alarm(False)
             else:
-                # outline only
-                self.display.rect(xi, yi, bar_width, height, 1)
+                self.sync_time()
+                if self.now_epoch < head:
+                    return
+        alarm = self.alarms.due(self.now_epoch)
+        if self.alarm_triggered: # already ringing, this one is swallowed
+            return
+        if not alarm.snooze:
+            self.snooze_count = 0
+        self.ringing = alarm
+        self.alarm_triggered = True
+        if self.radio is not None: # wake up to the alarm's station, the tick unmutes it
+            if alarm.frequency is not None and not self.radio.scanning:
+                self.radio.seek_cancel()
+                self.update_radio(freq=alarm.frequency)
+            if alarm.volume is not None:
+                self.update_radio(vol=max(0, min(VOLUME_MAX, alarm.volume)))
+            self.radio_status()
+        if not alarm.snooze and alarm.once:
+            self.save_alarms() # it switched itself off
 
-    def draw_menu_bar(self): # draws the menu bar that gives the user button hints and highlights the last pressed button
-        y = self.line_spacing * 6
-        labels    = ["    ", "    ", "MODE", "SET"] # default labels for buttons
-        positions = [12, 40, 76, 112] # x positions for buttons
-        masks     = [MENU_UP, MENU_DOWN, MENU_MODE, MENU_SET] # bit masks for buttons, indicates array positions of buttons
+    def update_menu_bar(self): # button hints, highlighting the last pressed button
+        # compute pushable buttons: always MODE and SET, UP/DOWN only in edit
         self.buttons_enabled = MENU_MODE | MENU_SET
         if self.editing:
             self.buttons_enabled |= MENU_UP | MENU_DOWN
-            labels[0] = "UP" # increase value being edited
-            labels[1] = "DOWN" # decrease value being edited
-            labels[2] = "NEXT" # next field in edit mode
-            labels[3] = "DONE" # done editing
-        if self.alarm_triggered: # set becomes snooze, mode becomes reset
-            labels[2] = "RSET" # reset alarm
-            labels[3] = "SNOZ" # only space for 4 characters
-
-        for label, x, mask in zip(labels, positions, masks):
-            # Center the text at position x
-            text_width = len(label) * 8 # calculate text width
-            text_x = x - text_width // 2 # center the label at x position in array
-            self.display.text(label, text_x, y) # draw the label
-            if self.last_button == mask: # if this button was last pressed, highlight it by a line above it
-                self.display.hline(text_x, y - 2, text_width, 1) #line above the button
-                self.display.hline(text_x, y - 1 + LINE_HEIGHT, text_width, 1) #line below the button
+        if self.alarm_triggered:
+            labels = MENU_LABELS_EDIT_ALARM if self.editing else MENU_LABELS_ALARM
+        else:
+            labels = MENU_LABELS_EDIT if self.editing else MENU_LABELS
+        self.menu_bar.set((labels, self.last_button))
         self.last_button = None
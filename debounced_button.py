@@ -1,20 +1,43 @@
-from machine import Pin
+from machine import Pin, Timer
 import time
 class debounced_button:
-    def __init__(self, pin_num, callback, debounce_us=5000):
+    # callback() runs on each press. with repeat_callback, holding the button for hold_ms starts
+    # calling repeat_callback(n) every repeat_ms, n counts up from 1 (1 is the long press) so the
+    # caller can speed up the longer it's held. both are called from IRQ context, keep them short.
+    def __init__(self, pin_num, callback, debounce_us=5000, repeat_callback=None, hold_ms=500, repeat_ms=150):
         self.pin = Pin(pin_num, Pin.IN, Pin.PULL_UP)
         self.callback = callback
         self.debounce_us = debounce_us
         self.last_time = time.ticks_us()
         self.state = self.pin.value()
+        self.repeat_callback = repeat_callback
+        self.hold_ms = hold_ms
+        self.repeat_ms = repeat_ms
+        self.repeats = 0 # repeats so far in this hold
+        self.repeat_timer = Timer() if repeat_callback else None
+        self.repeat_ref = self.repeat # bound once, making it in the IRQ would allocate
         self.pin.irq(trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, handler=self.handler)
-        
+
     def handler(self, pin):
         now = time.ticks_us()
-        if now - self.last_time >= self.debounce_us:
+        if time.ticks_diff(now, self.last_time) >= self.debounce_us:
             level = pin.value()
             if level != self.state:
                 self.state = level
                 self.last_time = now
                 if level == 0:
-                    self.callback()
\ No newline at end of file
+                    self.callback()
+                    if self.repeat_timer is not None: # start counting the hold
+                        self.repeats = 0
+                        self.repeat_timer.init(mode=Timer.ONE_SHOT, period=self.hold_ms, callback=self.repeat_ref)
+                elif self.repeat_timer is not None: # released, stop repeating
+                    self.repeat_timer.deinit()
+
+    def repeat(self, timer):
+        if self.pin.value() != 0: # released and we missed the edge
+            self.repeat_timer.deinit()
+            return
+        self.repeats += 1
+        self.repeat_callback(self.repeats)
+        if self.repeats == 1: # held long enough, from here on repeat at the faster rate
+            self.repeat_timer.init(mode=Timer.PERIODIC, period=self.repeat_ms, callback=self.repeat_ref)
@@ -0,0 +1,123 @@
+# event queue between interrupt handlers and the main loop.
+# IRQs and timers only put a small event code in a ring buffer, the main loop takes them
+# out and does the real work (I2C, SPI, redraws) one at a time, never inside an interrupt.
+# one slot is always left empty so head == tail means empty. there is more than one producer:
+# a timer callback can be a hard IRQ cutting into a pin callback halfway through put(), so put()
+# holds interrupts off while it claims and fills a slot. the main loop never puts, soft IRQ
+# callbacks run between its bytecodes even with interrupts off, it post()s flags only it reads.
+# no allocation on the IRQ side.
+import time
+from array import array
+try:
+    from micropython import const, schedule
+except ImportError: # plain python, for the bench harness
+    const = lambda x: x
+    schedule = None
+try:
+    from machine import disable_irq, enable_irq
+except ImportError:
+    disable_irq = lambda: 0
+    enable_irq = lambda state: None
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError: # plain python
+    def ticks_us():
+        return int(time.monotonic() * 1000000)
+    def ticks_diff(a, b):
+        return a - b
+
+# event codes
+EV_TICK = const(1)  # once a second, from the RTC square wave or a timer
+EV_UP = const(2)  # buttons
+EV_DOWN = const(3)
+EV_MODE = const(4)
+EV_SET = const(5)
+EV_SCAN = const(6)  # time to advance a running band scan
+# auto-repeat of a held button: EV_REPEAT | tier << REPEAT_SHIFT | EV_UP or EV_DOWN,
+# tier goes 0, 1, 2 the longer it's held
+EV_REPEAT = const(0x80)
+REPEAT_SHIFT = const(4)
+EV_BUTTON_MASK = const(0x0F)
+
+QUEUE_SIZE = const(32)  # slots, a power of two
+
+class EventQueue:
+    def __init__(self, size=QUEUE_SIZE, consumer=None):
+        self.mask = size - 1
+        self.codes = bytearray(size)
+        self.stamps = array("L", [0] * size) # ticks_us at put, for the latency figures
+        self.head = 0 # next free slot, only put() moves it
+        self.tail = 0 # next event to take, only the consumer moves it
+        self.posted = 0 # bit per code post()ed from the main loop, taken before the ring
+        self.dropped = 0 # puts that found the queue full
+        self.consumer = consumer # called through micropython.schedule when nothing polls the queue
+        self.scheduled = False
+        self.run_ref = self.run_consumer # bound once, making it in put() would allocate inside the IRQ
+        self.latency_max_us = 0
+        self.latency_total_us = 0
+        self.taken = 0
+
+    def put(self, code): # IRQs only, False if the queue was full and the event was dropped
+        state = disable_irq()
+        head = self.head
+        next_head = (head + 1) & self.mask
+        if next_head == self.tail:
+            self.dropped += 1
+            enable_irq(state)
+            return False
+        self.codes[head] = code
+        self.stamps[head] = ticks_us() & 0x3FFFFFFF
+        self.head = next_head # publish last, the consumer never sees a half written slot
+        enable_irq(state)
+        if self.consumer is not None and not self.scheduled and schedule is not None:
+            self.scheduled = True
+            try:
+                schedule(self.run_ref, None)
+            except RuntimeError: # scheduler queue full, the event waits for the next put
+                self.scheduled = False
+        return True
+
+    # main loop only, for plain codes (below 8). posting a code that is already waiting doesn't add another
+    def post(self, code):
+        self.posted |= 1 << code
+
+    def run_consumer(self, _):
+        self.scheduled = False
+        self.consumer()
+
+    def __len__(self): # posted codes count as one
+        return ((self.head - self.tail) & self.mask) + (1 if self.posted else 0)
+
+    def take(self): # next event code, 0 when empty. main loop only
+        posted = self.posted
+        if posted:
+            code = 1
+            while not posted >> code & 1:
+                code += 1
+            self.posted = posted & ~(1 << code)
+            self.taken += 1
+            return code
+        tail = self.tail
+        if tail == self.head:
+            return 0
+        code = self.codes[tail]
+        latency = ticks_diff(ticks_us() & 0x3FFFFFFF, self.stamps[tail]) & 0x3FFFFFFF
+        self.tail = (tail + 1) & self.mask
+        self.taken += 1
+        self.latency_total_us += latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
+        return code
+
+    def stats(self): # and start counting afresh
+        taken = self.taken
+        stats = {
+            "taken": taken,
+            "dropped": self.dropped,
+            "latency_avg_us": self.latency_total_us // taken if taken else 0,
+            "latency_max_us": self.latency_max_us,
+        }
+        self.taken = self.dropped = self.latency_total_us = self.latency_max_us = 0
+        return stats
@@ -0,0 +1,48 @@
+# prerendered glyphs for drawing times. the digits, ':' and AM/PM letters are rendered once at
+# startup from the built-in 8x8 font, scaled up for the big clock face, into one atlas with the
+# glyphs stacked vertically. each glyph is a whole number of pages tall, so its bytes are one
+# contiguous slice of the atlas and gets its own FrameBuffer over a memoryview of it, no copies.
+# a time is then a handful of blit calls, no strings built.
+import framebuf
+from micropython import const
+
+GLYPHS = "0123456789: APM"
+COLON = const(10)
+SPACE = const(11)
+GLYPH_A = const(12)
+GLYPH_P = const(13)
+GLYPH_M = const(14)
+
+# times are passed around as one small int so setting a widget allocates nothing
+HALF_NONE = const(0) # 24 hour
+HALF_AM = const(1)
+HALF_PM = const(2)
+
+def pack_time(hour, minute, second=0, half=HALF_NONE):
+    return half << 17 | hour << 12 | minute << 6 | second
+
+def unpack_time(value): # hour, minute, second, half
+    return value >> 12 & 0x1F, value >> 6 & 0x3F, value & 0x3F, value >> 17
+
+class Font:
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.w = 8 * scale
+        self.h = 8 * scale
+        size = self.w * self.h // 8 # bytes per glyph
+        self.atlas = bytearray(size * len(GLYPHS))
+        atlas = framebuf.FrameBuffer(self.atlas, self.w, self.h * len(GLYPHS), framebuf.MONO_VLSB)
+        src_buf = bytearray(8)
+        src = framebuf.FrameBuffer(src_buf, 8, 8, framebuf.MONO_VLSB)
+        view = memoryview(self.atlas)
+        self.glyphs = []
+        for i in range(len(GLYPHS)):
+            src.fill(0)
+            src.text(GLYPHS[i], 0, 0)
+            top = i * self.h
+            for x in range(8):
+                column = src_buf[x] # MONO_VLSB, one byte is one 8 pixel column
+                for y in range(8):
+                    if column >> y & 1:
+                        atlas.fill_rect(x * scale, top + y * scale, scale, scale, 1)
+            self.glyphs.append(framebuf.FrameBuffer(view[i * size:(i + 1) * size], self.w, self.h, framebuf.MONO_VLSB))
@@ -4,6 +4,10 @@ from ssd1306 import SSD1306_SPI
 import webapp # web app 
 from debounced_button import debounced_button # custom button handler with debouncing
 from clock import multifunction_clock # custom clock handler with modes and alarms
+import busprof # bus traffic per tick, off unless BUS_PROFILE
+
+BUS_PROFILE = False # count I2C/SPI traffic per tick, shown at /bus_profile
+BUS_PROFILE_SERIAL = False # and print it every tick
 
 #disable power save mode to reduce regulator noise, i cant notice any difference.
 psu_mode = Pin(23, Pin.OUT)
@@ -11,17 +15,28 @@ psu_mode.value(1)
 
 # minified SSD1306 initialization
 oled_spi = SPI(0, sck=Pin(18), mosi=Pin(19))
-oled = SSD1306_SPI(128, 64, oled_spi, Pin(20), Pin(21), Pin(17), True)
 rtc_i2c = I2C(0, scl=Pin(5), sda=Pin(4))
 radio_i2c=I2C(1, sda=Pin(26), scl=Pin(27), freq=400000)
 
-# and init clock
-clock = multifunction_clock(oled, radio_i2c, rtc_i2c)
+profiler = None
+if BUS_PROFILE: # wrap the buses before any driver sees them
+    profiler = busprof.BusProfiler(serial=BUS_PROFILE_SERIAL)
+    oled_spi = profiler.spi(oled_spi, "oled")
+    rtc_i2c = profiler.i2c(rtc_i2c, "rtc", 400000) # machine.I2C default
+    radio_i2c = profiler.i2c(radio_i2c, "radio", 400000)
+oled = SSD1306_SPI(128, 64, oled_spi, Pin(20), Pin(21), Pin(17), True)
+
+# and init clock, the web app loop drives the display tick off the DS3231 1 Hz square wave on GP6.
+# GP6 is an assumption, the schematic has no INT/SQW net. with nothing there the clock notices no edges
+# and falls back to its own 1 s tick
+clock = multifunction_clock(oled, radio_i2c, rtc_i2c, tick_timer=False, rtc_sqw_pin=Pin(6), bus_profiler=profiler)
 
-btn1 = debounced_button(pin_num=0, callback=lambda: clock.handle_buttons("up")) 
-btn2 = debounced_button(pin_num=1, callback=lambda: clock.handle_buttons("down"))  
-btn3 = debounced_button(pin_num=2, callback=lambda: clock.handle_buttons("mode"))  
-btn4 = debounced_button(pin_num=3, callback=lambda: clock.handle_buttons("set"))
+# buttons only queue an event from their IRQ, the web app loop does the work
+# holding up/down repeats, speeding up on minutes
+btn1 = debounced_button(pin_num=0, callback=clock.press_up, repeat_callback=clock.repeat_up)
+btn2 = debounced_button(pin_num=1, callback=clock.press_down, repeat_callback=clock.repeat_down)
+btn3 = debounced_button(pin_num=2, callback=clock.press_mode)
+btn4 = debounced_button(pin_num=3, callback=clock.press_set)
 
-# start web app, this will block so we have to setup everything else first.
+# start web app and the display tick, this will block so we have to setup everything else first.
 webapp.start_web_app(clock)
\ No newline at end of file
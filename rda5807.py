@@ -14,6 +14,8 @@
 # License: MIT
 #
 import time
+from array import array
+sequential_access_address = 16 # reads start at register 0x0A and auto-increment
 random_access_address = 17
 
 
@@ -61,6 +63,10 @@ RDA5807M_FLG_FREQMODE = 0x0001
 RDA5807M_FLG_FMTRUE = 0x0100
 RDA5807M_FLG_FMREADY = 0x0080
 RDA5807M_FLG_BLOCKE = 0x0010
+RDA5807M_FLG_RDSR = 0x8000
+RDA5807M_FLG_STC = 0x4000
+RDA5807M_FLG_SF = 0x2000
+RDA5807M_FLG_ST = 0x0400
 RDA5807P_FLG_STCIEN = 0x4000
 RDA5807P_FLG_I2S = 0x0040
 RDA5807P_FLG_I2SSLAVE = 0x1000
@@ -76,6 +82,26 @@ RDA5800_FLG_SPACE_200K = 0x0001
 RDA5800_FLG_SPACE_50K = 0x0004
 RDA5800_FLG_BAND_JAPAN = 0x0002
 
+#Writable registers mirrored in Radio.shadow
+RDA5807M_SHADOW_FIRST = RDA5807M_REG_CONFIG
+RDA5807M_SHADOW_LAST = RDA5807M_REG_BLEND
+
+#Bits the chip clears by itself once the operation is done, never kept in the shadow
+RDA5807M_SELF_CLEARING = {
+    RDA5807M_REG_CONFIG: RDA5807M_FLG_SEEK | RDA5807M_FLG_RESET,
+    RDA5807M_REG_TUNING: RDA5807M_FLG_TUNE,
+}
+
+#RDS text buffers
+RDS_PS_LEN = 8
+RDS_RT_LEN = 64
+RDS_PTYN_LEN = 8
+RDS_CR = 0x0D #ends a radio text message shorter than the buffer
+RDS_BLANK_PS = b" " * RDS_PS_LEN
+RDS_BLANK_RT = b" " * RDS_RT_LEN
+#received character -> stored character, anything outside printable ASCII becomes "?"
+RDS_CHARS = bytes([c if 0x20 <= c < 0x7F else 0x3F for c in range(256)])
+
 rds_program_types_europe = [
 "No programme type defined", "News", "Current affairs", "Information",
 "Sport", "Education", "Drama", "Culture", "Science", "Varied",
@@ -106,6 +132,13 @@ class Radio:
         self.bass_boost_flag = True
         self.mono_flag = False
         self.blend_flag = True
+        self.seeking = False
+        self.seek_failed = False
+        #write-through copy of registers 0x02-0x07, None = unknown
+        self.shadow = [None] * (RDA5807M_SHADOW_LAST + 1)
+        #last burst read of STATUS, RSSI and RDSA-RDSD (0x0A-0x0F)
+        self.status_buf = bytearray(2 * (RDA5807M_REG_RDSD - RDA5807M_REG_STATUS + 1))
+        self.status_view = memoryview(self.status_buf)
         
         #read chip ID and check
         data = self.read_reg(RDA5807M_REG_CHIPID)
@@ -125,15 +158,19 @@ class Radio:
         
         if region == "US/Europe":
             self.start_frequency_MHz = 87.0
+            self.end_frequency_MHz = 108.0
             self.band = 0
         elif region == "Japan":
             self.start_frequency_MHz = 76.0
+            self.end_frequency_MHz = 91.0
             self.band = 1
         elif region == "World Wide":
             self.start_frequency_MHz = 76.0
+            self.end_frequency_MHz = 108.0
             self.band = 2
         elif region == "East Europe":
             self.start_frequency_MHz = 65.0
+            self.end_frequency_MHz = 76.0
             self.band = 3
             
         self.frequency_spacing_MHz = frequency_spacing_kHz/1000.0
@@ -145,22 +182,62 @@ class Radio:
             self.spacing = 2
         elif frequency_spacing_kHz == 25:
             self.spacing = 3
+        self.frequency_spacing_kHz = frequency_spacing_kHz
+        self.channel_count = int((self.end_frequency_MHz - self.start_frequency_MHz) * 1000) // frequency_spacing_kHz + 1
         # idk why this is here, but it breaks the initial tune. 
         # self.write_reg(RDA5807M_REG_TUNING, 0x10 | (self.band << 2) | self.spacing) 
         
+        #RDS text is decoded in place: each *_buffer fills up segment by segment, the *_valid
+        #bitmasks say which segments arrived, and the whole text is copied out once they all have
+        self.station_name = bytearray(RDS_BLANK_PS)
+        self.station_name_buffer = bytearray(RDS_BLANK_PS)
+        self.radio_text = bytearray(RDS_BLANK_RT)
+        self.radio_text_buffer = bytearray(RDS_BLANK_RT)
+        self.program_type_name = bytearray(RDS_BLANK_PS)
+        self.program_type_name_buffer = bytearray(RDS_BLANK_PS)
+        #group handlers indexed by group type << 1 | version (0 = A, 1 = B), bound once
+        self.rds_handlers = [None] * 32
+        self.rds_handlers[0x00] = self.rds_station_name # 0A
+        self.rds_handlers[0x01] = self.rds_station_name # 0B
+        self.rds_handlers[0x04] = self.rds_radio_text_a # 2A
+        self.rds_handlers[0x05] = self.rds_radio_text_b # 2B
+        self.rds_handlers[0x08] = self.rds_clock_time # 4A
+        self.rds_handlers[0x14] = self.rds_program_type_name # 10A
+        self.rds_groups = 0
+        self.rds_errors = 0
         self.clear_rds_data()
+
+        #band scan state, see scan_start()
+        self.stations = StationTable(self.band, self.spacing)
+        self.station_index = -1
+        self.scanning = False
+        self.scan_channel = 0
+        self.scan_table = None
+        self.scan_dwell_until = None
         
     def clear_rds_data(self):
 
-        """ Clear RDS data, e.g. after retuning """
-
-        self.last_ab = 0
-        self.station_name = [" " for i in range(8)]
-        self.station_name_buffer = [" " for i in range(8)]
-        self.radio_text = [" " for i in range(64)]
-        self.radio_text_buffer = [" " for i in range(64)]
-        self.last_offset = 0
-        self.last_st_offset = 0
+        """ Clear RDS data, e.g. after retuning. Blanks the buffers in place, nothing is allocated """
+
+        self.station_name[:] = RDS_BLANK_PS
+        self.station_name_buffer[:] = RDS_BLANK_PS
+        self.station_name_valid = 0
+        self.radio_text[:] = RDS_BLANK_RT
+        self.radio_text_buffer[:] = RDS_BLANK_RT
+        self.radio_text_valid = 0
+        self.radio_text_ab = -1
+        self.radio_text_version = -1
+        self.radio_text_end = RDS_RT_LEN
+        self.program_type_name[:] = RDS_BLANK_PS
+        self.program_type_name_buffer[:] = RDS_BLANK_PS
+        self.program_type_name_valid = 0
+        self.program_type_name_ab = -1
+        self.program_identification = 0
+        self.program_type = 0
+        self.traffic_program = False
+        self.clock_valid = False
+        self.mjd = 0
+        self.utc_offset = 0
         self.hours = 0
         self.minutes = 0
 
@@ -176,15 +253,64 @@ class Radio:
 
         """ Write data to i2c register """
 
-        data = bytes([reg, data >> 8, data&0xff])
-        self.i2c.writeto(random_access_address, data)
+        self.i2c.writeto(random_access_address, bytes([reg, data >> 8, data&0xff]))
+        if RDA5807M_SHADOW_FIRST <= reg <= RDA5807M_SHADOW_LAST:
+            self.shadow[reg] = data & ~RDA5807M_SELF_CLEARING.get(reg, 0)
+
+    def read_status(self):
+
+        """ Burst read STATUS through RDSD in one transaction into status_buf """
+
+        self.i2c.readfrom_into(sequential_access_address, self.status_buf)
+        return self.status_view
+
+    def status_reg(self, reg):
+
+        """ Decode a register from the last read_status() snapshot """
+
+        i = (reg - RDA5807M_REG_STATUS) << 1
+        view = self.status_view
+        return (view[i] << 8) | view[i + 1]
+
+    def cached_reg(self, reg):
+
+        """ Read a writable register from the shadow, only touching the bus if it is unknown """
+
+        data = self.shadow[reg]
+        if data is None:
+            data = self.read_reg(reg) & ~RDA5807M_SELF_CLEARING.get(reg, 0)
+            self.shadow[reg] = data
+        return data
+
+    def invalidate_shadow(self):
+
+        """ Forget the shadowed registers, e.g. after the chip was reset behind our back """
+
+        for reg in range(RDA5807M_SHADOW_FIRST, RDA5807M_SHADOW_LAST + 1):
+            self.shadow[reg] = None
+
+    def resync_shadow(self):
+
+        """ Reload the shadowed registers from the chip """
+
+        self.invalidate_shadow()
+        for reg in range(RDA5807M_SHADOW_FIRST, RDA5807M_SHADOW_LAST + 1):
+            self.cached_reg(reg)
         
     def update_reg(self, reg, mask, value):
 
         """ Update specific bits in I2C register """
 
-        data = self.read_reg(reg)
+        if RDA5807M_SHADOW_FIRST <= reg <= RDA5807M_SHADOW_LAST:
+            data = self.cached_reg(reg)
+        else:
+            data = self.read_reg(reg)
         data = (data & ~mask) | value
+        if reg == RDA5807M_REG_CONFIG and self.seeking and not mask & RDA5807M_FLG_SEEK:
+            # the shadow leaves SEEK out, writing CONFIG without it would stop a running seek.
+            # check it is still running first, setting SEEK after it finished would start another
+            if self.seek_poll() is None:
+                data |= RDA5807M_FLG_SEEK
         self.write_reg(reg, data)
         
     def set_volume(self, volume):
@@ -198,7 +324,7 @@ class Radio:
 
         """ Get Volume 0 to 15 """
 
-        return self.read_reg(RDA5807M_REG_VOLUME) & 0xf #bits 3:0
+        return self.cached_reg(RDA5807M_REG_VOLUME) & 0xf #bits 3:0
     
     def mute(self, mute):
 
@@ -240,36 +366,64 @@ class Radio:
             self.update_reg(RDA5807M_REG_BLEND, RDA5807M_FLG_SOFTBLEND, 0)
         self.blend_flag = blend
 
-    def seek_up(self):
+    def seek_start(self, up=True):
+
+        """ Start a hardware seek and return immediately, poll seek_poll() until it completes """
 
-        """ Find next station (blocks until tuning completes) """
         self.clear_rds_data()
         self.update_reg(RDA5807M_REG_CONFIG,
-            (RDA5807M_FLG_SEEKUP | RDA5807M_FLG_SEEK), 
-            (RDA5807M_FLG_SEEKUP | RDA5807M_FLG_SEEK))
-        while 1:
-            data = self.read_reg(RDA5807M_REG_CONFIG)
-            if not data & RDA5807M_FLG_SEEK:
-                break
+            (RDA5807M_FLG_SEEKUP | RDA5807M_FLG_SEEK),
+            (RDA5807M_FLG_SEEKUP if up else 0) | RDA5807M_FLG_SEEK)
+        self.seeking = True
+        self.seek_failed = False
+
+    def seek_poll(self):
+
+        """ Check the STC/SF bits of a seek started with seek_start()
+
+        Returns None while the seek is running, otherwise the tuned frequency in MHz.
+        .seek_failed is set if the chip hit the band edge without finding a station """
+
+        self.read_status()
+        status = self.status_reg(RDA5807M_REG_STATUS)
+        if self.seeking:
+            if not status & RDA5807M_FLG_STC:
+                return None
+            self.seeking = False
+            self.seek_failed = bool(status & RDA5807M_FLG_SF)
+        return self.get_frequency_MHz(cached=True)
+
+    def seek_cancel(self):
+
+        """ Stop a running seek, the chip stays on whatever channel it reached """
+
+        if self.seeking:
+            self.update_reg(RDA5807M_REG_CONFIG, RDA5807M_FLG_SEEK, 0)
+            self.seeking = False
+
+    def seek_up(self):
+
+        """ Find next station (blocks until tuning completes) """
+
+        self.seek_start(True)
+        while self.seek_poll() is None:
+            time.sleep_ms(10)
         
     def seek_down(self):
 
         """ Find previous station (blocks until tuning completes) """
 
-        self.clear_rds_data()
-        self.update_reg(RDA5807M_REG_CONFIG,
-            (RDA5807M_FLG_SEEKUP | RDA5807M_FLG_SEEK),
-            RDA5807M_FLG_SEEK)
-        while 1:
-            data = self.read_reg(RDA5807M_REG_CONFIG)
-            if not data & RDA5807M_FLG_SEEK:
-                break
+        self.seek_start(False)
+        while self.seek_poll() is None:
+            time.sleep_ms(10)
         
-    def get_frequency_MHz(self):
+    def get_frequency_MHz(self, cached=False):
 
-        """ Get tuned frequency in MHz """
+        """ Get tuned frequency in MHz, cached=True decodes the last read_status() snapshot """
 
-        frequency = self.start_frequency_MHz + ((self.read_reg(RDA5807M_REG_STATUS) & 0x3ff) * self.frequency_spacing_MHz)
+        if not cached:
+            self.read_status()
+        frequency = self.start_frequency_MHz + ((self.status_reg(RDA5807M_REG_STATUS) & 0x3ff) * self.frequency_spacing_MHz)
         return frequency
     
     def set_frequency_MHz(self, frequency_MHz):
@@ -281,112 +435,387 @@ class Radio:
         data = (frequency_steps << 6) | 0x10 | (self.band << 2) | self.spacing
         self.write_reg(RDA5807M_REG_TUNING, data)
         
-    def get_signal_strength(self):
+    def tune_channel(self, channel):
+
+        """ Tune to a channel number counted in frequency_spacing steps from the band start """
+
+        self.clear_rds_data()
+        self.write_reg(RDA5807M_REG_TUNING, (channel << 6) | RDA5807M_FLG_TUNE | (self.band << 2) | self.spacing)
+
+    def frequency_of(self, channel):
+
+        """ Frequency in MHz of a channel number """
+
+        return self.start_frequency_MHz + channel * self.frequency_spacing_MHz
+
+    def scan_start(self, min_rssi=20, rds_dwell_ms=0):
+
+        """ Walk the whole band once and index every station, poll scan_poll() until it finishes
+
+        min_rssi        - weakest signal that is still recorded as a station
+        rds_dwell_ms    - how long to listen for the RDS station name on each hit, 0 = don't """
+
+        self.seek_cancel()
+        self.read_status()
+        self.scan_resume_channel = self.status_reg(RDA5807M_REG_STATUS) & 0x3ff
+        self.scan_resume_mute = self.mute_flag
+        self.scan_rds = bool(self.cached_reg(RDA5807M_REG_CONFIG) & RDA5807M_FLG_RDS)
+        self.mute(True)
+        if rds_dwell_ms:
+            self.update_reg(RDA5807M_REG_CONFIG, RDA5807M_FLG_RDS, RDA5807M_FLG_RDS)
+        self.scan_min_rssi = min_rssi
+        self.scan_dwell_ms = rds_dwell_ms
+        self.scan_dwell_until = None
+        self.scan_table = StationTable(self.band, self.spacing)
+        self.scan_channel = 0
+        self.scanning = True
+        self.tune_channel(0)
+
+    def scan_progress(self):
+
+        """ Percentage of the band covered by the running scan """
 
-        """ Recieved Signal Strength Indicator 0 = low, 7 = high (logarithmic) -> the 127 divisor was removed to avoid rounding errors """
+        return self.scan_channel * 100 // self.channel_count
 
+    def scan_poll(self):
+
+        """ Advance a scan started with scan_start() without blocking
+
+        Returns None while scanning, the finished StationTable (also stored in .stations) once done """
+
+        if not self.scanning:
+            return self.stations
+        self.read_status()
+        if self.scan_dwell_until is not None:
+            # station found, wait for the name to come in over RDS. a complete name ends the wait early
+            self.update_rds(cached=True)
+            if self.station_name == RDS_BLANK_PS and time.ticks_diff(self.scan_dwell_until, time.ticks_ms()) > 0:
+                return None
+            self.scan_dwell_until = None
+            self.scan_table.name(self.scan_table.count - 1, self.station_name)
+        else:
+            status = self.status_reg(RDA5807M_REG_STATUS)
+            if not status & RDA5807M_FLG_STC:
+                return None
+            rssi_reg = self.status_reg(RDA5807M_REG_RSSI)
+            rssi = rssi_reg >> 9
+            if rssi_reg & RDA5807M_FLG_FMTRUE and rssi >= self.scan_min_rssi:
+                if self.scan_table.add(self.scan_channel, rssi, bool(status & RDA5807M_FLG_ST)) and self.scan_dwell_ms:
+                    self.scan_dwell_until = time.ticks_add(time.ticks_ms(), self.scan_dwell_ms)
+                    return None
+        self.scan_channel += 1
+        if self.scan_channel < self.channel_count:
+            self.tune_channel(self.scan_channel)
+            return None
+        # band done, put the radio back the way we found it
+        self.scanning = False
+        if not self.scan_rds:
+            self.update_reg(RDA5807M_REG_CONFIG, RDA5807M_FLG_RDS, 0)
+        self.tune_channel(self.scan_resume_channel)
+        self.mute(self.scan_resume_mute)
+        self.stations = self.scan_table
+        self.scan_table = None
+        self.station_index = self.stations.find(self.scan_resume_channel)
+        return self.stations
+
+    def scan_cancel(self):
+
+        """ Abandon a running scan, the previous station table is kept """
+
+        if self.scanning:
+            self.scanning = False
+            self.scan_table = None
+            self.scan_dwell_until = None
+            if not self.scan_rds:
+                self.update_reg(RDA5807M_REG_CONFIG, RDA5807M_FLG_RDS, 0)
+            self.tune_channel(self.scan_resume_channel)
+            self.mute(self.scan_resume_mute)
+
+    def next_station(self, up=True):
+
+        """ Jump to the next (or previous) indexed station, returns its frequency or None if the table is empty """
+
+        count = self.stations.count
+        if not count:
+            return None
+        if self.station_index < 0:
+            self.station_index = 0 if up else count - 1
+        else:
+            self.station_index = (self.station_index + (1 if up else -1)) % count
+        channel = self.stations.channels[self.station_index]
+        self.tune_channel(channel)
+        return self.frequency_of(channel)
+
+    def get_signal_strength(self, cached=False):
+
+        """ Recieved Signal Strength Indicator 0 = low, 7 = high (logarithmic) -> the 127 divisor was removed to avoid rounding errors
+
+        cached=True decodes the last read_status() snapshot instead of reading the chip """
+
+        if not cached:
+            self.read_status()
         #rssi = round(7*(self.read_reg(RDA5807M_REG_RSSI) >> 9)/127)
-        rssi = (self.read_reg(RDA5807M_REG_RSSI) >> 9)
+        rssi = (self.status_reg(RDA5807M_REG_RSSI) >> 9)
         return rssi
     
-    def get_rds_block_group(self):
+    def get_rds_block_group(self, cached=False):
 
         """ Read all 4 RDS blocks from device """
 
-        return self.read_reg(RDA5807M_REG_RDSA), self.read_reg(RDA5807M_REG_RDSB), self.read_reg(RDA5807M_REG_RDSC), self.read_reg(RDA5807M_REG_RDSD)
+        if not cached:
+            self.read_status()
+        return self.status_reg(RDA5807M_REG_RDSA), self.status_reg(RDA5807M_REG_RDSB), self.status_reg(RDA5807M_REG_RDSC), self.status_reg(RDA5807M_REG_RDSD)
     
-    def update_rds(self, timer=None):
+    def update_rds(self, timer=None, cached=False):
         
         """ Check for new RDS messages and decode if present
 
         Should be polled regularly so that we don't miss any.
         Returns true if new data received.
         
-        .station_name, .radio_text contain decoded data.
+        .station_name, .radio_text and .program_type_name (bytearrays) contain decoded data,
+        .hours/.minutes the local time from the last clock-time group.
+
+        One burst read per call, cached=True decodes the last read_status() snapshot"""
+
+        if not cached:
+            self.read_status()
+        view = self.status_view
+        if not view[0] & 0x80: #RDSR
+            return False
+        #check for uncorrectable errors in blocks A and B
+        bler = view[3]
+        if (bler & 0x3) == 0x3 or (bler & 0xc) == 0xc:
+            self.rds_errors += 1
+            return False
+        b = (view[6] << 8) | view[7]
+        self.program_identification = (view[4] << 8) | view[5]
+        self.program_type = (b >> 5) & 0x1f
+        self.traffic_program = bool(b & 0x400)
+        self.rds_groups += 1
+        handler = self.rds_handlers[b >> 11]
+        if handler is not None:
+            handler(b, (view[8] << 8) | view[9], (view[10] << 8) | view[11])
+        return True
 
-        machine RTC is updated upon reception of time/date messages"""
+    def rds_station_name(self, b, c, d):
+
+        """ Groups 0A/0B: two characters of the station name in block D """
+
+        offset = b & 0x3
+        buf = self.station_name_buffer
+        buf[offset * 2] = RDS_CHARS[d >> 8]
+        buf[offset * 2 + 1] = RDS_CHARS[d & 0xff]
+        self.station_name_valid |= 1 << offset
+        if self.station_name_valid == 0xf:
+            self.station_name[:] = buf
+            self.station_name_valid = 0
+
+    def rds_radio_text_start(self, b, version):
+
+        """ Start over on a new radio text message, flagged by the A/B bit or a change of group version """
+
+        ab = (b >> 4) & 1
+        if ab != self.radio_text_ab or version != self.radio_text_version:
+            self.radio_text_buffer[:] = RDS_BLANK_RT
+            self.radio_text_valid = 0
+            self.radio_text_ab = ab
+            self.radio_text_version = version
+            self.radio_text_end = RDS_RT_LEN if version == 0 else RDS_RT_LEN // 2
+
+    def rds_radio_text_char(self, i, character):
+
+        """ Store one radio text character, a CR ends the message there """
+
+        if character == RDS_CR:
+            if i < self.radio_text_end:
+                self.radio_text_end = i
+            character = 0x20
+        self.radio_text_buffer[i] = RDS_CHARS[character]
+
+    def rds_radio_text_segment(self, segment, size):
+
+        """ Mark a segment received, copy the message out once every segment up to its end is in """
+
+        self.radio_text_valid |= 1 << segment
+        needed = (1 << ((self.radio_text_end + size - 1) // size)) - 1
+        if self.radio_text_valid & needed == needed:
+            text = self.radio_text
+            text[:] = self.radio_text_buffer
+            for i in range(self.radio_text_end, RDS_RT_LEN):
+                text[i] = 0x20
+            self.radio_text_valid = 0
+
+    def rds_radio_text_a(self, b, c, d):
+
+        """ Group 2A: four characters of a 64 character message in blocks C and D """
+
+        self.rds_radio_text_start(b, 0)
+        segment = b & 0xf
+        i = segment * 4
+        self.rds_radio_text_char(i, c >> 8)
+        self.rds_radio_text_char(i + 1, c & 0xff)
+        self.rds_radio_text_char(i + 2, d >> 8)
+        self.rds_radio_text_char(i + 3, d & 0xff)
+        self.rds_radio_text_segment(segment, 4)
+
+    def rds_radio_text_b(self, b, c, d):
+
+        """ Group 2B: two characters of a 32 character message in block D """
+
+        self.rds_radio_text_start(b, 1)
+        segment = b & 0xf
+        i = segment * 2
+        self.rds_radio_text_char(i, d >> 8)
+        self.rds_radio_text_char(i + 1, d & 0xff)
+        self.rds_radio_text_segment(segment, 2)
+
+    def rds_clock_time(self, b, c, d):
+
+        """ Group 4A: modified julian date, UTC time and the local offset in half hours """
+
+        hours_utc = ((c & 1) << 4) | (d >> 12)
+        minutes = (d >> 6) & 0x3f
+        if hours_utc > 23 or minutes > 59:
+            return
+        self.mjd = ((b & 0x3) << 15) | (c >> 1)
+        offset = d & 0x1f
+        if d & 0x20: #sign bit set = west of Greenwich
+            offset = -offset
+        self.utc_offset = offset
+        local = (hours_utc * 60 + minutes + offset * 30) % 1440
+        self.hours = local // 60
+        self.minutes = local % 60
+        self.clock_valid = True
+
+    def rds_date(self):
+
+        """ (year, month, day) of the last clock-time group, None before one arrived """
+
+        if not self.clock_valid:
+            return None
+        mjd = self.mjd
+        y = int((mjd - 15078.2) / 365.25)
+        m = int((mjd - 14956.1 - int(y * 365.25)) / 30.6001)
+        day = mjd - 14956 - int(y * 365.25) - int(m * 30.6001)
+        k = 1 if m == 14 or m == 15 else 0
+        return 1900 + y + k, m - 1 - k * 12, day
+
+    def rds_program_type_name(self, b, c, d):
+
+        """ Group 10A: four characters of the programme type name in blocks C and D """
+
+        ab = (b >> 4) & 1
+        if ab != self.program_type_name_ab:
+            self.program_type_name_buffer[:] = RDS_BLANK_PS
+            self.program_type_name_valid = 0
+            self.program_type_name_ab = ab
+        segment = b & 1
+        i = segment * 4
+        buf = self.program_type_name_buffer
+        buf[i] = RDS_CHARS[c >> 8]
+        buf[i + 1] = RDS_CHARS[c & 0xff]
+        buf[i + 2] = RDS_CHARS[d >> 8]
+        buf[i + 3] = RDS_CHARS[d & 0xff]
+        self.program_type_name_valid |= 1 << segment
+        if self.program_type_name_valid == 0x3:
+            self.program_type_name[:] = buf
+            self.program_type_name_valid = 0
+
+
+class StationTable:
+
+    """ Stations found by Radio.scan_start(), array backed so it stays small """
+
+    NAME_LEN = 8
+    RECORD_LEN = 12 # channel (2), rssi, flags, name (8)
+    FLG_STEREO = 0x01
+
+    def __init__(self, band=0, spacing=0, capacity=64):
+        self.band = band
+        self.spacing = spacing
+        self.capacity = capacity
+        self.count = 0
+        self.channels = array("H", bytes(2 * capacity))
+        self.rssi = bytearray(capacity)
+        self.flags = bytearray(capacity)
+        self.names = bytearray(b" " * (self.NAME_LEN * capacity))
+
+    def add(self, channel, rssi, stereo):
+
+        """ Append a station, returns False if the table is full """
+
+        if self.count >= self.capacity:
+            return False
+        i = self.count
+        self.channels[i] = channel
+        self.rssi[i] = rssi
+        self.flags[i] = self.FLG_STEREO if stereo else 0
+        self.count += 1
+        return True
 
-        if (self.read_reg(RDA5807M_REG_STATUS) & 0x8000):
-        
-            #check for uncorrectable errors
-            if (self.read_reg(RDA5807M_REG_RSSI) & 0x3) == 0x3:
-                return False
-            if (self.read_reg(RDA5807M_REG_RSSI) & 0xc) == 0xc:
-                return False
-            
-            a, b, c, d = self.get_rds_block_group()           
-            
-            program_information = a
-            group_type = b >> 12
-            group_version = (b >> 11) & 1
-            traffic_program = (b >> 10) & 1
-            program_type = (b >> 5) & 0x1f
-            
-            #station name
-            if group_type == 0:
-                offset = b & 0x3
-                character_a = chr(d >> 8)
-                character_b = chr(d & 0xff)
-                
-                #Check multiple messages for consistency          
-                self.station_name_buffer[offset*2] = character_a
-                self.station_name_buffer[(offset*2)+1] = character_b
-                if offset < self.last_st_offset:
-                    self.station_name = self.station_name_buffer
-                self.last_st_offset = offset
-                            
-            #radio text   
-            elif group_type == 2 and group_version == 0:
-                offset = b & 0xf
-                
-                ab = (b >> 4) & 1
-                character_a = c >> 8
-                character_b = c & 0xff
-                character_c = d >> 8
-                character_d = d & 0xff
-                if ab != self.last_ab:
-                    self.clear_buffer = True
-                    self.radio_text_buffer = [" " for i in range(64)]
-                self.last_ab = ab
-                self.radio_text_buffer[offset*4] = chr(character_a)
-                self.radio_text_buffer[(offset*4)+1] = chr(character_b)
-                self.radio_text_buffer[(offset*4)+2] = chr(character_c)
-                self.radio_text_buffer[(offset*4)+3] = chr(character_d)
-                
-                if offset < self.last_offset:
-                    self.radio_text = self.radio_text_buffer
-                self.last_offset = offset
-        
-            #radio text type 2
-            elif group_type == 2 and group_version == 1:
-                offset = b & 0xf
-                ab = (b >> 4) & 1
-                character_c = d >> 8
-                character_d = d & 0xff
-                if ab != self.last_ab:
-                    self.radio_text_buffer = [" " for i in range(64)]
-                self.radio_text_buffer[(offset*2)+0] = chr(character_c)
-                self.radio_text_buffer[(offset*2)+1] = chr(character_d)
-                
-                if offset < self.last_offset:
-                    self.radio_text = self.radio_text_buffer
-                self.last_offset = offset
-                
-            elif group_type == 4 and group_version == 0:
-                hours_utc = ((c & 1) << 4) | ((d & 0xf000) >> 12)
-                minutes = ((d & 0xfc0) >> 6)
-                utc_offset = (d & 0x1f) * 0.25
-                utc_sign = d & 0x20
-                
-                if utc_sign:
-                    hours = hours_utc + utc_offset
-                else:
-                    hours = hours_utc - utc_offset
-                try:
-                    #self.rtc.datetime((2000, 1, 1, 1, int(hours), int(minutes), 0, 0))
-                    #print("Got time: {:02d}:{:02d}".format(int(hours), int(minutes)))
-                    pass
-                except OSError:
-                    pass
-                
+    def name(self, i, name=None):
+
+        """ Get or set the RDS station name of entry i, set takes a str or the radio's station_name bytes.
+        Get returns "" for a name that isn't valid UTF-8 (garbled RDS or a damaged file), callers show the frequency anyway """
+
+        start = i * self.NAME_LEN
+        if name is None:
+            try:
+                return bytes(self.names[start:start + self.NAME_LEN]).decode().strip()
+            except UnicodeError:
+                return ""
+        if isinstance(name, str):
+            name = name.encode()
+        n = min(len(name), self.NAME_LEN)
+        names = self.names
+        for j in range(self.NAME_LEN): #copied byte by byte, no padded copy of the name
+            names[start + j] = name[j] if j < n else 0x20
+
+    def find(self, channel):
+
+        """ Index of the entry for channel, -1 if it isn't in the table """
+
+        for i in range(self.count):
+            if self.channels[i] == channel:
+                return i
+        return -1
+
+    def save(self, path):
+
+        """ Write the table to flash """
+
+        record = bytearray(self.RECORD_LEN)
+        with open(path, "wb") as f:
+            f.write(bytes((ord("S"), ord("T"), self.band, self.spacing, self.count)))
+            for i in range(self.count):
+                record[0] = self.channels[i] >> 8
+                record[1] = self.channels[i] & 0xff
+                record[2] = self.rssi[i]
+                record[3] = self.flags[i]
+                start = i * self.NAME_LEN
+                record[4:] = self.names[start:start + self.NAME_LEN]
+                f.write(record)
+
+    def load(self, path):
+
+        """ Read a table written by save(), returns False if it is missing, for another band/spacing
+        or cut short (records that aren't a whole 12 bytes) """
+
+        try:
+            with open(path, "rb") as f:
+                header = f.read(5)
+                if len(header) != 5 or header[:2] != b"ST" or header[2] != self.band or header[3] != self.spacing:
+                    return False
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) % self.RECORD_LEN:
+            return False
+        self.count = 0
+        for i in range(min(header[4], len(data) // self.RECORD_LEN, self.capacity)):
+            at = i * self.RECORD_LEN
+            self.add((data[at] << 8) | data[at + 1], data[at + 2], data[at + 3] & self.FLG_STEREO)
+            start = i * self.NAME_LEN
+            self.names[start:start + self.NAME_LEN] = data[at + 4:at + self.RECORD_LEN]
         return True
@@ -0,0 +1,79 @@
+# runs the firmware under CPython. install() puts fake machine, framebuf, micropython, network
+# and ujson modules in sys.modules, adds MicroPython's time.ticks_* / sleep_ms and a builtin
+# const(), and wires a simulated board (see board.py) behind them. after that clock.py, webapp.py
+# and main.py import and run unchanged:
+#
+#   import sim
+#   board = sim.install()
+#   import main            # boots, serves on webapp.HTTP_PORT
+#
+# or from the repo root: python -m sim --port 8080 --screen
+import builtins
+import os
+import sys
+import time
+
+from . import board as _board
+from . import devices as _devices
+
+TICKS_PERIOD = 1 << 30 # ticks_ms/us wrap here on the rp2 port
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_start = _devices.now()
+_ticks_start = 0
+
+
+# the ticks run off devices.now() like the chips do, so stepping it by hand moves both together
+def ticks_ms():
+    return (int((_devices.now() - _start) * 1000) + _ticks_start) & TICKS_MAX
+
+
+def ticks_us():
+    return (int((_devices.now() - _start) * 1000000) + _ticks_start) & TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+def install(board=None, ticks_start=0, port=None):
+    # ticks_start sets where ticks_ms/us begin, just under TICKS_PERIOD shakes out wraparound bugs
+    global _ticks_start
+    from . import framebuf, machine, micropython, network, ujson
+    _ticks_start = ticks_start
+    for name, module in (("framebuf", framebuf), ("machine", machine), ("micropython", micropython),
+            ("network", network), ("ujson", ujson)):
+        sys.modules[name] = module
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_cpu = ticks_us
+    time.ticks_add = ticks_add
+    time.ticks_diff = ticks_diff
+    time.sleep_ms = sleep_ms
+    time.sleep_us = sleep_us
+    builtins.const = micropython.const # clock.py uses const() without importing it, fine on the device
+    if board is None: # installing twice keeps the board already running
+        board = _board.current or _board.Board()
+    board.install()
+    board.start()
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    if port is not None:
+        import webapp
+        webapp.HTTP_PORT = port
+    return board
@@ -0,0 +1,76 @@
+# python -m sim [--port 8080] [--screen] [--fs DIR] [--start 2025-07-01T06:59:30]
+# boots main.py on the simulated board. the device filesystem (alarms.json, stations.bin, web/)
+# lives in --fs, a temp dir by default, so the repo isn't written to. buttons from stdin:
+#   u d m s    press up/down/mode/set      U D    hold up/down for 2 s
+#   p          print the screen             q      quit
+import argparse
+import datetime
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import sim
+from sim import board as _board
+
+BUTTONS = {"u": 0, "d": 1, "m": 2, "s": 3}
+HOLD_MS = 2000
+
+
+def watch_screen(board):
+    shown = -1
+    while not board.halted:
+        if board.oled.version != shown:
+            shown = board.oled.version
+            sys.stdout.write("\x1b[H\x1b[2J" + board.oled.to_text() + "\n")
+            sys.stdout.flush()
+        time.sleep(0.1)
+
+
+def read_buttons(board):
+    for line in sys.stdin:
+        for key in line.strip():
+            if key == "q":
+                board.halt()
+                os._exit(0)
+            elif key == "p":
+                print(board.oled.to_text())
+            elif key in BUTTONS:
+                board.press(BUTTONS[key])
+            elif key.lower() in BUTTONS:
+                board.press(BUTTONS[key.lower()], HOLD_MS)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim", description="run the alarm clock firmware on a simulated board")
+    parser.add_argument("--port", type=int, default=8080, help="HTTP port for the web app")
+    parser.add_argument("--screen", action="store_true", help="redraw the OLED in the terminal when it changes")
+    parser.add_argument("--fs", help="directory standing in for the pico's filesystem")
+    parser.add_argument("--start", help="DS3231 start time, ISO format, default is the host's local time")
+    parser.add_argument("--ticks-start", type=int, default=0, help="initial ticks_ms/us, near 2**30 to test wraparound")
+    args = parser.parse_args()
+
+    start = datetime.datetime.fromisoformat(args.start) if args.start else None
+    board = sim.install(_board.Board(start_time=start), ticks_start=args.ticks_start, port=args.port)
+    fs = args.fs or tempfile.mkdtemp(prefix="alarm-fs-")
+    web = os.path.join(fs, "web")
+    if not os.path.exists(web):
+        shutil.copytree(os.path.join(sim.REPO_ROOT, "web"), web)
+    os.chdir(fs)
+    print("filesystem:", fs)
+    print("web app: http://127.0.0.1:{}/".format(args.port))
+    if args.screen:
+        threading.Thread(target=watch_screen, args=(board,), daemon=True, name="sim-screen").start()
+    threading.Thread(target=read_buttons, args=(board,), daemon=True, name="sim-buttons").start()
+    try:
+        runpy.run_path(os.path.join(sim.REPO_ROOT, "main.py"), run_name="__main__")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        board.halt()
+
+
+main()
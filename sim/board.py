@@ -0,0 +1,144 @@
+# the simulated pico W and what is wired to it, laid out like main.py expects:
+#   SPI0   SSD1306/SH1106 oled, dc=GP20 res=GP21 cs=GP17
+#   I2C0   DS3231 at 0x68, its INT/SQW on GP6
+#   I2C1   RDA5807 at 0x10/0x11
+#   GP0-3  buttons up/down/mode/set, active low
+# machine.Pin/SPI/I2C objects all look their state up here by id.
+import threading
+import time
+
+from . import devices
+
+current = None # the board the fake machine module talks to, set by Board.install()
+# IRQ handlers, timer callbacks and scheduled callbacks run one at a time like on the single core
+# the firmware uses, but they still cut into the main loop at any point like real interrupts do
+irq_lock = threading.RLock()
+
+
+class PinState:
+    def __init__(self, id):
+        self.id = id
+        self.mode = 0
+        self.pull = None
+        self.level = 0
+        self.driver = None # set when something off-chip (a button, the RTC) drives the line
+        self.handler = None
+        self.handler_pin = None
+        self.trigger = 0
+        self.lock = threading.Lock()
+
+    def set(self, level): # the pico drives the pin
+        self.change(level)
+
+    def drive(self, level, driver="ext"): # something outside drives the pin
+        self.driver = driver
+        self.change(level)
+
+    def change(self, level):
+        with self.lock:
+            old = self.level
+            self.level = level
+            handler = self.handler
+        if handler is None or old == level:
+            return
+        edge = 8 if level else 4 # Pin.IRQ_RISING / Pin.IRQ_FALLING
+        if self.trigger & edge:
+            with irq_lock:
+                handler(self.handler_pin)
+
+
+class SpiBus:
+    def __init__(self, id):
+        self.id = id
+        self.baudrate = 0
+        self.inits = 0
+        self.devices = [] # every device sees every write, they check their own CS
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        for device in self.devices:
+            device.spi_write(data)
+
+
+class I2cBus:
+    def __init__(self, id):
+        self.id = id
+        self.freq = 0
+        self.devices = {} # address -> device
+
+    def attach(self, device):
+        for addr in device.addresses:
+            self.devices[addr] = device
+
+    def device(self, addr):
+        device = self.devices.get(addr)
+        if device is None:
+            raise OSError(5) # EIO, nobody acked the address, same as on the pico
+        return device
+
+
+class Board:
+    def __init__(self, stations=None, start_time=None, radio=True, rtc=True):
+        self.pins = {}
+        self.spis = {}
+        self.i2cs = {}
+        self.halted = False
+        self.oled = devices.SSD1306(self.pin(17), self.pin(20), self.pin(21))
+        self.spi(0).devices.append(self.oled)
+        self.rtc = None
+        self.radio = None
+        if rtc:
+            self.rtc = devices.DS3231(start_time)
+            self.i2c(0).attach(self.rtc)
+        if radio:
+            self.radio = devices.RDA5807(stations)
+            self.i2c(1).attach(self.radio)
+        self.buttons = (0, 1, 2, 3)
+        for button in self.buttons:
+            self.pin(button).drive(1, "button") # pulled up, not pressed
+        self.sqw_thread = None
+
+    def install(self):
+        global current
+        current = self
+        return self
+
+    def pin(self, id):
+        state = self.pins.get(id)
+        if state is None:
+            state = self.pins[id] = PinState(id)
+        return state
+
+    def spi(self, id):
+        bus = self.spis.get(id)
+        if bus is None:
+            bus = self.spis[id] = SpiBus(id)
+        return bus
+
+    def i2c(self, id):
+        bus = self.i2cs.get(id)
+        if bus is None:
+            bus = self.i2cs[id] = I2cBus(id)
+        return bus
+
+    def press(self, button, hold_ms=60): # push a button for hold_ms, blocks
+        pin = self.pin(button)
+        pin.drive(0, "button")
+        time.sleep(hold_ms / 1000)
+        pin.drive(1, "button")
+
+    def start(self): # run the RTC's INT/SQW line
+        if self.rtc is None or self.sqw_thread is not None:
+            return
+        self.sqw_thread = threading.Thread(target=self.run_sqw, daemon=True, name="sim-sqw")
+        self.sqw_thread.start()
+
+    def run_sqw(self):
+        pin = self.pin(6)
+        while not self.halted:
+            pin.drive(self.rtc.int_level(), "rtc")
+            time.sleep(self.rtc.int_poll_s())
+
+    def halt(self):
+        self.halted = True
@@ -0,0 +1,560 @@
+# register level models of the chips on the board. they only see bytes on the bus, so the
+# drivers in the repo run against them unchanged. time is read from now() (monotonic seconds)
+# which tests can replace to step time by hand.
+import datetime
+import time
+
+now = time.monotonic
+
+EPOCH = datetime.datetime(2000, 1, 1) # the DS3231 counts 2000-2099, the rest of the repo uses 2000 too
+
+
+def bcd(value):
+    return (value // 10) << 4 | value % 10
+
+
+def unbcd(value):
+    return (value >> 4) * 10 + (value & 0x0F)
+
+
+class RDA5807:
+    # two I2C addresses: 0x11 takes [reg, hi, lo, ...] writes and reads from the last written reg,
+    # 0x10 is the sequential interface, writes start at 0x02 and reads start at 0x0A.
+    # TUNE and SEEK take time like the real chip, STC comes up when they are done.
+    addresses = (0x10, 0x11)
+    CHIP_ID = 0x5804
+    TUNE_S = 0.02 # tune settle time (datasheet: < 10 ms for the PLL, the chip reports STC after ~20 ms)
+    SEEK_STEP_S = 0.008 # per channel while seeking
+    GROUP_S = 0.0877 # one RDS group, 1187.5 bit/s / 104 bits
+    NOISE_RSSI = 6
+    BANDS = ((87.0, 108.0), (76.0, 91.0), (76.0, 108.0), (65.0, 76.0))
+    SPACINGS = (0.1, 0.2, 0.05, 0.025)
+
+    # frequency MHz -> (rssi, stereo, PS name, radio text)
+    STATIONS = {
+        88.1: (42, True, "KQED FM ", "Morning Edition"),
+        91.5: (24, False, "CKUA    ", ""),
+        96.3: (55, True, "THE BEAT", "Now playing: Daft Punk - One More Time"),
+        101.9: (33, True, "JAZZ 102", "Smooth jazz all day"),
+        104.5: (18, False, "", ""),
+    }
+
+    def __init__(self, stations=None):
+        self.stations = dict(self.STATIONS if stations is None else stations)
+        self.reads = 0
+        self.writes = 0
+        self.reset()
+
+    def reset(self):
+        self.regs = [0] * 0x40
+        self.regs[0x00] = self.CHIP_ID
+        self.regs[0x05] = 0x880F
+        self.ptr = 0
+        self.channel = 0
+        self.stc = False
+        self.sf = False
+        self.tune_at = None # when the running tune finishes
+        self.seek_from = None # (start time, start channel, up) of the running seek
+        self.tuned_at = now()
+        self.rds_read = -1 # last RDS group index handed out
+
+    # the band set in TUNING
+    def band_range(self):
+        tuning = self.regs[0x03]
+        band = tuning >> 2 & 3
+        low, high = self.BANDS[band]
+        if band == 3 and not self.regs[0x07] & 0x0200: # 65M_50M mode bit clear, east band starts at 50 MHz
+            low = 50.0
+        return low, self.SPACINGS[tuning & 3], high
+
+    def channel_count(self):
+        low, spacing, high = self.band_range()
+        return int(round((high - low) / spacing)) + 1
+
+    def frequency(self, channel):
+        low, spacing, high = self.band_range()
+        return low + channel * spacing
+
+    def station(self, channel):
+        freq = self.frequency(channel)
+        spacing = self.band_range()[1]
+        for f in self.stations:
+            if abs(f - freq) < spacing / 2:
+                return self.stations[f]
+        return None
+
+    def rssi(self, channel):
+        station = self.station(channel)
+        return self.NOISE_RSSI if station is None else station[0]
+
+    # bring the state machine up to date with the clock
+    def advance(self):
+        t = now()
+        if self.tune_at is not None and t >= self.tune_at:
+            self.tune_at = None
+            self.stc = True
+            self.regs[0x03] &= ~0x0010 # TUNE clears itself
+            self.tuned_at = t
+            self.rds_read = -1
+        if self.seek_from is not None:
+            started, start, up = self.seek_from
+            count = self.channel_count()
+            threshold = self.regs[0x05] >> 8 & 0x7F # SEEKTH
+            wrap = not self.regs[0x02] & 0x0080 # SKMODE clear = wrap at the band edge
+            steps = int((t - started) / self.SEEK_STEP_S)
+            channel = start
+            for step in range(1, steps + 1):
+                channel += 1 if up else -1
+                if not 0 <= channel < count:
+                    if not wrap:
+                        channel = count - 1 if up else 0
+                        self.seek_done(channel, True, started + step * self.SEEK_STEP_S)
+                        return
+                    channel %= count
+                if channel == start: # all the way round without a hit
+                    self.seek_done(channel, True, started + step * self.SEEK_STEP_S)
+                    return
+                if self.station(channel) is not None and self.rssi(channel) >= threshold:
+                    self.seek_done(channel, False, started + step * self.SEEK_STEP_S)
+                    return
+            self.channel = channel % count
+
+    def seek_done(self, channel, failed, t):
+        self.seek_from = None
+        self.channel = channel
+        self.stc = True
+        self.sf = failed
+        self.regs[0x02] &= ~0x0100 # SEEK clears itself
+        self.regs[0x03] = (self.regs[0x03] & 0x003F) | channel << 6
+        self.tuned_at = t
+        self.rds_read = -1
+
+    def write_reg(self, reg, value):
+        old = self.regs[reg]
+        self.regs[reg] = value
+        if reg == 0x02:
+            if value & 0x0002: # soft reset
+                self.reset()
+                self.regs[0x02] = value & ~0x0002
+                return
+            if value & 0x0100 and not old & 0x0100: # SEEK went high
+                self.advance()
+                self.tune_at = None
+                self.stc = False
+                self.sf = False
+                self.seek_from = (now(), self.channel, bool(value & 0x0200))
+            elif not value & 0x0100 and self.seek_from is not None: # seek stopped by hand, stays where it got to
+                self.advance()
+                self.seek_from = None
+        elif reg == 0x03 and value & 0x0010 and self.regs[0x02] & 0x0001:
+            self.seek_from = None
+            self.channel = min(value >> 6, self.channel_count() - 1)
+            self.stc = False
+            self.sf = False
+            self.tune_at = now() + self.TUNE_S
+
+    # RDS groups the tuned station is sending, in the order it sends them
+    def rds_groups(self, station):
+        pi = 0x1000 | (self.channel & 0x0FFF)
+        rssi, stereo, name, text = station
+        groups = []
+        if name:
+            name = (name + " " * 8)[:8]
+            for offset in range(4):
+                groups.append((pi, 0x0000 | 0x0400 | offset, 0xE0CD,
+                    ord(name[offset * 2]) << 8 | ord(name[offset * 2 + 1])))
+        if text:
+            text = text + "\r" if len(text) < 64 else text[:64]
+            text += " " * (-len(text) % 4)
+            for offset in range(len(text) // 4):
+                chars = text[offset * 4:offset * 4 + 4]
+                groups.append((pi, 0x2000 | offset,
+                    ord(chars[0]) << 8 | ord(chars[1]), ord(chars[2]) << 8 | ord(chars[3])))
+        if name:
+            # 4A clock time, sent once a minute on air. here once per cycle, the host's UTC date and time
+            utc = time.gmtime()
+            mjd = (datetime.date(utc.tm_year, utc.tm_mon, utc.tm_mday) - datetime.date(1858, 11, 17)).days
+            groups.append((pi, 0x4000 | mjd >> 15, (mjd & 0x7FFF) << 1 | utc.tm_hour >> 4,
+                (utc.tm_hour & 0x0F) << 12 | utc.tm_min << 6))
+        return groups
+
+    def rds_group(self): # (index, blocks) of the group on air right now, or None
+        if not self.regs[0x02] & 0x0008 or self.seek_from is not None or self.tune_at is not None:
+            return None
+        station = self.station(self.channel)
+        if station is None:
+            return None
+        groups = self.rds_groups(station)
+        if not groups:
+            return None
+        index = int((now() - self.tuned_at) / self.GROUP_S)
+        if index < 1: # the decoder needs a full group after tuning
+            return None
+        return index, groups[index % len(groups)]
+
+    def status_words(self):
+        self.advance()
+        channel = self.channel
+        station = self.station(channel)
+        busy = self.seek_from is not None or self.tune_at is not None
+        status = channel & 0x03FF
+        rssi = self.rssi(channel) << 9
+        blocks = (0, 0, 0, 0)
+        if self.stc:
+            status |= 0x4000
+        if self.sf:
+            status |= 0x2000
+        if station is not None and not busy:
+            rssi |= 0x0100 | 0x0080 # FM_TRUE, FM_READY
+            if station[1] and not self.regs[0x02] & 0x2000: # stereo and not forced mono
+                status |= 0x0400
+            group = self.rds_group()
+            if group is not None:
+                index, blocks = group
+                status |= 0x1000 # RDSS, synchronized
+                if index != self.rds_read:
+                    status |= 0x8000 # RDSR
+        return [status, rssi] + list(blocks)
+
+    def i2c_write(self, addr, data):
+        self.writes += 1
+        if addr == 0x11:
+            if not data:
+                return
+            reg = data[0] & 0x3F
+            self.ptr = reg
+            data = data[1:]
+        else:
+            reg = 0x02
+        for i in range(0, len(data) - 1, 2):
+            self.write_reg(reg, data[i] << 8 | data[i + 1])
+            reg = (reg + 1) & 0x3F
+
+    def i2c_read(self, addr, nbytes):
+        self.reads += 1
+        reg = self.ptr if addr == 0x11 else 0x0A
+        words = self.status_words()
+        out = bytearray()
+        while len(out) < nbytes:
+            if 0x0A <= reg <= 0x0F:
+                value = words[reg - 0x0A]
+            else:
+                value = self.regs[reg]
+            out.append(value >> 8)
+            out.append(value & 0xFF)
+            reg = (reg + 1) & 0x3F
+        if addr == 0x10 or self.ptr <= 0x0A:
+            group = self.rds_group() # reading STATUS hands the group over, RDSR drops until the next one
+            if group is not None:
+                self.rds_read = group[0]
+        return bytes(out[:nbytes])
+
+
+class DS3231:
+    # timekeeping registers 0x00-0x06 in BCD, two alarms, control/status, temperature.
+    # the time runs off now(), writing the seconds register restarts the second like the chip's
+    # countdown chain. INT/SQW is open drain, int_level() is what the pin reads.
+    addresses = (0x68,)
+    TEMPERATURE = 25.25
+
+    def __init__(self, start=None):
+        self.regs = bytearray(0x13)
+        self.regs[0x0E] = 0x1C # INTCN, RS=8.192 kHz
+        self.regs[0x0F] = 0x88 # OSF (it never ran before), EN32kHz
+        self.ptr = 0
+        self.reads = 0
+        self.writes = 0
+        if start is None:
+            start = datetime.datetime.now().replace(microsecond=0)
+        self.set_time(start)
+        msb = int(self.TEMPERATURE // 1)
+        self.regs[0x11] = msb & 0xFF
+        self.regs[0x12] = int((self.TEMPERATURE - msb) * 4) << 6
+
+    def set_time(self, when, weekday=None):
+        self.base = when
+        self.base_at = now()
+        self.weekday = weekday if weekday is not None else when.isoweekday() # register value, 1-7, any day can be 1
+        self.checked = self.seconds() # alarms are only matched going forward from here
+
+    def seconds(self): # whole seconds since 2000-01-01 right now
+        return int((self.base - EPOCH).total_seconds() + (now() - self.base_at))
+
+    def time_registers(self):
+        s = self.seconds()
+        when = EPOCH + datetime.timedelta(seconds=s)
+        days = (when.date() - self.base.date()).days
+        weekday = (self.weekday - 1 + days) % 7 + 1
+        hour = self.regs[0x02]
+        if hour & 0x40: # 12 hour mode, bit 5 is PM
+            h = when.hour % 12 or 12
+            hour = 0x40 | (0x20 if when.hour >= 12 else 0) | bcd(h)
+        else:
+            hour = bcd(when.hour)
+        century = 0x80 if when.year >= 2100 else 0
+        return bytes((bcd(when.second), bcd(when.minute), hour, weekday,
+            bcd(when.day), century | bcd(when.month), bcd(when.year % 100)))
+
+    def write_time(self, image):
+        hour = image[2]
+        if hour & 0x40:
+            h = unbcd(hour & 0x1F) % 12 + (12 if hour & 0x20 else 0)
+        else:
+            h = unbcd(hour & 0x3F)
+        try:
+            when = datetime.datetime(2000 + unbcd(image[6]), unbcd(image[5] & 0x1F), unbcd(image[4] & 0x3F),
+                h, unbcd(image[1] & 0x7F), unbcd(image[0] & 0x7F))
+        except ValueError: # the chip would count on from garbage, keep the old time
+            return
+        self.regs[0x02] = hour & 0x40
+        self.set_time(when, (image[3] & 0x07) or 1)
+
+    # the first second after `after` (exclusive) that an alarm's registers match, None if never
+    def alarm_next(self, after, first, seconds):
+        regs = self.regs
+        if seconds:
+            sec_reg, min_reg, hour_reg, day_reg = regs[first:first + 4]
+        else:
+            sec_reg = 0x00 # alarm 2 matches at second 00
+            min_reg, hour_reg, day_reg = regs[first:first + 3]
+        masks = (sec_reg >> 7, min_reg >> 7, hour_reg >> 7, day_reg >> 7)
+        if not seconds:
+            masks = (0,) + masks[1:]
+            if masks == (0, 1, 1, 1): # A2M2-4 set, once per minute
+                return after + 60 - after % 60
+        if masks == (1, 1, 1, 1):
+            return after + 1
+        sec = unbcd(sec_reg & 0x7F)
+        minute = unbcd(min_reg & 0x7F)
+        if hour_reg & 0x40:
+            hour = unbcd(hour_reg & 0x1F) % 12 + (12 if hour_reg & 0x20 else 0)
+        else:
+            hour = unbcd(hour_reg & 0x3F)
+        for period, offset, mask in ((60, sec, (0, 1, 1, 1)), (3600, minute * 60 + sec, (0, 0, 1, 1)),
+                (86400, hour * 3600 + minute * 60 + sec, (0, 0, 0, 1))):
+            if masks == mask:
+                t = after - after % period + offset
+                return t if t > after else t + period
+        if masks != (0, 0, 0, 0):
+            return None # mask combination the datasheet doesn't define
+        offset = hour * 3600 + minute * 60 + sec
+        target = unbcd(day_reg & 0x3F)
+        start = after - after % 86400
+        base_day = (self.base - EPOCH).days
+        for day in range(start // 86400, start // 86400 + 400):
+            t = day * 86400 + offset
+            if t <= after:
+                continue
+            when = EPOCH + datetime.timedelta(days=day)
+            if day_reg & 0x40: # DY, match the weekday register
+                if (self.weekday - 1 + day - base_day) % 7 + 1 == target:
+                    return t
+            elif when.day == target:
+                return t
+        return None
+
+    def update_flags(self): # latch A1F/A2F for every match since the last look
+        s = self.seconds()
+        if s <= self.checked:
+            return
+        t = self.alarm_next(self.checked, 0x07, True)
+        if t is not None and t <= s:
+            self.regs[0x0F] |= 0x01
+        t = self.alarm_next(self.checked, 0x0B, False)
+        if t is not None and t <= s:
+            self.regs[0x0F] |= 0x02
+        self.checked = s
+
+    def int_level(self):
+        control = self.regs[0x0E]
+        if not control & 0x04: # INTCN clear, square wave. the second rolls over on the falling edge
+            phase = ((now() - self.base_at) * (1, 1024, 4096, 8192)[control >> 3 & 3]) % 1
+            return 0 if phase < 0.5 else 1
+        self.update_flags()
+        status = self.regs[0x0F]
+        if status & control & 0x03: # an enabled alarm flag pulls INT low
+            return 0
+        return 1
+
+    def int_poll_s(self): # how long until INT/SQW might change, for the board's pin thread
+        if not self.regs[0x0E] & 0x04 and not self.regs[0x0E] & 0x18:
+            half = (now() - self.base_at) % 0.5
+            return max(0.001, 0.5 - half)
+        return 0.02
+
+    def i2c_write(self, addr, data):
+        self.writes += 1
+        if not data:
+            return
+        self.ptr = data[0] % 0x13
+        data = data[1:]
+        if not data:
+            return
+        self.update_flags()
+        time_image = None
+        for value in data:
+            reg = self.ptr
+            if reg <= 0x06:
+                if time_image is None:
+                    time_image = bytearray(self.time_registers())
+                time_image[reg] = value
+            elif reg == 0x0F: # OSF/A2F/A1F can only be cleared, EN32kHz is read/write
+                self.regs[0x0F] = (self.regs[0x0F] & value & 0x83) | (value & 0x08)
+            elif reg < 0x11: # temperature is read only
+                self.regs[reg] = value
+            self.ptr = (reg + 1) % 0x13
+        if time_image is not None:
+            self.write_time(time_image)
+
+    def i2c_read(self, addr, nbytes):
+        self.reads += 1
+        self.update_flags()
+        time_image = self.time_registers() # the chip copies the time to a buffer when the read starts
+        out = bytearray()
+        for i in range(nbytes):
+            reg = self.ptr
+            out.append(time_image[reg] if reg <= 0x06 else self.regs[reg])
+            self.ptr = (reg + 1) % 0x13
+        return bytes(out)
+
+
+class SSD1306:
+    # the 1.3" panel's SH1106 style controller: 132 x 64 of RAM written a page at a time, the
+    # visible 128 columns start at COLUMN_OFFSET. commands are decoded with their argument bytes,
+    # data lands at the page/column pointer, which then steps right. on SPI it listens while CS is
+    # low and takes DC high as data, on I2C the control bytes say which is which.
+    addresses = (0x3C,)
+    WIDTH = 128
+    HEIGHT = 64
+    RAM_COLUMNS = 132
+    COLUMN_OFFSET = 2
+    ARGS = {0x81: 1, 0xA8: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1, 0xDA: 1, 0xDB: 1, 0x8D: 1, 0xAD: 1, 0x20: 1,
+        0x21: 2, 0x22: 2, 0xA3: 2, 0x26: 6, 0x27: 6, 0x29: 5, 0x2A: 5}
+
+    def __init__(self, cs=None, dc=None, res=None):
+        self.cs = cs
+        self.dc = dc
+        self.res = res
+        self.ram = [bytearray(self.RAM_COLUMNS) for page in range(8)]
+        self.page = 0
+        self.column = 0
+        self.on = False
+        self.inverted = False
+        self.entire_on = False
+        self.contrast = 0x80
+        self.settings = {} # last arguments of the multi byte commands, by command
+        self.pending = None # command still waiting for its arguments
+        self.args = []
+        self.commands = 0
+        self.data_bytes = 0
+        self.frames = 0 # data writes that started at column 0 of page 0 + offset, roughly full frames
+        self.version = 0 # bumped on every change to what is shown
+
+    def spi_write(self, data):
+        if self.cs is not None and self.cs.level:
+            return
+        if self.res is not None and not self.res.level: # held in reset
+            return
+        if self.dc is not None and self.dc.level:
+            self.write_data(data)
+        else:
+            for byte in data:
+                self.command(byte)
+
+    def i2c_write(self, addr, data):
+        i = 0
+        while i < len(data):
+            control = data[i]
+            i += 1
+            if control & 0x80: # Co, one byte then another control byte
+                if i < len(data):
+                    if control & 0x40:
+                        self.write_data(data[i:i + 1])
+                    else:
+                        self.command(data[i])
+                i += 1
+            else: # the rest of the transfer
+                if control & 0x40:
+                    self.write_data(data[i:])
+                else:
+                    for byte in data[i:]:
+                        self.command(byte)
+                return
+
+    def i2c_read(self, addr, nbytes): # status byte, bit 6 is display off
+        return bytes([0x00 if self.on else 0x40]) * nbytes
+
+    def command(self, byte):
+        self.commands += 1
+        if self.pending is not None:
+            self.args.append(byte)
+            if len(self.args) == self.ARGS[self.pending]:
+                self.settings[self.pending] = tuple(self.args)
+                if self.pending == 0x81:
+                    self.contrast = byte
+                self.pending = None
+            return
+        if byte in self.ARGS:
+            self.pending = byte
+            self.args = []
+        elif byte <= 0x0F:
+            self.column = (self.column & 0xF0) | byte
+        elif byte <= 0x1F:
+            self.column = (self.column & 0x0F) | (byte & 0x0F) << 4
+        elif 0xB0 <= byte <= 0xB7:
+            self.page = byte & 0x07
+        elif byte in (0xAE, 0xAF):
+            self.on = bool(byte & 1)
+            self.version += 1
+        elif byte in (0xA6, 0xA7):
+            self.inverted = bool(byte & 1)
+            self.version += 1
+        elif byte in (0xA4, 0xA5):
+            self.entire_on = bool(byte & 1)
+            self.version += 1
+        else: # start line, segment remap, COM direction... kept, the image stays in the driver's coordinates
+            self.settings[byte & 0xF0 if 0x40 <= byte <= 0x7F else byte] = (byte,)
+
+    def write_data(self, data):
+        if self.page == 0 and self.column == self.COLUMN_OFFSET and len(data) >= self.WIDTH:
+            self.frames += 1
+        row = self.ram[self.page]
+        column = self.column
+        n = min(len(data), self.RAM_COLUMNS - column) # the column pointer stops at the end of the page
+        if n > 0:
+            row[column:column + n] = bytes(data[:n])
+            self.column = column + n
+            self.version += 1
+        self.data_bytes += len(data)
+
+    def pixel(self, x, y):
+        if not self.on:
+            return 0
+        if self.entire_on:
+            return 1
+        bit = self.ram[y >> 3][x + self.COLUMN_OFFSET] >> (y & 7) & 1
+        return bit ^ self.inverted
+
+    def framebuffer(self): # visible RAM in MONO_VLSB order, compares byte for byte with the driver's buffer
+        return b"".join(bytes(page[self.COLUMN_OFFSET:self.COLUMN_OFFSET + self.WIDTH]) for page in self.ram)
+
+    def to_text(self): # two pixel rows per line with half blocks
+        lines = []
+        for y in range(0, self.HEIGHT, 2):
+            line = []
+            for x in range(self.WIDTH):
+                top = self.pixel(x, y)
+                bottom = self.pixel(x, y + 1)
+                line.append(" ▄▀█"[top << 1 | bottom])
+            lines.append("".join(line).rstrip())
+        return "\n".join(lines)
+
+    def to_pbm(self): # binary PBM, 1 is black so lit pixels are flipped to show white on black
+        rows = []
+        for y in range(self.HEIGHT):
+            row = bytearray(self.WIDTH // 8)
+            for x in range(self.WIDTH):
+                if not self.pixel(x, y):
+                    row[x >> 3] |= 0x80 >> (x & 7)
+            rows.append(bytes(row))
+        return b"P4\n%d %d\n" % (self.WIDTH, self.HEIGHT) + b"".join(rows)
@@ -0,0 +1,137 @@
+# framebuf for CPython, MONO_VLSB only (what the SSD1306 driver and font.py use).
+# pixel for pixel the same layout as MicroPython's: one byte is 8 vertical pixels,
+# bytes run left to right along a page. text uses a 5x7 font in the 8x8 cell.
+
+MONO_VLSB = 0
+
+# ASCII 0x20-0x7E, 5 columns each, bit 0 at the top
+FONT_5X7 = bytes.fromhex(
+    "0000000000" "00005f0000" "0007000700" "147f147f14" "242a7f2a12" "2313086462" "3649562050" "0008070300"
+    "001c224100" "0041221c00" "2a1c7f1c2a" "08083e0808" "0080703000" "0808080808" "0000606000" "2010080402"
+    "3e5149453e" "00427f4000" "7249494946" "21414d4d33" "1814127f10" "2745454539" "3c4a494931" "4121110907"
+    "3649494936" "464949291e" "0000140000" "0040340000" "0008142241" "1414141414" "0041221408" "0201590906"
+    "3e415d594e" "7c1211127c" "7f49494936" "3e41414122" "7f4141413e" "7f49494941" "7f09090901" "3e41415173"
+    "7f0808087f" "00417f4100" "2040413f01" "7f08142241" "7f40404040" "7f021c027f" "7f0408107f" "3e4141413e"
+    "7f09090906" "3e4151215e" "7f09192946" "2649494932" "03017f0103" "3f4040403f" "1f2040201f" "3f4038403f"
+    "6314081463" "0304780403" "6159494d43" "007f414141" "0204081020" "004141417f" "0402010204" "4040404040"
+    "0003070800" "2054547840" "7f28444438" "3844444428" "384444287f" "3854545418" "00087e0902" "18a4a49c78"
+    "7f08040478" "00447d4000" "2040403d00" "7f10284400" "00417f4000" "7c04780478" "7c08040478" "3844444438"
+    "fc18242418" "18242418fc" "7c08040408" "4854545424" "04043f4424" "3c4040207c" "1c2040201c" "3c4030403c"
+    "4428102844" "4c9090907c" "4464544c44" "0008364100" "0000770000" "0041360800" "0201020402"
+)
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format=MONO_VLSB, stride=None):
+        if format != MONO_VLSB:
+            raise ValueError("only MONO_VLSB is simulated")
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        i = (y >> 3) * self.width + x
+        mask = 1 << (y & 7)
+        if c is None:
+            return 1 if self.buffer[i] & mask else 0
+        if c:
+            self.buffer[i] |= mask
+        else:
+            self.buffer[i] &= ~mask & 0xFF
+
+    def fill(self, c):
+        v = 0xFF if c else 0
+        buf = self.buffer
+        for i in range(self.width * ((self.height + 7) >> 3)):
+            buf[i] = v
+
+    def fill_rect(self, x, y, w, h, c):
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = min(self.width, x + w)
+        y1 = min(self.height, y + h)
+        buf = self.buffer
+        width = self.width
+        for yy in range(y0, y1):
+            row = (yy >> 3) * width
+            mask = 1 << (yy & 7)
+            if c:
+                for xx in range(x0, x1):
+                    buf[row + xx] |= mask
+            else:
+                inv = ~mask & 0xFF
+                for xx in range(x0, x1):
+                    buf[row + xx] &= inv
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.fill_rect(x, y, w, 1, c)
+        self.fill_rect(x, y + h - 1, w, 1, c)
+        self.fill_rect(x, y, 1, h, c)
+        self.fill_rect(x + w - 1, y, 1, h, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self.pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def text(self, s, x, y, c=1):
+        for n, ch in enumerate(s):
+            code = ord(ch)
+            if not 0x20 <= code <= 0x7E:
+                code = 0x7E # unknown characters draw as '~'
+            glyph = FONT_5X7[(code - 0x20) * 5:(code - 0x20) * 5 + 5]
+            cx = x + n * 8 + 1
+            for col in range(5):
+                bits = glyph[col]
+                for row in range(8):
+                    if bits >> row & 1:
+                        self.pixel(cx + col, y + row, c)
+
+    def scroll(self, xstep, ystep):
+        old = bytes(self.buffer)
+        src = FrameBuffer(bytearray(old), self.width, self.height)
+        for yy in range(self.height):
+            for xx in range(self.width):
+                sx = xx - xstep
+                sy = yy - ystep
+                if 0 <= sx < self.width and 0 <= sy < self.height:
+                    self.pixel(xx, yy, src.pixel(sx, sy))
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for yy in range(fbuf.height):
+            ty = y + yy
+            if not 0 <= ty < self.height:
+                continue
+            for xx in range(fbuf.width):
+                tx = x + xx
+                if not 0 <= tx < self.width:
+                    continue
+                p = fbuf.pixel(xx, yy)
+                if palette is not None:
+                    p = palette.pixel(p, 0)
+                if p != key:
+                    self.pixel(tx, ty, p)
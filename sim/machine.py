@@ -0,0 +1,223 @@
+# machine for CPython. Pin, SPI and I2C objects are thin handles onto the simulated board
+# (sim.board), so two Pin(20) objects see the same level and devices on a bus see every transfer.
+# Timers run on threads, their callbacks are the simulated interrupts.
+import threading
+import time
+
+from . import board as _board
+
+
+def board():
+    return _board.current
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.state = board().pin(id)
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1 and mode is not None:
+            self.state.mode = mode
+        if pull != -1 and pull is not None:
+            self.state.pull = pull
+            if pull == Pin.PULL_UP and self.state.driver is None and self.state.mode == Pin.IN:
+                self.state.level = 1
+        if value is not None:
+            self.state.set(1 if value else 0)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self.state.level
+        self.state.set(1 if value else 0)
+
+    def on(self):
+        self.state.set(1)
+
+    def off(self):
+        self.state.set(0)
+
+    def toggle(self):
+        self.state.set(self.state.level ^ 1)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self.state.handler = handler
+        self.state.trigger = trigger
+        self.state.handler_pin = self
+
+    def __repr__(self):
+        return "Pin({})".format(self.id)
+
+
+class SPI:
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.bus = board().spi(id)
+        self.init(baudrate=baudrate, polarity=polarity, phase=phase)
+
+    def init(self, baudrate=1000000, polarity=0, phase=0, bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+        self.bus.baudrate = baudrate
+        self.bus.inits += 1
+
+    def deinit(self):
+        pass
+
+    def write(self, buf):
+        self.bus.write(bytes(buf))
+
+    def read(self, nbytes, write=0x00):
+        return bytes([write]) * nbytes # nothing on the sim boards drives MISO
+
+    def readinto(self, buf, write=0x00):
+        for i in range(len(buf)):
+            buf[i] = write
+
+    def write_readinto(self, write_buf, read_buf):
+        self.bus.write(bytes(write_buf))
+        for i in range(len(read_buf)):
+            read_buf[i] = 0
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000, timeout=50000):
+        self.id = id
+        self.bus = board().i2c(id)
+        self.bus.freq = freq
+
+    def init(self, scl=None, sda=None, freq=400000):
+        self.bus.freq = freq
+
+    def scan(self):
+        return sorted(self.bus.devices)
+
+    def writeto(self, addr, buf, stop=True):
+        self.bus.device(addr).i2c_write(addr, bytes(buf))
+        return len(buf)
+
+    def writevto(self, addr, vector, stop=True):
+        data = b"".join(bytes(v) for v in vector)
+        self.bus.device(addr).i2c_write(addr, data)
+        return len(data)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(self.bus.device(addr).i2c_read(addr, nbytes))
+
+    def readfrom_into(self, addr, buf, stop=True):
+        data = self.bus.device(addr).i2c_read(addr, len(buf))
+        buf[:len(data)] = data
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self.bus.device(addr).i2c_write(addr, bytes([memaddr]) + bytes(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        device = self.bus.device(addr)
+        device.i2c_write(addr, bytes([memaddr]))
+        return bytes(device.i2c_read(addr, nbytes))
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        data = self.readfrom_mem(addr, memaddr, len(buf))
+        buf[:len(data)] = data
+
+
+SoftI2C = I2C
+SoftSPI = SPI
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.thread = None
+        self.stop = None
+        if callback is not None:
+            self.init(mode=mode, period=period, freq=freq, callback=callback)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None, tick_hz=1000):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+        if period < 0 or callback is None:
+            return
+        stop = threading.Event()
+        self.stop = stop
+
+        def run():
+            next_at = time.monotonic() + period / 1000
+            while not stop.wait(max(0, next_at - time.monotonic())):
+                if board().halted:
+                    return
+                with _board.irq_lock:
+                    callback(self)
+                if mode == Timer.ONE_SHOT:
+                    return
+                next_at += period / 1000
+
+        self.thread = threading.Thread(target=run, daemon=True, name="sim-timer")
+        self.thread.start()
+
+    def deinit(self):
+        if self.stop is not None:
+            self.stop.set()
+            self.stop = None
+
+
+class RTC: # the pico's own RTC, follows the host clock
+    def __init__(self):
+        self.offset = 0
+
+    def datetime(self, datetimetuple=None):
+        if datetimetuple is None:
+            t = time.localtime(time.time() + self.offset)
+            return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+        year, month, day, weekday, hour, minute, second = datetimetuple[:7]
+        target = time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+        self.offset = target - time.time()
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        pass
+
+    def feed(self):
+        pass
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def unique_id():
+    return b"\xe6\x61\x41\x04\x03\x5e\x2b\x2c"
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def soft_reset():
+    raise SystemExit("machine.soft_reset()")
+
+
+def idle():
+    time.sleep(0.001)
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
@@ -0,0 +1,63 @@
+# micropython module for CPython. schedule() hands callbacks to one scheduler thread that runs
+# them in order, the same "soon, one at a time, not inside the IRQ" the firmware relies on, and
+# refuses them with RuntimeError once SCHEDULE_DEPTH are waiting like the real queue does.
+import queue
+import threading
+
+SCHEDULE_DEPTH = 8 # MICROPY_SCHEDULER_DEPTH on the rp2 port
+
+_pending = queue.Queue(SCHEDULE_DEPTH)
+_runner = None
+
+
+def const(value):
+    return value
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def _run():
+    from . import board
+    while True:
+        func, arg = _pending.get()
+        with board.irq_lock:
+            try:
+                func(arg)
+            except Exception as e:
+                print("scheduled callback failed:", repr(e))
+
+
+def schedule(func, arg):
+    global _runner
+    if _runner is None:
+        _runner = threading.Thread(target=_run, daemon=True, name="sim-schedule")
+        _runner.start()
+    try:
+        _pending.put_nowait((func, arg))
+    except queue.Full:
+        raise RuntimeError("schedule queue full")
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=False):
+    print("stack: n/a (simulated)")
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def opt_level(level=None):
+    return 0
@@ -0,0 +1,46 @@
+# network for CPython. the pico W's access point is the host's own network stack, sockets are
+# CPython's, so the web app serves on the host (see webapp.HTTP_PORT).
+AP_IF = 1
+STA_IF = 0
+STAT_GOT_IP = 3
+
+AP_ADDRESS = ("127.0.0.1", "255.255.255.0", "127.0.0.1", "127.0.0.1")
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self.settings = {}
+        self.up = False
+
+    def active(self, active=None):
+        if active is None:
+            return self.up
+        self.up = bool(active)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self.settings.get(args[0])
+        self.settings.update(kwargs)
+
+    def isconnected(self): # an AP counts as connected as soon as it is up
+        return self.up
+
+    def status(self, param=None):
+        return STAT_GOT_IP if self.up else 0
+
+    def ifconfig(self, config=None):
+        return AP_ADDRESS
+
+    def connect(self, ssid=None, key=None, **kwargs):
+        self.up = True
+
+    def disconnect(self):
+        self.up = False
+
+    def scan(self):
+        return []
+
+
+def hostname(name=None):
+    return "alarm"
@@ -0,0 +1,2 @@
+# ujson for CPython
+from json import dump, dumps, load, loads
@@ -23,6 +23,27 @@ SET_DISP_CLK_DIV = const(0xD5)
 SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
+SET_PAGE_START = const(0xB0)
+SET_LOW_COLUMN = const(0x00)
+SET_HIGH_COLUMN = const(0x10)
+
+# the 1.3" panel is an SH1106 style controller with 132 columns of RAM, the
+# visible 128 start at column 2.
+COLUMN_OFFSET = const(2)
+
+# last driver to configure each SPI bus, keyed by id(spi). only consulted for
+# displays created with shared_bus=True.
+_spi_owner = {}
+
+
+def claim_spi(spi, owner):
+    # mark owner as the last user of spi, returns True if it has to re-init
+    key = id(spi)
+    if _spi_owner.get(key) is owner:
+        return False
+    _spi_owner[key] = owner
+    return True
+
 
 # Subclassing FrameBuffer provides support for graphics primitives
 # http://docs.micropython.org/en/latest/pyboard/library/framebuf.html
@@ -33,11 +54,18 @@ class SSD1306(framebuf.FrameBuffer):
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        # copy of what the panel RAM holds, so show() only sends what changed
+        self.shadow = bytearray(self.pages * self.width)
+        self.shadow_valid = False
+        self.frame_bytes = 0  # bytes (commands + data) sent by the last show()
+        self.page_cmd = bytearray(3)
+        view = memoryview(self.buffer)
+        self.page_views = [view[p * width:(p + 1) * width] for p in range(self.pages)]
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
         self.init_display()
 
     def init_display(self):
-        for cmd in (
+        self.write_cmds(bytes((
             SET_DISP,  # display off
             # address setting
             SET_MEM_ADDR,
@@ -70,11 +98,19 @@ class SSD1306(framebuf.FrameBuffer):
             SET_CHARGE_PUMP,
             0x10 if self.external_vcc else 0x14,
             SET_DISP | 0x01,  # display on
-        ):  # on
-            self.write_cmd(cmd)
+        )))
         self.fill(0)
         self.show()
 
+    def write_cmds(self, cmds):
+        for cmd in cmds:
+            self.write_cmd(cmd)
+
+    def write_span(self, cmds, buf):
+        # address commands followed by the pixel data they point at
+        self.write_cmds(cmds)
+        self.write_data(buf)
+
     def poweroff(self):
         self.write_cmd(SET_DISP)
 
@@ -82,22 +118,53 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(SET_DISP | 0x01)
 
     def contrast(self, contrast):
-        self.write_cmd(SET_CONTRAST)
-        self.write_cmd(contrast)
+        self.write_cmds(bytes((SET_CONTRAST, contrast)))
 
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
     def rotate(self, rotate):
-        self.write_cmd(SET_COM_OUT_DIR | ((rotate & 1) << 3))
-        self.write_cmd(SET_SEG_REMAP | (rotate & 1))
-
-    def show(self):
-        for Page in range( 0, 8 ):
-            self.write_cmd( 0xB0 | ( Page & 0x0F ))
-            self.write_cmd( 0x02 )
-            self.write_cmd( 0x10 )
-            self.write_data( self.buffer[Page<<7:(Page<<7)+128] )
+        self.write_cmds(bytes((SET_COM_OUT_DIR | ((rotate & 1) << 3), SET_SEG_REMAP | (rotate & 1))))
+
+    def invalidate(self):
+        # forget what the panel holds, the next show() pushes the whole frame
+        self.shadow_valid = False
+
+    def show(self, full=False):
+        full = full or not self.shadow_valid
+        buf = self.buffer
+        shadow = self.shadow
+        view = memoryview(buf)
+        page_views = self.page_views
+        cmd = self.page_cmd
+        width = self.width
+        sent = 0
+        for page in range(self.pages):
+            start = page * width
+            end = start + width
+            if full:
+                lo = start
+                hi = end
+            else:
+                # narrow the page down to the span of columns that differ
+                lo = start
+                while lo < end and buf[lo] == shadow[lo]:
+                    lo += 1
+                if lo == end:
+                    continue
+                hi = end
+                while buf[hi - 1] == shadow[hi - 1]:
+                    hi -= 1
+            col = lo - start + COLUMN_OFFSET
+            cmd[0] = SET_PAGE_START | page
+            cmd[1] = SET_LOW_COLUMN | (col & 0x0F)
+            cmd[2] = SET_HIGH_COLUMN | (col >> 4)
+            span = page_views[page] if hi - lo == width else view[lo:hi]
+            self.write_span(cmd, span)
+            shadow[lo:hi] = span
+            sent += 3 + hi - lo
+        self.shadow_valid = True
+        self.frame_bytes = sent
 
 
 class SSD1306_I2C(SSD1306):
@@ -106,6 +173,11 @@ class SSD1306_I2C(SSD1306):
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b"\x40", None]  # Co=0, D/C#=1
+        self.cmd_list = [b"\x00", None]  # Co=0, D/C#=0, every byte is a command
+        # Co=1 control bytes let the page/column commands and the page data share
+        # one transaction: 0x80 cmd 0x80 cmd 0x80 cmd 0x40 data...
+        self.span_cmd = bytearray(b"\x80\x00\x80\x00\x80\x00")
+        self.span_list = [self.span_cmd, b"\x40", None]
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -113,20 +185,25 @@ class SSD1306_I2C(SSD1306):
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
 
+    def write_cmds(self, cmds):
+        self.cmd_list[1] = cmds
+        self.i2c.writevto(self.addr, self.cmd_list)
+
     def write_data(self, buf):
-        Page = 0
-        
-        for Page in range( 0, 8 ):
-            self.i2c.writeto_mem( 0x3C, 0x80, ( 0xB0 | ( Page & 0x0F ) ).to_bytes(1, 0 ))
-            self.i2c.writeto_mem( 0x3C, 0x80, b'\x02' )
-            self.i2c.writeto_mem( 0x3C, 0x80, b'\x10' )
-            buf1 = buf[Page<<7:(Page<<7)+128]
-            self.write_list[1] = buf1
-            
-            self.i2c.writevto( 0x3C, self.write_list )
+        self.write_list[1] = buf
+        self.i2c.writevto(self.addr, self.write_list)
+
+    def write_span(self, cmds, buf):
+        span_cmd = self.span_cmd
+        span_cmd[1] = cmds[0]
+        span_cmd[3] = cmds[1]
+        span_cmd[5] = cmds[2]
+        self.span_list[2] = buf
+        self.i2c.writevto(self.addr, self.span_list)
+
 
 class SSD1306_SPI(SSD1306):
-    def __init__(self, width, height, spi, dc, res, cs, external_vcc=False):
+    def __init__(self, width, height, spi, dc, res, cs, external_vcc=False, shared_bus=False):
         self.rate = 1 * 64 * 1024 #was 10*1024*1024
         dc.init(dc.OUT, value=0)
         res.init(res.OUT, value=0)
@@ -135,6 +212,12 @@ class SSD1306_SPI(SSD1306):
         self.dc = dc
         self.res = res
         self.cs = cs
+        # nothing else talks on the oled bus, so configure it once. if another
+        # driver shares it, it should call claim_spi() after reconfiguring.
+        self.shared_bus = shared_bus
+        self.cmd_buf = bytearray(1)
+        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        claim_spi(self.spi, self)
         import time
 
         self.res(1)
@@ -144,19 +227,27 @@ class SSD1306_SPI(SSD1306):
         self.res(1)
         super().__init__(width, height, external_vcc)
 
+    def claim_bus(self):
+        if self.shared_bus and claim_spi(self.spi, self):
+            self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+
     def write_cmd(self, cmd):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.cmd_buf[0] = cmd
+        self.write_cmds(self.cmd_buf)
+
+    def write_cmds(self, cmds):
+        # a whole command sequence goes out under one chip select
+        self.claim_bus()
         self.cs(1)
         self.dc(0)
         self.cs(0)
-        self.spi.write(bytearray([cmd]))
+        self.spi.write(cmds)
         self.cs(1)
 
     def write_data(self, buf):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.claim_bus()
         self.cs(1)
         self.dc(1)
         self.cs(0)
         self.spi.write(buf)
         self.cs(1)
-            
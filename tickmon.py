@@ -0,0 +1,125 @@
+# tick watchdog. every redraw's duration and, for the once a second ticks, how far the gap since
+# the previous tick was from the period go into fixed histograms. counts live in arrays and the
+# running sums are kept as whole seconds + microseconds so they stay small ints, recording a tick
+# allocates nothing. render() writes it all out in the Prometheus text format for /metrics.
+import time
+from array import array
+try:
+    from micropython import const
+except ImportError: # plain python, for the bench harness
+    const = lambda x: x
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError: # plain python
+    def ticks_us():
+        return int(time.monotonic() * 1000000)
+    def ticks_diff(a, b):
+        return a - b
+
+LATE_MS = const(250) # a tick this much later than the period counts as late, the next alarm check slipped
+
+# bucket upper bounds in us, +Inf is implied
+DURATION_BOUNDS_US = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000)
+JITTER_BOUNDS_US = (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+class Histogram:
+    def __init__(self, bounds_us):
+        self.bounds = array("L", bounds_us)
+        self.counts = array("L", [0] * (len(bounds_us) + 1)) # last one is +Inf
+        self.sum = array("L", [0, 0]) # whole seconds, microseconds
+        self.count = 0
+        self.max_us = 0
+
+    def add(self, us):
+        bounds = self.bounds
+        i = 0
+        n = len(bounds)
+        while i < n and us > bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        if us > self.max_us:
+            self.max_us = us
+        total = self.sum[1] + us
+        if total >= 1000000:
+            self.sum[0] += total // 1000000
+            total %= 1000000
+        self.sum[1] = total
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.sum[0] = 0
+        self.sum[1] = 0
+        self.count = 0
+        self.max_us = 0
+
+    def render(self, out, name, help_text):
+        out.append("# HELP {} {}".format(name, help_text))
+        out.append("# TYPE {} histogram".format(name))
+        cumulative = 0
+        for i in range(len(self.bounds)):
+            cumulative += self.counts[i]
+            out.append('{}_bucket{{le="{}"}} {}'.format(name, self.bounds[i] / 1000000, cumulative))
+        cumulative += self.counts[len(self.bounds)]
+        out.append('{}_bucket{{le="+Inf"}} {}'.format(name, cumulative))
+        out.append("{}_sum {}.{:06d}".format(name, self.sum[0], self.sum[1]))
+        out.append("{}_count {}".format(name, self.count))
+
+class TickMonitor:
+    def __init__(self, period_ms=1000):
+        self.period_us = period_ms * 1000
+        self.late_us = (period_ms + LATE_MS) * 1000
+        self.duration = Histogram(DURATION_BOUNDS_US) # every redraw, tick or button
+        self.jitter = Histogram(JITTER_BOUNDS_US) # |gap between ticks - period|, periodic ticks only
+        self.last_tick_us = None
+        self.ticks = 0
+        self.redraws = 0
+        self.overruns = 0 # redraws that took longer than a whole period
+        self.late = 0 # ticks that came more than LATE_MS after they were due
+
+    def record(self, start_us, end_us, periodic=True): # periodic is a once a second tick, not a button redraw
+        duration = ticks_diff(end_us, start_us)
+        self.duration.add(duration)
+        self.redraws += 1
+        if duration > self.period_us:
+            self.overruns += 1
+        if not periodic:
+            return
+        self.ticks += 1
+        last = self.last_tick_us
+        self.last_tick_us = start_us
+        if last is None:
+            return
+        interval = ticks_diff(start_us, last)
+        self.jitter.add(abs(interval - self.period_us))
+        if interval > self.late_us:
+            self.late += 1
+
+    def reset(self):
+        self.duration.reset()
+        self.jitter.reset()
+        self.last_tick_us = None
+        self.ticks = 0
+        self.redraws = 0
+        self.overruns = 0
+        self.late = 0
+
+    def render(self, out): # append the metric lines to out
+        self.duration.render(out, "clock_tick_duration_seconds", "Time spent redrawing, per tick or button redraw.")
+        self.jitter.render(out, "clock_tick_jitter_seconds", "Distance of the gap between periodic ticks from the tick period.")
+        counters = (
+            ("clock_ticks_total", "Periodic ticks run.", self.ticks),
+            ("clock_redraws_total", "Redraws run, ticks and button redraws.", self.redraws),
+            ("clock_tick_overruns_total", "Redraws that took longer than the tick period.", self.overruns),
+            ("clock_tick_late_total", "Periodic ticks that came more than {} ms late.".format(LATE_MS), self.late),
+        )
+        for name, help_text, value in counters:
+            out.append("# HELP {} {}".format(name, help_text))
+            out.append("# TYPE {} counter".format(name))
+            out.append("{} {}".format(name, value))
+        out.append("# HELP clock_tick_duration_max_seconds Longest redraw since boot.")
+        out.append("# TYPE clock_tick_duration_max_seconds gauge")
+        out.append("clock_tick_duration_max_seconds {}".format(self.duration.max_us / 1000000))
@@ -0,0 +1,148 @@
+# retained widgets for the OLED. every widget owns a box on the screen and remembers what it
+# last drew there, set() only marks it dirty when the value really changed, and a screen only
+# re-renders its dirty widgets. SSD1306.show() then sends just the columns that changed.
+import font
+
+CHAR_WIDTH = 8
+CHAR_HEIGHT = 8
+
+class Widget:
+    def __init__(self, x, y, w, h):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.value = None
+        self.dirty = True
+
+    def set(self, value):
+        if value != self.value:
+            self.value = value
+            self.dirty = True
+
+    def invalidate(self): # the screen under it was cleared, draw it again whatever the value
+        self.dirty = True
+
+    def render(self, fb): # clear the box and draw the current value into it
+        fb.fill_rect(self.x, self.y, self.w, self.h, 0)
+        if self.value is not None:
+            self.draw(fb)
+        self.dirty = False
+
+    def draw(self, fb):
+        pass
+
+class Text(Widget): # one line of text, chars wide
+    def __init__(self, x, y, chars, value=None):
+        super().__init__(x, y, chars * CHAR_WIDTH, CHAR_HEIGHT)
+        self.value = value
+
+    def draw(self, fb):
+        fb.text(self.value, self.x, self.y)
+
+class TimeDigits(Widget): # HH:MM(:SS)( AM) blitted from a font.Font, value is font.pack_time()
+    def __init__(self, x, y, glyphs, seconds=True, suffix=False):
+        cells = (8 if seconds else 5) + (3 if suffix else 0) # suffix leaves room for " AM"
+        super().__init__(x, y, cells * glyphs.w, glyphs.h)
+        self.font = glyphs
+        self.seconds = seconds
+        self.suffix = suffix
+        self.cells = bytearray(cells) # glyph index per cell
+        self.shown = bytearray(b"\xff" * cells) # what is on screen now, only changed cells are blitted
+
+    def invalidate(self):
+        self.dirty = True
+        for i in range(len(self.shown)):
+            self.shown[i] = 0xFF
+
+    def render(self, fb):
+        if self.value is None:
+            fb.fill_rect(self.x, self.y, self.w, self.h, 0)
+            self.invalidate()
+            self.dirty = False
+            return
+        self.dirty = False
+        hour, minute, second, half = font.unpack_time(self.value)
+        cells = self.cells
+        cells[0] = hour // 10
+        cells[1] = hour % 10
+        cells[2] = font.COLON
+        cells[3] = minute // 10
+        cells[4] = minute % 10
+        n = 5
+        if self.seconds:
+            cells[5] = font.COLON
+            cells[6] = second // 10
+            cells[7] = second % 10
+            n = 8
+        if self.suffix:
+            cells[n] = font.SPACE
+            if half == font.HALF_NONE:
+                cells[n + 1] = font.SPACE
+                cells[n + 2] = font.SPACE
+            else:
+                cells[n + 1] = font.GLYPH_A if half == font.HALF_AM else font.GLYPH_P
+                cells[n + 2] = font.GLYPH_M
+        glyphs = self.font.glyphs
+        shown = self.shown
+        w = self.font.w
+        for i in range(len(cells)):
+            if cells[i] != shown[i]:
+                fb.blit(glyphs[cells[i]], self.x + i * w, self.y)
+                shown[i] = cells[i]
+
+class SignalBars(Widget): # value is how many bars are filled, sorta like win7 wifi
+    def __init__(self, x, y, count, bar_width, height):
+        super().__init__(x, y, count * bar_width, height)
+        self.count = count
+        self.bar_width = bar_width
+
+    def draw(self, fb):
+        bars = max(0, min(self.count, self.value))
+        for i in range(self.count):
+            # height grows from smallest to largest
+            height = int((i + 1) / self.count * self.h)
+            xi = self.x + i * self.bar_width
+            yi = self.y + (self.h - height)
+            if i < bars:
+                fb.fill_rect(xi, yi, self.bar_width, height, 1) # filled bar
+            else:
+                fb.rect(xi, yi, self.bar_width, height, 1) # outline only
+
+class MenuBar(Widget): # button hints along the bottom, value is (labels, highlighted mask)
+    def __init__(self, y, positions, masks, line_height, width=128):
+        super().__init__(0, y - 2, width, line_height + 2) # room for the highlight lines above and below
+        self.text_y = y
+        self.positions = positions
+        self.masks = masks
+        self.line_height = line_height
+
+    def draw(self, fb):
+        labels, highlight = self.value
+        y = self.text_y
+        for i in range(len(labels)):
+            label = labels[i]
+            text_width = len(label) * CHAR_WIDTH
+            text_x = self.positions[i] - text_width // 2 # center the label at its button
+            fb.text(label, text_x, y)
+            if highlight == self.masks[i]: # last pressed button gets a line above and below
+                fb.hline(text_x, y - 2, text_width, 1)
+                fb.hline(text_x, y - 1 + self.line_height, text_width, 1)
+
+class Screen: # a set of widgets shown together, named so the code filling them in can reach them
+    def __init__(self, **widgets):
+        self.widgets = tuple(widgets.values())
+        for name in widgets:
+            setattr(self, name, widgets[name])
+
+    def render(self, fb, full=False): # full redraws everything, for when this screen was just switched to
+        if full:
+            fb.fill(0)
+        drawn = False
+        for widget in self.widgets:
+            if full:
+                widget.invalidate()
+            if widget.dirty:
+                widget.render(fb)
+                drawn = True
+        return drawn
@@ -128,6 +128,16 @@ class DS3231(_BaseRTC):
     def no_interrupt(self):
         return self._flag(self._CONTROL_REGISTER, 0b00000011, 0)
 
+    _SQUARE_WAVE_RATES = {1: 0b00000000, 1024: 0b00001000,
+                          4096: 0b00010000, 8192: 0b00011000}
+
+    def square_wave(self, frequency=1):
+        # INT/SQW carries a square wave instead of alarm interrupts, the
+        # alarm flags in the status register still latch.
+        control = self._register(self._SQUARE_WAVE_REGISTER) & 0b11100011
+        control |= self._SQUARE_WAVE_RATES[frequency]
+        self._register(self._SQUARE_WAVE_REGISTER, bytearray((control,)))
+
     def stop(self, value=None):
         return self._flag(self._CONTROL_REGISTER, 0b10000000, value)
 
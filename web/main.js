@@ -1,10 +1,13 @@
 /* GLOBAL VARIABLES */
 // display RTC time in web
 let startTime, startClient;
-let current = "{time}"; // will be overwritten if you fetch later
+let current = "00:00:00"; // overwritten by the time from /get_settings
 let alarmHour;
 let alarmMinute;
 let use24hr = true;        // control 12/24 display, default is 24h
+let clockTimer = null;     // local 1s redraw between server updates
+let liveSettings = {};     // everything the /events stream has told us so far
+let seekTimer = null;      // one pending re-check while a seek runs, however many updates arrive
 
 /* SWITCH BETWEEN MODES */
 function switchMainView(viewId) {
@@ -41,7 +44,7 @@ function updateClock() {
   document.getElementById("time").innerText = `${H}:${M}:${S}${suffix}`;
 }
 
-function setUpClockDisplay() { // runs every 5s
+function setUpClockDisplay() { // runs whenever a new server time arrives
   document.getElementById("clock_24hView").classList.add('active');
 
   let parts = current.trim().split(":").map(x=>parseInt(x,10));
@@ -53,7 +56,8 @@ function setUpClockDisplay() { // runs every 5s
   startTime = now.getTime();
   startClient = Date.now();
 
-  setInterval(updateClock,1000);
+  if (clockTimer === null) clockTimer = setInterval(updateClock,1000);
+  updateClock();
   updateSubviewVisibility(); //update subviews to prevent both 12/24h views visible
 }
 
@@ -129,15 +133,24 @@ function applySettings(settings) {
   // sync checkbox
   document.getElementById("format_toggle").checked = !use24hr;
 
+  if (settings.alarms_version !== undefined && settings.alarms_version !== alarmsVersion) {
+    alarmsVersion = settings.alarms_version;
+    getAlarms(); // something was added, removed, edited or went off
+  }
+
   // update radio display if present
   if (settings.radio_frequency !== undefined) {
     document.getElementById("radio_freq").innerText = settings.radio_frequency.toFixed(1);
     document.getElementById("radio_vol").innerText = settings.radio_volume;
+    if (settings.radio_seeking && seekTimer === null) {
+      // seek still running, check back for the new station
+      seekTimer = setTimeout(() => {
+        seekTimer = null;
+        getSettingsAndStartClock();
+      }, 500);
+    }
   }
 
-  // start clock update after everything is ready
-  setInterval(updateClock, 1000);
-
   // update subviews
   updateSubviewVisibility();
 }
@@ -152,6 +165,100 @@ function sendRadio(path) {
     .catch(err => console.error("Error:", err));
 }
 
+/* STATION LIST */
+function renderStations(data) {
+  document.getElementById("scan_status").innerText = data.scanning ? `(scanning ${data.progress}%)` : "";
+  const list = document.getElementById("station_list");
+  list.innerHTML = "";
+  data.stations.forEach((st, i) => {
+    const item = document.createElement("li");
+    item.innerText = `${st.freq.toFixed(1)} MHz ${st.name} (${st.rssi}${st.stereo ? ", stereo" : ""})`;
+    item.onclick = () => sendRadio(`/radio_station?i=${i}`);
+    list.appendChild(item);
+  });
+  if (data.scanning) {
+    setTimeout(getStations, 1000); // keep refreshing until the scan finishes
+  }
+}
+
+function getStations() {
+  fetch("/stations")
+    .then(response => response.json())
+    .then(renderStations)
+    .catch(err => console.error("Failed to fetch stations", err));
+}
+
+function startScan() {
+  fetch("/radio_scan")
+    .then(() => getStations())
+    .catch(err => console.error("Error:", err));
+}
+
+/* ALARM LIST */
+const DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"];
+let alarmsVersion;
+
+function formatHM(h, m) {
+  let suffix = "";
+  if (!use24hr) {
+    suffix = h < 12 ? " AM" : " PM";
+    h = h % 12 || 12;
+  }
+  return `${String(h).padStart(2,'0')}:${String(m).padStart(2,'0')}${suffix}`;
+}
+
+function formatDays(days) {
+  if (days === 0x7F) return "every day";
+  if (days === 0x1F) return "weekdays";
+  if (days === 0x60) return "weekends";
+  return DAY_NAMES.filter((_, i) => days >> i & 1).join(" ");
+}
+
+function renderAlarms(data) {
+  const list = document.getElementById("alarm_list");
+  list.innerHTML = "";
+  data.alarms.forEach(alarm => {
+    const item = document.createElement("li");
+    let text = `${formatHM(alarm.hour, alarm.minute)} ${formatDays(alarm.days)}`;
+    if (alarm.once) text += ", once";
+    if (alarm.freq !== null) text += `, ${alarm.freq.toFixed(1)} MHz`;
+    if (alarm.vol !== null) text += `, vol ${alarm.vol}`;
+    if (!alarm.enabled) text += " (off)";
+    item.innerText = text + " ";
+    const remove = document.createElement("button");
+    remove.innerText = "Delete";
+    remove.onclick = () => deleteAlarm(alarm.id);
+    item.appendChild(remove);
+    list.appendChild(item);
+  });
+}
+
+function getAlarms() {
+  fetch("/alarms")
+    .then(response => response.json())
+    .then(renderAlarms)
+    .catch(err => console.error("Failed to fetch alarms", err));
+}
+
+function deleteAlarm(id) {
+  fetch(`/alarm_delete?id=${id}`)
+    .then(() => getSettingsAndStartClock())
+    .catch(err => console.error("Error:", err));
+}
+
+function handleAlarmAdd(evt, form) {
+  evt.preventDefault();
+  const [h, m] = form.t.value.split(":").map(x=>parseInt(x,10));
+  let days = 0;
+  form.querySelectorAll("input[name=day]").forEach(box => { if (box.checked) days |= 1 << parseInt(box.value,10); });
+  const params = new URLSearchParams({h, m, days: days || 0x7F, once: form.once.checked ? 1 : 0});
+  if (form.freq.value) params.set("freq", form.freq.value);
+  if (form.vol.value) params.set("vol", form.vol.value);
+  fetch(`/alarm_add?${params.toString()}`)
+    .then(r=>r.ok?getSettingsAndStartClock():Promise.reject())
+    .catch(console.error);
+}
+
 function getSettingsAndStartClock() {
   fetch("/get_settings")
     .then(response => response.json())
@@ -163,19 +270,45 @@ function getSettingsAndStartClock() {
       console.error("Failed to fetch settings", err);
       // fallback to default
       setUpClockDisplay();
-      setInterval(updateClock, 1000);
     });
 }
 
 // event listeners
 //window.addEventListener("load", setUpClockDisplay);
 window.addEventListener("load", getSettingsAndStartClock);
+window.addEventListener("load", getStations);
 window.addEventListener("load", () => {
   const hash = window.location.hash.replace("#", "") || "TIME";
   openView(hash);
 });
 
-setInterval(getSettingsAndStartClock, 5000);  // every 5000 milliseconds = 5 seconds
+/* LIVE UPDATES */
+// the clock pushes only what changed (time each second, alarm, mode, radio) over server-sent events.
+// browsers without EventSource, or a dropped stream, fall back to polling /get_settings.
+let pollTimer = null;
+function startPolling() {
+  if (pollTimer === null) pollTimer = setInterval(getSettingsAndStartClock, 5000);  // every 5000 milliseconds = 5 seconds
+}
+
+function startEvents() {
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+  const source = new EventSource("/events");
+  source.onmessage = evt => {
+    Object.assign(liveSettings, JSON.parse(evt.data));
+    if (liveSettings.time !== undefined) applySettings(liveSettings);
+  };
+  source.onopen = () => {
+    if (pollTimer !== null) {
+      clearInterval(pollTimer);
+      pollTimer = null;
+    }
+  };
+  source.onerror = () => startPolling(); // EventSource reconnects by itself, poll meanwhile
+}
+window.addEventListener("load", startEvents);
 
 function setToSystemTime() {
     const now = new Date();
@@ -238,6 +371,9 @@ window.addEventListener("load",()=>{
   document.getElementById("time_form_12").  addEventListener("submit", e=>handleTimeSet(e,e.target));
   document.getElementById("alarm_form_24"). addEventListener("submit", e=>handleAlarmSet(e,e.target));
   document.getElementById("alarm_form_12"). addEventListener("submit", e=>handleAlarmSet(e,e.target));
+  document.getElementById("alarm_add_form").addEventListener("submit", e=>handleAlarmAdd(e,e.target));
+  document.getElementById("alarm_days").innerHTML = DAY_NAMES.map((name, i) =>
+    `<label><input type="checkbox" name="day" value="${i}"> ${name}</label>`).join(" ");
   document.getElementById("timer_form").    addEventListener("submit", e=>handleTimer(e,e.target));
   document.getElementById("timer_form_12"). addEventListener("submit", e=>handleTimer(e,e.target));
 });
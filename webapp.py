@@ -1,17 +1,45 @@
-import network
-import socket
 import time
-from clock import multifunction_clock
-import ujson # for settings parsing
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+try:
+    import ujson # for settings parsing
+except ImportError: # plain python, for running the server on a pc
+    import json as ujson
 
 VOLUME_MAX = 8  # Max volume level for the radio
-state = "off"
+MAX_CLIENTS = 4  # connections served at once, the rest get a 503
+MAX_EVENT_STREAMS = 2  # open /events streams, counted apart from MAX_CLIENTS. past this the page polls /get_settings
+READ_TIMEOUT_S = 5  # drop a client that stalls mid request
+IDLE_TIMEOUT_S = 15  # drop a keep-alive connection nobody uses
+STREAM_IDLE_TIMEOUT_S = 3  # and sooner while event streams hold sockets, so idle ones don't crowd out requests
+MAX_HEADERS = 32  # ignore anything past this many header lines
+TICK_MS = 1000  # display refresh period
+EVENT_POLL_MS = 10  # how often the tick task drains the clock's event queue
+EVENT_KEEPALIVE_S = 15  # comment line sent to idle event streams so dead clients get noticed
+HTTP_PORT = 80  # the simulator moves this off 80 so it can run without root
 debug = False  # Enable logging for debugging
+active_clients = 0
+event_streams = 0
 def debug_print(*args, **kwargs):
     if debug:
         print(*args, **kwargs)
 
+try:
+    ticks_ms = time.ticks_ms
+    ticks_add = time.ticks_add
+    ticks_diff = time.ticks_diff
+except AttributeError: # plain python
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+    def ticks_add(a, b):
+        return a + b
+    def ticks_diff(a, b):
+        return a - b
+
 def ap_setup(): 
+    import network
     ap = network.WLAN(network.AP_IF)
     ap.config(hostname="alarm") # failed attempt at mDNS... no mDNS support in AP mode.
     ap.config(ssid='PandaAlarm', security=0, channel=11) # hire me crowdstrike
@@ -22,218 +50,584 @@ def ap_setup():
         time.sleep(1)
     debug_print("Connected! ip =", ap.ifconfig()[0])
 
-def serve_file(path, multifunction_clock): # serve webpage from flash fs, pass in the clock object that was previously setup.
-    if path == "/" or path == "/on?" or path == "/off?":
-        path = "/INDEX.html"
-        with open("web/INDEX.html", "r") as file:
-            html = file.read()
-        if state is not None:
-            html = html.format(
-                time=multifunction_clock.get_time(),
-                alarmChecked="checked" if multifunction_clock.alarm_enabled else "",
-                alarm=multifunction_clock.format_time(multifunction_clock.original_alarm_hour, multifunction_clock.original_alarm_minute)
-            )
-        return html, "text/html"
-    else:
+# static files are indexed once at startup and streamed from flash per request, path -> StaticAsset
+WEB_ROOT = "web"
+CONTENT_TYPES = {"html": "text/html", "css": "text/css", "js": "application/javascript"}
+INDEX_PATHS = ("/", "/on", "/off")
+HEAD_BUF_SIZE = 512  # status line + headers, built in one buffer per connection
+CHUNK_SIZE = 512  # file bodies go out this many bytes at a time
+assets = {}
+
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def http_date(seconds): # format a timestamp as an HTTP date, e.g. Tue, 15 Nov 1994 08:12:31 GMT
+    year, month, day, hour, minute, second, weekday = time.gmtime(seconds)[:7]
+    return "{}, {:02d} {} {} {:02d}:{:02d}:{:02d} GMT".format(DAY_NAMES[weekday], day, MONTH_NAMES[month - 1], year, hour, minute, second)
+
+def gzip_file(src, dst, chunk): # compress src into dst a chunk at a time, False (and no dst left behind) where that fails
+    import os
+    try:
+        import gzip # plain python
+        out = gzip.open(dst, "wb")
+    except ImportError:
         try:
-            with open("web/" + path[1:], "r") as file:  # remove leading /
-                content = file.read()
-            if path.endswith(".css"):
-                return content, "text/css"
-            elif path.endswith(".js"):
-                content = content.replace("{time}", multifunction_clock.get_time())
-                return content, "application/javascript"
-            else:
-                return content, "text/plain"
-        except:
-            return "404 Not Found", "text/plain"
-
-def open_socket(): # allows devices to send and receive information
-    address = socket.getaddrinfo("0.0.0.0", 80)[0][-1]
-    s = socket.socket()
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # allow reusing the address immediately after soft-reboot
+            import deflate # micropython 1.21+, stock rp2 builds can only decompress
+        except ImportError:
+            return False
+        out = None
+    raw = None
     try:
-        s.bind(address)
-    except OSError as e:
-        # if port still in use, close and retry bind once
-        if getattr(e, "args", [None])[0] == 98:
-            s.close()
-            s = socket.socket()
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind(address)
+        if out is None:
+            raw = open(dst, "wb")
+            out = deflate.DeflateIO(raw, deflate.GZIP)
+        with open(src, "rb") as file:
+            while True:
+                n = file.readinto(chunk)
+                if not n:
+                    break
+                out.write(memoryview(chunk)[:n]) # AttributeError where DeflateIO has no write
+        out.close()
+        return True
+    except Exception as e: # whatever the compressor throws, a half written .gz must not be served next boot
+        debug_print("gzip of", src, "failed:", e)
+        for f in (out, raw):
+            try:
+                if f is not None:
+                    f.close()
+            except Exception:
+                pass
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+class StaticAsset: # what we need to answer a request for one file, without holding its body in RAM
+    def __init__(self, filename, size, content_type, etag, modified):
+        self.filename = filename
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.modified = modified
+        self.gz_filename = None
+        self.gz_size = 0
+        self.gz_etag = etag[:-1] + '-gz"' # the gzip copy is different bytes, so it gets its own validator
+        self.cache_headers = "ETag: {}\r\nLast-Modified: {}\r\nCache-Control: no-cache\r\n".format(etag, modified).encode()
+        self.gz_headers = "ETag: {}\r\nLast-Modified: {}\r\nCache-Control: no-cache\r\nContent-Encoding: gzip\r\nVary: Accept-Encoding\r\n".format(
+            self.gz_etag, modified).encode()
+
+def load_assets(root=WEB_ROOT, compress=True): # index every file under web/ once, keeping a gzip copy on flash where it saves space
+    import os
+    import binascii
+    assets.clear()
+    chunk = bytearray(CHUNK_SIZE)
+    for name in os.listdir(root):
+        if name.endswith(".gz"):
+            continue
+        filename = root + "/" + name
+        stat = os.stat(filename)
+        crc = 0
+        with open(filename, "rb") as file: # etag from a crc of the contents, read a chunk at a time
+            while True:
+                n = file.readinto(chunk)
+                if not n:
+                    break
+                crc = binascii.crc32(memoryview(chunk)[:n], crc)
+        asset = StaticAsset(filename, stat[6], CONTENT_TYPES.get(name.rsplit(".", 1)[-1], "text/plain"),
+                            '"{:08x}"'.format(crc & 0xffffffff), http_date(stat[8]))
+        gz_filename = filename + ".gz"
+        try: # a precompressed copy on flash wins unless the original is newer
+            gz_stat = os.stat(gz_filename)
+            fresh = gz_stat[6] > 0 and gz_stat[8] >= stat[8] # an empty one is left over from a failed compress
+        except OSError:
+            fresh = False
+        if not fresh and compress:
+            fresh = gzip_file(filename, gz_filename, chunk)
+        if fresh:
+            gz_size = os.stat(gz_filename)[6]
+            if gz_size < asset.size:
+                asset.gz_filename = gz_filename
+                asset.gz_size = gz_size
+        assets["/" + name] = asset
+    debug_print("Indexed", len(assets), "assets")
+
+class FileBody: # response body streamed from flash
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+
+def serve_file(path, headers): # serve a static file, path without its query string, honours If-None-Match/If-Modified-Since and gzip
+    if path in INDEX_PATHS:
+        path = "/INDEX.html"
+    asset = assets.get(path)
+    if asset is None:
+        return "404 Not Found", "text/plain", "404 Not Found", None
+    if asset.gz_filename is not None and "gzip" in headers.get("accept-encoding", ""):
+        etag, body, extra_headers = asset.gz_etag, FileBody(asset.gz_filename, asset.gz_size), asset.gz_headers
+    else:
+        etag, body, extra_headers = asset.etag, FileBody(asset.filename, asset.size), asset.cache_headers
+    if headers.get("if-none-match") == etag or ("if-none-match" not in headers and headers.get("if-modified-since") == asset.modified):
+        return "304 Not Modified", None, b"", extra_headers
+    return "200 OK", asset.content_type, body, extra_headers
+
+# query strings, parsed once per request and shared by every handler
+HEX_DIGITS = "0123456789abcdef"
+
+def unquote(text): # decode %XX escapes and + as space, bad escapes are kept as they are
+    if "%" not in text and "+" not in text:
+        return text
+    text = text.replace("+", " ")
+    if "%" not in text:
+        return text
+    parts = text.split("%")
+    out = [parts[0]]
+    for part in parts[1:]:
+        hi = HEX_DIGITS.find(part[:1].lower())
+        lo = HEX_DIGITS.find(part[1:2].lower())
+        if hi < 0 or lo < 0 or len(part) < 2:
+            out.append("%" + part)
         else:
-            raise
-    s.listen(3) # listen for any incoming connections. 3 connections in queue??
-    
-    return(s)
+            out.append(chr((hi << 4) | lo) + part[2:])
+    return "".join(out)
+
+def parse_query(query_string): # "a=1&b=two" -> {"a": "1", "b": "two"}, a pair without = maps to ""
+    query = {}
+    if not query_string:
+        return query
+    for pair in query_string.split("&"):
+        if not pair:
+            continue
+        key, _, value = pair.partition("=")
+        query[unquote(key)] = unquote(value)
+    return query
 
-def handle_set_time(path, multifunction_clock):
-    # grab current time on the rtc
-    current = list(multifunction_clock.rtc.datetime())
+def query_int(query, key, default=None): # int value of a query parameter, default if missing or not a number
     try:
-        # clean up URL path and make hashmap
-        params = path.split("?")[1]
-        parts = params.split("&")
-        query = {kv.split("=")[0]: kv.split("=")[1] for kv in parts}
-        
-        h = int(query["h"])
-        m = int(query["m"])
-        s = int(query["s"])
-                
-        # replace hours, minutes, seconds on the rtc
-        current[4] = h
-        current[5] = m
-        current[6] = s
-        
-        multifunction_clock.rtc.datetime(current)
-        debug_print("Time updated to:", multifunction_clock.get_time())
-    except Exception as e:
-        debug_print("Failed to update time:", e)
-    
-def handle_set_alarm(path, multifunction_clock):
+        return int(query[key])
+    except (KeyError, ValueError):
+        return default
+
+def query_float(query, key, default=None):
     try:
-        params = path.split("?")[1]
-        parts = params.split("&");
-        query = {kv.split("=")[0]: kv.split("=")[1] for kv in parts}
-        
-        mode = query.get("mode", "alarm")
+        return float(query[key])
+    except (KeyError, ValueError):
+        return default
 
-        h = int(query["h"]) # cache hours cuz we use twice 
-        m = int(query["m"])
+# routes, path -> handler(query, headers, multifunction_clock) returning (status, content type, body, extra header lines)
+routes = {}
 
-        multifunction_clock.original_alarm_hour = h
-        multifunction_clock.original_alarm_minute = m
-        multifunction_clock.alarm_hour = h
-        multifunction_clock.alarm_minute = m
-        multifunction_clock.alarm_enabled = True
+def route(path): # decorator, registers a handler without touching the server loop
+    def register(handler):
+        routes[path] = handler
+        return handler
+    return register
 
-    except Exception as e:
-        debug_print("Failed to update alarm", e)
+def redirect(location):
+    return "303 See Other", None, "", "Location: {}\r\n".format(location)
 
-def start_web_app(multifunction_clock):
-    ap_setup()
-    sock = open_socket()
+def json_response(data):
+    return "200 OK", "application/json", ujson.dumps(data), None
+
+OK = ("200 OK", None, "", None)
+BAD_REQUEST = ("400 Bad Request", None, "", None)
+
+def handle_request(path, headers, multifunction_clock): # work out the response for one request
+    path, _, query_string = path.partition("?")
+    handler = routes.get(path)
+    if handler is None:
+        return serve_file(path, headers)
     try:
+        return handler(parse_query(query_string), headers, multifunction_clock)
+    except Exception as e: # a broken handler shouldn't take the connection down with it
+        print("Handler for", path, "failed:", e)
+        return "500 Internal Server Error", None, "", None
+
+@route("/toggle_format") # use 12hr time
+def handle_toggle_format(query, headers, multifunction_clock):
+    multifunction_clock.format_24h = not multifunction_clock.format_24h
+    return redirect("/")
+
+@route("/set_time") # set clock time
+def handle_set_time(query, headers, multifunction_clock):
+    h = query_int(query, "h")
+    m = query_int(query, "m")
+    s = query_int(query, "s", 0)
+    if h is None or m is None:
+        debug_print("Failed to update time:", query)
+        return redirect("/#TIME")
+    if not 0 <= h < 24 or not 0 <= m < 60 or not 0 <= s < 60: # would go straight into the DS3231 registers
+        return BAD_REQUEST
+    multifunction_clock.set_time(h, m, s)
+    debug_print("Time updated to:", multifunction_clock.get_time())
+    return redirect("/#TIME")
+
+@route("/set_alarm") # set alarm time
+def handle_set_alarm(query, headers, multifunction_clock):
+    h = query_int(query, "h")
+    m = query_int(query, "m")
+    if h is None or m is None:
+        debug_print("Failed to update alarm", query)
+        return redirect("/#ALARM")
+    set_first_alarm(multifunction_clock, hour=h % 24, minute=m % 60, enabled=True)
+    return redirect("/#ALARM")
+
+@route("/alarm_enabled") # enable alarm
+def handle_alarm_enabled(query, headers, multifunction_clock):
+    set_first_alarm(multifunction_clock, enabled=True)
+    return redirect("/#ALARM")
+
+@route("/alarm_disabled") # disable alarm
+def handle_alarm_disabled(query, headers, multifunction_clock):
+    set_first_alarm(multifunction_clock, enabled=False)
+    return redirect("/#ALARM")
+
+def set_first_alarm(multifunction_clock, hour=None, minute=None, enabled=None): # the front panel alarm, what the page's alarm form and toggle edit
+    alarm = multifunction_clock.alarms.first()
+    if hour is not None:
+        alarm.hour = hour
+        alarm.minute = minute
+    alarm.enabled = enabled
+    multifunction_clock.alarms.changed(alarm)
+    multifunction_clock.save_alarms()
+
+@route("/alarms") # every alarm, in the order they were added
+def handle_alarms(query, headers, multifunction_clock):
+    scheduler = multifunction_clock.alarms
+    return json_response({"alarms": scheduler.to_list(), "next": scheduler.next_at(), "version": scheduler.version})
+
+@route("/alarm_add") # h, m, optional days (weekday bitmask, bit 0 monday), once, freq (MHz), vol
+def handle_alarm_add(query, headers, multifunction_clock):
+    h = query_int(query, "h")
+    m = query_int(query, "m")
+    days = query_int(query, "days") # None is every day
+    vol = query_int(query, "vol")
+    freq = query_float(query, "freq")
+    if h is None or m is None or not 0 <= h < 24 or not 0 <= m < 60 or (days is not None and not days & 0x7F):
+        return BAD_REQUEST
+    # same limits as the page's form, a station off the band would only fail when the alarm goes off
+    radio = multifunction_clock.radio
+    if vol is not None and not 0 <= vol <= VOLUME_MAX:
+        return BAD_REQUEST
+    if freq is not None and radio is not None and not radio.start_frequency_MHz <= freq <= radio.end_frequency_MHz:
+        return BAD_REQUEST
+    alarm = multifunction_clock.alarms.add(h, m, days, query_int(query, "once", 0) != 0, freq, vol)
+    multifunction_clock.save_alarms()
+    return json_response(alarm.to_dict())
+
+@route("/alarm_delete") # id from /alarms
+def handle_alarm_delete(query, headers, multifunction_clock):
+    i = query_int(query, "id")
+    if i is None or not multifunction_clock.alarms.remove(i):
+        return BAD_REQUEST
+    multifunction_clock.save_alarms()
+    return OK
+
+@route("/get_settings") # send settings to browser, straight from the clock's per-tick snapshot so it costs no bus traffic
+def handle_get_settings(query, headers, multifunction_clock):
+    version = multifunction_clock.state_version
+    etag = '"v{}"'.format(version)
+    if headers.get("if-none-match") == etag or query_int(query, "v") == version:
+        return "304 Not Modified", None, b"", "ETag: {}\r\n".format(etag)
+    return "200 OK", "application/json", multifunction_clock.state_json, "ETag: {}\r\nCache-Control: no-cache\r\n".format(etag)
+
+@route("/bus_profile") # I2C/SPI traffic of the last tick and since boot, when main.py has BUS_PROFILE on
+def handle_bus_profile(query, headers, multifunction_clock):
+    profiler = multifunction_clock.bus_profiler
+    if profiler is None:
+        return json_response({"enabled": False})
+    if "reset" in query:
+        profiler.reset()
+    summary = profiler.summary()
+    summary["enabled"] = True
+    return json_response(summary)
+
+@route("/metrics") # tick durations, jitter and overruns in the Prometheus text format
+def handle_metrics(query, headers, multifunction_clock):
+    out = []
+    multifunction_clock.tick_monitor.render(out)
+    events = multifunction_clock.events
+    out.append("# HELP clock_event_queue_depth Events waiting for the main loop.")
+    out.append("# TYPE clock_event_queue_depth gauge")
+    out.append("clock_event_queue_depth {}".format(len(events)))
+    out.append("# HELP clock_event_queue_dropped_total Events dropped because the queue was full.")
+    out.append("# TYPE clock_event_queue_dropped_total counter")
+    out.append("clock_event_queue_dropped_total {}".format(events.dropped))
+    out.append("")
+    return "200 OK", "text/plain; version=0.0.4", "\n".join(out), None
+
+@route("/set_mode") # switch between TIME, RADIO, ALARM modes
+def handle_set_mode(query, headers, multifunction_clock):
+    mode = query.get("mode", "").upper()
+    if mode not in ["TIME", "ALARM", "RADIO"] or (mode == "RADIO" and multifunction_clock.radio is None):
+        return BAD_REQUEST
+    multifunction_clock.set_mode(mode) # same as the mode button, leaving RADIO stops a seek or scan
+    debug_print("Set display mode to:", mode)
+    return OK
+
+@route("/radio_seek_up") # radio tuning: seek up/down
+def handle_radio_seek_up(query, headers, multifunction_clock):
+    multifunction_clock.start_seek(True) # returns straight away, the clock tick finishes the seek
+    return redirect("/#RADIO")
+
+@route("/radio_seek_down")
+def handle_radio_seek_down(query, headers, multifunction_clock):
+    multifunction_clock.start_seek(False)
+    return redirect("/#RADIO")
+
+@route("/radio_scan") # index the whole band in the background
+def handle_radio_scan(query, headers, multifunction_clock):
+    multifunction_clock.start_scan()
+    return redirect("/#RADIO")
+
+@route("/radio_station") # jump to a scanned station
+def handle_radio_station(query, headers, multifunction_clock):
+    radio = multifunction_clock.radio
+    i = query_int(query, "i")
+    if radio is None or i is None or not 0 <= i < radio.stations.count:
+        return BAD_REQUEST
+    radio.station_index = i - 1
+    radio.next_station(True)
+    multifunction_clock.radio_status()
+    return OK
+
+@route("/stations") # station table from the last scan
+def handle_stations(query, headers, multifunction_clock):
+    radio = multifunction_clock.radio
+    stations = []
+    scanning = False
+    progress = 0
+    if radio is not None:
+        table = radio.stations
+        for i in range(table.count):
+            stations.append({
+                "freq": radio.frequency_of(table.channels[i]),
+                "rssi": table.rssi[i],
+                "stereo": bool(table.flags[i] & table.FLG_STEREO),
+                "name": table.name(i)
+            })
+        scanning = radio.scanning
+        progress = radio.scan_progress() if scanning else 100
+    return json_response({"scanning": scanning, "progress": progress, "stations": stations})
+
+@route("/radio_vol_up") # radio volume controls: volume up/down
+def handle_radio_vol_up(query, headers, multifunction_clock):
+    multifunction_clock.update_radio(vol= max(0, min(VOLUME_MAX, multifunction_clock.radio.get_volume() + 1)))
+    return redirect("/#RADIO")
+
+@route("/radio_vol_down")
+def handle_radio_vol_down(query, headers, multifunction_clock):
+    multifunction_clock.update_radio(vol= max(0, min(VOLUME_MAX, multifunction_clock.radio.get_volume() - 1)))
+    return redirect("/#RADIO")
+
+class EventHub: # fans clock state changes out to every open /events stream, serialised once per change
+    def __init__(self):
+        self.version = 0
+        self.message = b""
+        self.changed = asyncio.Event()
+
+    def publish(self, changes):
+        self.message = "data: {}\n\n".format(ujson.dumps(changes)).encode()
+        self.version += 1
+        changed = self.changed
+        self.changed = asyncio.Event() # waiters on the old event wake up, new ones wait for the next change
+        changed.set()
+
+events = EventHub()
+
+class EventStream: # response body for a server-sent events connection
+    pass
+
+@route("/events") # push channel, state deltas as server-sent events
+def handle_events(query, headers, multifunction_clock):
+    return "200 OK", "text/event-stream", EventStream(), b"Cache-Control: no-cache\r\n"
+
+class ResponseWriter: # one per connection, headers are built in a fixed buffer and bodies streamed through a fixed chunk
+    def __init__(self, writer):
+        self.writer = writer
+        self.head = bytearray(HEAD_BUF_SIZE)
+        self.head_view = memoryview(self.head)
+        self.head_len = 0
+        self.chunk = bytearray(CHUNK_SIZE)
+        self.chunk_view = memoryview(self.chunk)
+
+    def add(self, data): # append to the header buffer, flushing it first if it would overflow
+        if isinstance(data, str):
+            data = data.encode()
+        n = len(data)
+        if self.head_len + n > HEAD_BUF_SIZE:
+            self.writer.write(self.head_view[:self.head_len])
+            self.head_len = 0
+            if n > HEAD_BUF_SIZE:
+                self.writer.write(data)
+                return
+        self.head[self.head_len:self.head_len + n] = data
+        self.head_len += n
+
+    async def send(self, status, content_type, body, extra_headers, keep_alive, multifunction_clock=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        length = body.size if isinstance(body, FileBody) else 0 if isinstance(body, EventStream) else len(body)
+        self.head_len = 0
+        self.add(b"HTTP/1.1 ")
+        self.add(status)
+        self.add(b"\r\nConnection: keep-alive\r\n" if keep_alive else b"\r\nConnection: close\r\n")
+        if not status.startswith("304") and not isinstance(body, EventStream): # a 304 has no body, and its length would describe the cached one
+            self.add(b"Content-Length: ")
+            self.add(str(length))
+            self.add(b"\r\n")
+        if content_type:
+            self.add(b"Content-Type: ")
+            self.add(content_type)
+            self.add(b"\r\n")
+        if extra_headers:
+            self.add(extra_headers)
+        self.add(b"\r\n")
+        self.writer.write(self.head_view[:self.head_len])
+        if isinstance(body, FileBody):
+            await self.writer.drain()
+            await self.send_file(body.filename)
+        elif isinstance(body, EventStream):
+            await self.writer.drain()
+            await self.send_events(multifunction_clock)
+        else:
+            if body:
+                self.writer.write(body)
+            await self.writer.drain()
+
+    def write_state(self, multifunction_clock): # the whole state as one event, from the pre-serialised snapshot
+        self.writer.write(b"data: ")
+        self.writer.write(multifunction_clock.state_json)
+        self.writer.write(b"\n\n")
+
+    async def send_events(self, multifunction_clock): # runs until the client goes away
+        # start with everything, then only the changes. a client that missed a change gets everything again.
+        seen = events.version
+        self.write_state(multifunction_clock)
+        await self.writer.drain()
         while True:
-            client = sock.accept()[0] # wait for a connection
-            request = client.recv(1024) # get data
-            request = str(request) #store data as string
+            changed = events.changed
             try:
-                path = request.split()[1]
-            except IndexError:
-                path = "/"
-                
-            debug_print("Client requested:", path)
-
-            if path.startswith("/toggle_format"): # use 12hr time
-                multifunction_clock.format_24h = not multifunction_clock.format_24h
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /\r\n")
-                client.send("\r\n")
-                client.close()
-                
-            
-            elif path.startswith("/set_time"): # set clock time
-                handle_set_time(path, multifunction_clock)
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#TIME\r\n")
-                client.send("\r\n")
-                client.close()
-            
-            
-            elif path.startswith("/set_alarm"): # set alarm time
-                handle_set_alarm(path, multifunction_clock)
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#ALARM\r\n")
-                client.send("\r\n")
-                client.close()
-                
-            
-            elif path.startswith("/alarm_enabled"): # enable alarm
-                multifunction_clock.alarm_enabled = True
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#ALARM\r\n")
-                client.send("\r\n")
-                client.close()
-            
-            
-            elif path.startswith("/alarm_disabled"): # disable alarm
-                multifunction_clock.alarm_enabled = False
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#ALARM\r\n")
-                client.send("\r\n")
-                client.close()
-            
-            # send settings to browser
-            elif path.startswith("/get_settings"):
-                settings = {
-                    "time": multifunction_clock.get_time(),
-                    "format_24h": multifunction_clock.format_24h,
-                    "alarm_hour": multifunction_clock.alarm_hour,
-                    "alarm_minute": multifunction_clock.alarm_minute,
-                    "alarm_toggle": multifunction_clock.alarm_enabled,
-                    "radio_frequency": multifunction_clock.radio.get_frequency_MHz(),
-                    "radio_volume": multifunction_clock.radio.get_volume()
-                }
-                response_body = ujson.dumps(settings)
-                client.send("HTTP/1.1 200 OK\r\n")
-                client.send("Content-Type: application/json\r\n\r\n")
-                client.send(response_body)
-                client.close()
-            
-            # switch between TIME, RADIO, ALARM modes
-            elif path.startswith("/set_mode"):
-                try:
-                    params = path.split("?")[1]
-                    parts = params.split("&")
-                    query = {kv.split("=")[0]: kv.split("=")[1] for kv in parts}
-                    mode = query.get("mode", "").upper()
-                    if mode in ["TIME", "ALARM", "RADIO"]:
-                        multifunction_clock.mode = mode
-                        if multifunction_clock.mode == "RADIO":
-                            multifunction_clock.update_radio(mute=False)
-                        else:
-                            multifunction_clock.update_radio(mute=True)
-                        debug_print("Set display mode to:", mode)
-                        client.send("HTTP/1.1 200 OK\r\n\r\n")
-                    else:
-                        client.send("HTTP/1.1 400 Bad Request\r\n\r\n")
-                except Exception as e:
-                    debug_print("Error setting mode:", e)
-                    client.send("HTTP/1.1 400 Bad Request\r\n\r\n")
-                client.close()
-            elif path.startswith("/radio_seek_up"): # radio tuning: seek up/down
-                multifunction_clock.radio.seek_up()
-                multifunction_clock.radio_status()
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#RADIO\r\n")
-                client.send("\r\n")
-                client.close()
-            elif path.startswith("/radio_seek_down"):
-                multifunction_clock.radio.seek_down()
-                multifunction_clock.radio_status()
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#RADIO\r\n")
-                client.send("\r\n")
-                client.close()
-            elif path.startswith("/radio_vol_up"):# radio volume controls: volume up/down
-                multifunction_clock.update_radio(vol= max(0, min(VOLUME_MAX, multifunction_clock.radio.get_volume() + 1)))
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#RADIO\r\n")
-                client.send("\r\n")
-                client.close()
-            elif path.startswith("/radio_vol_down"):
-                multifunction_clock.update_radio(vol= max(0, min(VOLUME_MAX, multifunction_clock.radio.get_volume() - 1)))
-                client.send("HTTP/1.1 303 See Other\r\n")
-                client.send("Location: /#RADIO\r\n")
-                client.send("\r\n")
-                client.close()
+                await asyncio.wait_for(changed.wait(), EVENT_KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                self.writer.write(b": keepalive\n\n")
+                await self.writer.drain()
+                continue
+            if events.version == seen + 1:
+                self.writer.write(events.message)
             else:
-                response_body, content_type = serve_file(path, multifunction_clock)
-                client.send("HTTP/1.1 200 OK\r\n")
-                client.send("Content-Type: {}\r\n\r\n".format(content_type))
-                client.sendall(response_body.encode("utf-8"))
-                client.close()
-    except OSError as e:
+                self.write_state(multifunction_clock)
+            seen = events.version
+            await self.writer.drain()
+
+    async def send_file(self, filename): # stream a file from flash, memory use doesn't depend on its size
+        with open(filename, "rb") as file:
+            while True:
+                n = file.readinto(self.chunk)
+                if not n:
+                    break
+                self.writer.write(self.chunk_view[:n])
+                await self.writer.drain() # the chunk is reused, so it has to be on the wire first
+
+async def read_line(reader, timeout):
+    return await asyncio.wait_for(reader.readline(), timeout)
+
+async def serve_client(reader, writer, multifunction_clock): # one connection, possibly several requests with keep-alive
+    global active_clients, event_streams
+    if active_clients >= MAX_CLIENTS:
+        try:
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        except OSError:
+            pass
+        writer.close()
+        return
+    active_clients += 1
+    streaming = False # the connection moved from active_clients to event_streams
+    out = ResponseWriter(writer)
+    try:
+        while True:
+            request_line = await read_line(reader, STREAM_IDLE_TIMEOUT_S if event_streams else IDLE_TIMEOUT_S)
+            if not request_line:
+                break # client hung up
+            parts = request_line.decode().split()
+            if len(parts) != 3:
+                await out.send("400 Bad Request", None, "", None, False)
+                break
+            method, path, version = parts
+            # headers arrive one line at a time, however they were split across packets
+            headers = {}
+            while True:
+                line = await read_line(reader, READ_TIMEOUT_S)
+                if not line or line == b"\r\n" or line == b"\n":
+                    break
+                if len(headers) < MAX_HEADERS:
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0) or 0)
+            if length: # nothing we serve takes a body, but it has to be drained for the next request
+                await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT_S)
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+            debug_print("Client requested:", method, path)
+            status, content_type, body, extra_headers = handle_request(path, headers, multifunction_clock)
+            if isinstance(body, EventStream):
+                keep_alive = False # the stream owns the connection until the client leaves
+                if event_streams >= MAX_EVENT_STREAMS: # the page falls back to polling
+                    status, content_type, body, extra_headers = "503 Service Unavailable", None, "", None
+                else: # give its client slot back, a tab left open shouldn't lock everyone else out
+                    active_clients -= 1
+                    event_streams += 1
+                    streaming = True
+            await out.send(status, content_type, body, extra_headers, keep_alive, multifunction_clock)
+            if not keep_alive:
+                break
+    except asyncio.TimeoutError:
+        debug_print("client timed out")
+    except (OSError, ValueError) as e:
         debug_print("connection terminated: err=" + str(e))
-        client.close()
\ No newline at end of file
+    finally:
+        if streaming:
+            event_streams -= 1
+        else:
+            active_clients -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+async def tick_task(multifunction_clock): # runs what the IRQs queued on the same loop as the server, and the tick when the RTC square wave isn't there
+    next_tick = ticks_ms()
+    queue = multifunction_clock.events
+    while True:
+        late = ticks_diff(ticks_ms(), next_tick)
+        if late >= 0:
+            multifunction_clock.timer_tick() # queues a tick unless the square wave is doing it
+            next_tick = ticks_add(next_tick, TICK_MS)
+            if late >= TICK_MS: # overran, don't try to catch up with a burst of ticks
+                next_tick = ticks_add(ticks_ms(), TICK_MS)
+        if len(queue) or multifunction_clock.redraw_pending:
+            try:
+                multifunction_clock.process_events()
+            except Exception as e:
+                print("Display tick failed:", e)
+            changes = multifunction_clock.take_state_changes()
+            if changes:
+                events.publish(changes)
+        await asyncio.sleep(EVENT_POLL_MS / 1000)
+
+async def serve(multifunction_clock, host="0.0.0.0", port=80):
+    server = await asyncio.start_server(lambda reader, writer: serve_client(reader, writer, multifunction_clock), host, port, backlog=MAX_CLIENTS)
+    debug_print("Listening on port", port)
+    try:
+        await tick_task(multifunction_clock)
+    finally:
+        server.close()
+
+def start_web_app(multifunction_clock, port=None): # starts the access point and runs the server and display tick forever
+    if port is None:
+        port = HTTP_PORT
+    load_assets()
+    ap_setup()
+    asyncio.run(serve(multifunction_clock, port=port))